@@ -395,6 +395,9 @@ def launch_ui() -> None:
     sys.exit(stcli.main())
 
 class CliOptions:
+    bulk_kind: Optional[str] = None  # catalog name on /api/lattice/bulk, None when bulk is unsupported
+    search_kind: Optional[str] = None  # catalog name on /api/lattice/search, None when search is unsupported
+
     def __init__(self, ext: str) -> None:
         self.url = data.get("url", DEFAULT_BASE_URL)
         self.api_key = data.get("api_key", None)
@@ -474,12 +477,95 @@ class CliOptions:
         except Exception as e:
             logger.exception("Error clearing resource: %s", e)
 
+    def _bulk_endpoint(self) -> str:
+        return urljoin(self.url.rstrip("/") + "/", f"api/lattice/bulk/{self.bulk_kind}")
+
+    def export(self, output: Optional[str] = None) -> None:
+        """
+        Stream every record as NDJSON to the output file, or stdout when no file is given.
+        """
+        if not self.bulk_kind:
+            logger.error("Export is not supported for this resource")
+            return
+        try:
+            with self.session.get(self._bulk_endpoint(), stream=True, timeout=self.session.request_timeout) as response:
+                response.raise_for_status()
+                target = open(output, "w", encoding="utf-8") if output else sys.stdout
+                count = 0
+                try:
+                    for line in response.iter_lines():
+                        if line:
+                            target.write(line.decode("utf-8") + "\n")
+                            count += 1
+                finally:
+                    if output:
+                        target.close()
+            if output:
+                logger.info("Exported %d %s to %s", count, self.bulk_kind, output)
+        except Exception as e:
+            logger.exception("Error exporting %s: %s", self.bulk_kind, e)
+
+    def import_file(self, path: str, on_conflict: str = "error", atomic: bool = False) -> None:
+        """
+        Upload an NDJSON file, one record per line, and print the per-row report.
+        """
+        if not self.bulk_kind:
+            logger.error("Import is not supported for this resource")
+            return
+        # a streamed file body cannot be replayed, so this request must not be retried
+        session = make_session(self.api_key, retries=0)
+        try:
+            with open(path, "rb") as f:
+                response = session.post(
+                    self._bulk_endpoint(),
+                    params={"on_conflict": on_conflict, "atomic": str(atomic).lower()},
+                    data=f,
+                    headers={"Content-Type": "application/x-ndjson"},
+                    timeout=session.request_timeout,
+                )
+            response.raise_for_status()
+            report = response.json()
+            logger.info("%s: %d received, %d written, %d skipped, %d failed",
+                        self.bulk_kind, report["received"], report["written"], report["skipped"], report["failed"])
+            if report["errors"]:
+                table = Table("Line", "ID", "Error", title="Rejected rows", show_header=True, header_style="bold magenta", border_style="cyan")
+                for err in report["errors"]:
+                    table.add_row(str(err["line"]), str(err.get("id") or ""), err["error"])
+                console.print(table)
+        except Exception as e:
+            logger.exception("Error importing %s: %s", self.bulk_kind, e)
+
+    def search(self, query: str, limit: int = 20) -> None:
+        """
+        Ranked full text search on the server, only ids and snippets come back.
+        """
+        if not self.search_kind:
+            logger.error("Search is not supported for this resource")
+            return
+        endpoint = urljoin(self.url.rstrip("/") + "/", f"api/lattice/search/{self.search_kind}")
+        try:
+            response = self.session.get(endpoint, params={"q": query, "limit": limit}, timeout=self.session.request_timeout)
+            response.raise_for_status()
+            results = response.json()["results"]
+            if not results:
+                console.print("[yellow]No matches[/yellow]")
+                return
+            table = Table("ID", "Score", "Match", show_header=True, header_style="bold magenta", border_style="cyan")
+            for item in results:
+                table.add_row(str(item["id"]), f'{item["score"]:.2f}', item.get("snippet") or "")
+            console.print(table)
+        except Exception as e:
+            logger.exception("Error searching %s: %s", self.search_kind, e)
+
 class LatticeAgent(BaseModel):
     id: str
     prompt: Optional[str]  = None
     tools:  List[Dict[str, Any]] = Field(..., description="List of tool function definitions.")
 
 class AgentsCliOptions(CliOptions):
+    bulk_kind = "agents"
+    search_kind = "agents"
+
     def __init__(self):
         super().__init__("/api/lattice/agents")
 
@@ -586,10 +672,15 @@ class AgentsCliOptions(CliOptions):
             logger.exception("Error updating agent: %s", e)
 
 class ConnCliOptions(CliOptions):
+    bulk_kind = "connections"
+
     def __init__(self):
         super().__init__("/api/lattice/connections")
 
 class PromptsCliOptions(CliOptions):
+    bulk_kind = "prompts"
+    search_kind = "prompts"
+
     def __init__(self):
         super().__init__("/api/lattice/prompts")
 
@@ -605,6 +696,8 @@ class MCPCliOptions(CliOptions):
 
 
 class LatticeToolServer(CliOptions):
+    bulk_kind = "toolservers"
+
     def __init__(self):
         super().__init__("/api/lattice/toolserver")
 
@@ -628,6 +721,8 @@ class LatticeToolServer(CliOptions):
 
 
 class ToolsData(CliOptions):
+    search_kind = "tools"
+
     def __init__(self):
         super().__init__("/api/lattice/tools")
 
@@ -916,6 +1011,26 @@ def bind_standard_commands(tgt_app: typer.Typer, cls) -> None:
     def clear_cmd():
         cls().clear()
 
+def bind_bulk_commands(tgt_app: typer.Typer, cls) -> None:
+    @tgt_app.command("export", help="Export all records as NDJSON")
+    def export_cmd(output: Optional[str] = typer.Option(None, "--output", "-o", help="File to write, stdout when omitted")):
+        cls().export(output)
+    @tgt_app.command("import", help="Import records from an NDJSON file")
+    def import_cmd(
+        path: str = typer.Argument(..., help="NDJSON file, one record per line"),
+        on_conflict: str = typer.Option("error", "--on-conflict", help="error, skip or replace existing ids"),
+        atomic: bool = typer.Option(False, "--atomic", help="write nothing if any row is rejected"),
+    ):
+        cls().import_file(path, on_conflict, atomic)
+
+def bind_search_commands(tgt_app: typer.Typer, cls) -> None:
+    @tgt_app.command("search", help="Full text search, best matches first")
+    def search_cmd(
+        query: str = typer.Argument(..., help="Words to look for, the last one may be a prefix"),
+        limit: int = typer.Option(20, "--limit", "-n", help="Maximum number of matches"),
+    ):
+        cls().search(query, limit)
+
 bind_standard_commands(connections_app, ConnCliOptions)
 bind_standard_commands(prompts_app, PromptsCliOptions)
 bind_standard_commands(toolserver_app, LatticeToolServer)
@@ -923,6 +1038,13 @@ bind_standard_commands(mcp_app, MCPCliOptions)
 bind_standard_commands(models_app, ModelOptions)
 bind_standard_commands(rag_app, RAGCliOptions)
 bind_standard_commands(agents_app, AgentsCliOptions)
+bind_bulk_commands(agents_app, AgentsCliOptions)
+bind_bulk_commands(connections_app, ConnCliOptions)
+bind_bulk_commands(prompts_app, PromptsCliOptions)
+bind_bulk_commands(toolserver_app, LatticeToolServer)
+bind_search_commands(agents_app, AgentsCliOptions)
+bind_search_commands(prompts_app, PromptsCliOptions)
+bind_search_commands(tools_app, ToolsData)
 
 @agents_app.command("edit")
 def agents_edit():
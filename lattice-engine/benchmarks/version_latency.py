@@ -0,0 +1,98 @@
+"""
+Latency of GET /api/lattice/version while heavy catalog writes run.
+
+Writers keep POSTing prompts and agents through the API while a prober measures
+/api/lattice/version. With database calls on the LocalDatabase executor the probe
+latency stays flat; --inline runs the same database calls on the event loop for
+comparison.
+
+    python benchmarks/version_latency.py
+    python benchmarks/version_latency.py --inline
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def probe(client, stop, samples, interval=0.005):
+    # latency is measured from when the request was due, so time spent waiting for a
+    # blocked event loop counts against the endpoint and is not hidden by a late start
+    due = time.perf_counter()
+    while True:
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        res = await client.get("/api/lattice/version")
+        res.raise_for_status()
+        now = time.perf_counter()
+        samples.append((now - due) * 1000)
+        if stop.is_set():
+            break
+        due = max(due + interval, now)
+
+
+async def writer(client, worker, count):
+    for i in range(count):
+        await client.post("/api/lattice/prompts", json={"id": f"w{worker}-p{i}", "prompt": "x" * 2048})
+        await client.post("/api/lattice/agents", json={"id": f"w{worker}-a{i}", "prompt": f"w{worker}-p{i}", "tools": []})
+
+
+async def run(writers, writes, duration):
+    import httpx
+    from latticepy.engine.services.webserver import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        idle = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, stop, idle))
+        await asyncio.sleep(duration)
+        stop.set()
+        await task
+
+        loaded = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, stop, loaded))
+        start = time.perf_counter()
+        await asyncio.gather(*(writer(client, w, writes) for w in range(writers)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await task
+    return idle, loaded, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--writes", type=int, default=200, help="prompts and agents created per writer")
+    parser.add_argument("--idle", type=float, default=1.0, help="seconds of probing before the writers start")
+    parser.add_argument("--inline", action="store_true", help="run database calls on the event loop")
+    args = parser.parse_args()
+
+    os.environ["LATTICE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="lattice-bench-"), "localdb")
+    from latticepy.engine.services.localdatabase import LocalDatabase, LocalDBModel
+    LocalDatabase(LocalDBModel(name="localdb", url_path=os.path.dirname(os.environ["LATTICE_DB_PATH"]), synchronous="FULL"))
+    from latticepy.engine.services.migrations import migrate
+    migrate()
+    if args.inline:
+        async def inline(fn, *a, **kw):
+            return fn(*a, **kw)
+        LocalDatabase.run = inline
+
+    idle, loaded, elapsed = asyncio.run(run(args.writers, args.writes, args.idle))
+    LocalDatabase.close_all()
+    writes = args.writers * args.writes * 2
+    print(f"mode: {'inline' if args.inline else 'executor'}, {writes} writes in {elapsed:.2f}s")
+    for name, samples in (("idle", idle), ("under writes", loaded)):
+        print(f"{name:>13}: n={len(samples):5d}  p50={statistics.median(samples):7.2f}ms  "
+              f"p99={percentile(samples, 99):7.2f}ms  max={max(samples):7.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import json
 
 from latticepy.engine.services.localdatabase import LocalDatabase
@@ -9,16 +9,7 @@ import logging
 logger = logging.getLogger(__name__)
 #from latticepy.engine.services.toolengine import ToolData
 
-LocalDatabase.create_tables(
-    'latticeagents',
-    {
-        'id': 'TEXT PRIMARY KEY',
-        'prompt': 'TEXT',
-        'tools': 'TEXT',
-        'details': 'TEXT'
-
-    }
-)
+# the latticeagents table is created by services/migrations.py
 
 #should we add memory field also to the agent?
 
@@ -27,31 +18,58 @@ class LatticeAgent(BaseModel):
     prompt: Optional[str]  = None
     tools:  List[Dict[str, Any]] = Field(..., description="List of tool function definitions.")
 
-    def create(self) -> None:
+    def to_record(self) -> Tuple[str, Optional[str], str, str]:
         """
-        Create a new custom model with a unique ID.
+        Row for the latticeagents table: (AGENT_ id, resolved prompt text, tools json, tool details json).
+        A prompt naming an entry of Promptlist is replaced by its text.
         """
         #if self.prompt and self.prompt not in Promptlist.list():
         #    raise ValueError(f"WARNING: prompt object  {self.prompt} not found in Promptlist")
-        prompt_text=Promptlist.get(self.prompt).prompt if self.prompt in Promptlist.list()  else self.prompt
+        prompt_text=Promptlist.get(self.prompt).prompt if self.prompt in Promptlist.listdown() else self.prompt
         name = f"AGENT_{self.id}"
+        tooldetails={}
+        tools=[]
+        #tool_text=json.dumps(toollist)
+        for tool in self.tools:
+            tool=dict(tool)
+            tooldetails[tool['function']['name']]=tool.pop('details', {})
+            tools.append(tool)
+        return name, prompt_text, json.dumps(tools), json.dumps(tooldetails)
+
+    @staticmethod
+    def from_record(record) -> Dict[str, Any]:
+        """
+        Inverse of to_record, gives the payload accepted by create or a bulk import.
+        """
+        details=json.loads(record['details']) if record['details'] else {}
+        tools=json.loads(record['tools']) if record['tools'] else []
+        for tool in tools:
+            name=tool.get('function', {}).get('name')
+            if name in details:
+                tool['details']=details[name]
+        agent_id=record['id']
+        return {
+            'id': agent_id[len('AGENT_'):] if agent_id.startswith('AGENT_') else agent_id,
+            'prompt': record['prompt'],
+            'tools': tools,
+        }
+
+    def create(self) -> None:
+        """
+        Create a new custom model with a unique ID.
+        """
         try:
-            logger.debug(f"{name}, {prompt_text}, {self.tools}")
+            record=self.to_record()
+            logger.debug(f"{record[0]}, {record[1]}, {self.tools}")
             logger.info("adding to agents to database")
-            tooldetails={}
-            #tool_text=json.dumps(toollist)
-            for tool in self.tools:
-                tooldetails[tool['function']['name']]=tool.get('details', {})
-                tool.pop('details', None)
-            tool_text=json.dumps(self.tools)
-            tooldetails=json.dumps(tooldetails)
             conn = LocalDatabase.connect()
             conn.execute(
                 "INSERT INTO latticeagents (id, prompt, tools, details) VALUES (?, ?, ?, ?)",
-                (name, prompt_text, tool_text, tooldetails)
+                record
             )
             conn.connection.commit()
         except Exception as e:
+            LocalDatabase.rollback()
             logger.error(f"Error creating model: {e}")
             raise ValueError("Error creating model: {e}")
         
@@ -105,6 +123,7 @@ class LatticeAgent(BaseModel):
             logger.info(f"Model {model_id} deleted successfully.")
             return True
         except Exception as e:
+            LocalDatabase.rollback()
             logger.error(f"Error deleting model {model_id}: {e}")
             return False
         
@@ -121,6 +140,7 @@ class LatticeAgent(BaseModel):
             logger.info("All custom models cleared successfully.")
             return True
         except Exception as e:
+            LocalDatabase.rollback()
             logger.error(f"Error clearing custom models: {e}")
             return False
         
@@ -143,5 +163,6 @@ class LatticeAgent(BaseModel):
             conn.connection.commit()
             logger.info(f"Agent {agent_id} updated successfully.")
         except Exception as e:
+            LocalDatabase.rollback()
             logger.error(f"Error updating agent {agent_id}: {e}")
             raise ValueError("Error updating agent: {e}")
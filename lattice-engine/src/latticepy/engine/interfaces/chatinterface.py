@@ -1,26 +1,27 @@
 import json
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
 from latticepy.engine.interfaces.clientinterface import LLMmodels
 from latticepy.engine.interfaces.agentinterface import LatticeAgent
-from latticepy.engine.interfaces.llminterface import llmClient
+from latticepy.engine.interfaces.llminterface import ClientPool
 from latticepy.engine.interfaces.serverinterface import callserver
 from latticepy.engine.services.toolengine import ToolLoad
-
-available_models = LLMmodels().listdown()
+from latticepy.engine.services.localdatabase import LocalDatabase
 
 
 class Chatinterface:
-    def __init__(self, message, model, agent):
+    def __init__(self, message, model, agent, history=None):
 
         modelob=LLMmodels()
         self.modelinfo = modelob.get(model)
         self.message = message
         self.agent=agent
+        self.history=history or []
         if self.modelinfo:
-            self.llm=llmClient(**(self.modelinfo.source).model_dump())
+            self.llm=ClientPool.get((self.modelinfo.source).model_dump())
         else:
             return("unable to fetch the response")
         self.depth=3
@@ -29,38 +30,60 @@ class Chatinterface:
         """
         Sends a message to the LLM and returns the response.
         if the model supports tool calls, it will return the tool call information.
+        Blocking wrapper around achat() for callers without an event loop.
+        """
+        return asyncio.run(self.achat())
+
+    async def achat(self):
+        """
+        Async chat: the LLM is awaited over the connection's pooled client, and
+        database reads and tool calls run off the event loop.
         """
         logger.info(f"Chatinterface: modelinfo={self.modelinfo}, message={self.message}, agent={self.agent}")
         if not self.modelinfo or not self.message:
             raise ValueError("Model and message must be provided")
         if self.agent:
             #self.system_prompt = LatticeAgent.get(self.agent)['prompt']
-            return self._tool_chat()
+            return await self._tool_chat()
         else:
-            response =self.llm.chat(self.modelinfo.model, "", self.message)
+            response = await self.llm.achat(self.modelinfo.model, "", self.message, history=self.history)
             return response[0], "", {}
     
-    def _tool_chat(self):
+    async def astream(self):
+        """
+        Yields the reply as text pieces while the LLM generates it.
+        Agents choose and call tools on the complete reply, so their answer arrives as one piece.
+        """
+        if not self.modelinfo or not self.message:
+            raise ValueError("Model and message must be provided")
+        if self.agent:
+            content, _, _ = await self._tool_chat()
+            yield content
+            return
+        async for piece in self.llm.astream(self.modelinfo.model, self.message, history=self.history):
+            yield piece
+
+    async def _tool_chat(self):
         """
         Handles chat with tools.
         This method should implement the logic to call tools based on the model's configuration.
         """
         # Placeholder for tool call logic
         # You would typically check if the model has tools and call them accordingly
-        toolsob=ToolLoad(self.agent)
-        agentdetails=LatticeAgent.get(self.agent)
+        toolsob = await LocalDatabase.run(ToolLoad, self.agent)
+        agentdetails = await LocalDatabase.run(LatticeAgent.get, self.agent)
         logger.debug('fetching prompt')
         prompt= agentdetails['prompt'] or 'You are a helpful assistant.'
         tools= agentdetails['tools'] or None
         tools=json.loads(tools) if tools else None
         logger.debug(f"Using prompt: {prompt}")
         logger.debug(f"Using tools: {[tool['function']['name'] for tool in tools] if tools else 'No tools'}")
-        iresponse = self.llm.chat(self.modelinfo.model, prompt, self.message, tools=tools)
+        iresponse = await self.llm.achat(self.modelinfo.model, prompt, self.message, tools=tools, history=self.history)
         logger.debug(f"Response from LLM: {iresponse}")
-        def final_response(toolresponse):
+        async def final_response(toolresponse):
             #creating various interfaces for final response
             for tool in toolresponse:
-                tresponse =callserver(tool['function']['name'], tool['function']['arguments'])
+                tresponse = await asyncio.to_thread(callserver, tool['function']['name'], tool['function']['arguments'])
                 logger.debug(f'Tool response: {tresponse}')
                 if tresponse.success:
                     tres=tresponse.data
@@ -69,21 +92,21 @@ class Chatinterface:
                 recall_opt=toolsob.getrecall(tool['function']['name'])
                 logger.debug(f"Recall option: {recall_opt}")
                 if recall_opt == 'flow':
-                    response=self.llm.chat(self.modelinfo.model, prompt, self.message, tools=tools)
-                    fresponse=final_response(toolresponse)
+                    response = await self.llm.achat(self.modelinfo.model, prompt, self.message, tools=tools)
+                    fresponse = await final_response(toolresponse)
                     return fresponse, "", {}
                 if recall_opt == 'rephrase':
-                    response=self.llm.chat(self.modelinfo.model, prompt, f'use the data provided precisely answer {tres} in suitable format, data: {self.message}')
+                    response = await self.llm.achat(self.modelinfo.model, prompt, f'use the data provided precisely answer {tres} in suitable format, data: {self.message}')
                     return response[0], "", {}
                 if recall_opt == 'pass':
-                    response=self.llm.chat(self.modelinfo.model, prompt, f'Please find the data as requested {self.message} :{tres}')
+                    response = await self.llm.achat(self.modelinfo.model, prompt, f'Please find the data as requested {self.message} :{tres}')
                     return response[0], "", {}
                 if recall_opt == 'RAG':
                     pass
                 else:
                     return iresponse[0], "", {}
         if iresponse[1] != [{}]:
-            fresponse= final_response(iresponse[1])
+            fresponse = await final_response(iresponse[1])
             return fresponse
         else:
             return iresponse[0], "", {}
\ No newline at end of file
@@ -1,27 +1,21 @@
-from pydantic import BaseModel, Field
-from typing import Dict, Any, Optional, Literal
+from pydantic import BaseModel, Field, field_validator
+from typing import Dict, Any, List, Optional, Literal, Tuple, Union, get_args
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
+import asyncio
+import json
+import time
 
 
-from latticepy.engine.interfaces.llminterface import llmClient
+from latticepy.engine.interfaces.llminterface import ClientPool, provider_registered
 from latticepy.engine.services.localdatabase import LocalDatabase
+from latticepy.engine.services.catalogcache import save_catalog, load_catalog
 
 import logging
 
 logger = logging.getLogger(__name__)
 
-# --- Initialize Local Database ---
-LocalDatabase.create_tables(
-    'connections',
-    {'id': 'TEXT PRIMARY KEY', 'source': 'TEXT', 'url': 'TEXT', 'api_key': 'TEXT'}
-)
-LocalDatabase.create_tables(
-    'prompts',
-    {'id': 'TEXT PRIMARY KEY', 'prompt': 'TEXT'}
-)
-LocalDatabase.create_tables(
-    'vectordb',
-    {'id': 'TEXT PRIMARY KEY', 'db': 'TEXT', 'url': 'TEXT', 'password': 'TEXT', 'tablename': 'TEXT'}   # renamed column
-)
+# tables are created by services/migrations.py when the engine starts
 
 
 # --- Data Models ---
@@ -46,10 +40,17 @@ llmSevers=Literal[
 
 class ConnectionModel(BaseModel):
     id: str
-    source: llmSevers
+    source: Union[llmSevers, str]  # the built in names, or any provider registered in llminterface
     url: str
     api_key: Optional[str]
 
+    @field_validator('source')
+    @classmethod
+    def known_source(cls, value):
+        if value not in get_args(llmSevers) and not provider_registered(value):
+            raise ValueError(f"Unknown source {value}, expected one of {', '.join(get_args(llmSevers))} or a registered provider")
+        return value
+
 class Model(BaseModel):
     name: str
     model: str
@@ -60,6 +61,17 @@ class Model(BaseModel):
 
 class Data:
     data = {}  # mapping id -> object
+    _version = None  # catalog_versions value the current snapshot was loaded at
+    _listing = {}  # cached model_dump() of every object, served by list()
+
+    def __init_subclass__(cls, **kwargs):
+        # every catalog keeps its own snapshot, lock and per-thread change tracking
+        super().__init_subclass__(**kwargs)
+        cls.data = {}
+        cls._version = None
+        cls._listing = {}
+        cls._lock = threading.RLock()
+        cls._seen = threading.local()
 
     @classmethod
     def _get_tablename(cls):
@@ -77,6 +89,69 @@ class Data:
         # Should be overridden in each subclass
         pass
 
+    @classmethod
+    def invalidate(cls):
+        """
+        Drop the in-memory snapshot, the next read reloads it from the database.
+        """
+        cls._version = None
+
+    @classmethod
+    def _current_version(cls, cur) -> Optional[int]:
+        row = cur.execute("SELECT version FROM catalog_versions WHERE name = ?", (cls._get_tablename(),)).fetchone()
+        return row[0] if row else None
+
+    @classmethod
+    def _is_stale(cls, cur) -> bool:
+        if cls._version is None:
+            return True
+        # PRAGMA data_version only moves when some other connection committed, so the common
+        # case costs no table access; the counter then tells whether this table was touched
+        data_version = cur.execute("PRAGMA data_version").fetchone()[0]
+        seen = cls._seen
+        if getattr(seen, "connection", None) is cur.connection and seen.data_version == data_version:
+            return False
+        if cls._current_version(cur) != cls._version:
+            return True
+        # only remember data_version once the snapshot is confirmed current
+        seen.connection, seen.data_version = cur.connection, data_version
+        return False
+
+    @classmethod
+    def _ensure_fresh(cls):
+        cur = LocalDatabase.connect()
+        if not cls._is_stale(cur):
+            return
+        with cls._lock:
+            if not cls._is_stale(cur):
+                return
+            # read the counter before the rows, a write in between only causes one extra reload
+            version = cls._current_version(cur)
+            cls.refresh()
+            cls._listing = {key: value.model_dump() for key, value in cls.data.items()}
+            cls._version = version
+            logger.debug(f"{cls.__name__} snapshot reloaded at version {version}")
+
+    @classmethod
+    def _apply_local_write(cls, cur, key, value=None):
+        """
+        Patch the snapshot after a committed write from this process instead of reloading it.
+        Only safe when the counter moved by exactly our write, otherwise the snapshot is dropped.
+        """
+        with cls._lock:
+            version = cls._current_version(cur)
+            if cls._version is None or version != cls._version + 1:
+                cls._version = None
+                return
+            data, listing = dict(cls.data), dict(cls._listing)
+            if value is None:
+                data.pop(key, None)
+                listing.pop(key, None)
+            else:
+                data[key] = value
+                listing[key] = value.model_dump()
+            cls.data, cls._listing, cls._version = data, listing, version
+
     @classmethod
     def _get_data(cls):
         """
@@ -87,21 +162,21 @@ class Data:
 
     @classmethod
     def listdown(cls):
-        cls.refresh()  # get current data from DB
+        cls._ensure_fresh()  # reload only if the table changed
         return(cls.data.keys())
  
     @classmethod
     def list(cls):
-        cls.refresh()
+        cls._ensure_fresh()
         """
         Returns a list of keys in the data dictionary.
         """ 
 
-        return {key: cls.data[key].model_dump() for key in cls.data.keys()}
+        return dict(cls._listing)
 
     @classmethod
     def get(cls, key) -> Optional[Any]:
-        cls.refresh()
+        cls._ensure_fresh()
         if key in cls.data:
             return cls.data[key]
         logger.warning(f"Data {key} not found.")
@@ -109,7 +184,7 @@ class Data:
 
     @classmethod
     def add(cls, key, value):
-        cls.refresh()
+        cls._ensure_fresh()
         if key in cls.data:
             logger.warning(f"Data {key} already exists.")
             raise ValueError(f"Data {key} already exists.")
@@ -124,10 +199,11 @@ class Data:
             conn.execute(sql, tuple(data_dict.values()))
             conn.connection.commit()
         except Exception as e:
+            LocalDatabase.rollback()
             logger.error(f"Error adding data to database: {e}")
             raise  ValueError(f"Error adding data to database: {e}")
         logger.info(f"Data {key} added to database.")
-        cls.refresh()
+        cls._apply_local_write(conn, key, value)
 
     @classmethod
     def delete(cls, key):
@@ -140,10 +216,11 @@ class Data:
             conn.execute(sql, (key,))
             conn.connection.commit()
         except Exception as e:
+            LocalDatabase.rollback()
             logger.error(f"Error deleting data from database: {e}")
             return
         logger.info(f"Data {key} deleted from database.")
-        cls.refresh()
+        cls._apply_local_write(conn, key)
 
     @classmethod
     def clear(cls):
@@ -154,10 +231,11 @@ class Data:
             conn.execute(sql)
             conn.connection.commit()
         except Exception as e:
+            LocalDatabase.rollback()
             logger.error(f"Error clearing data from database: {e}")
             return
         logger.info("All data cleared from database.")
-        cls.refresh()
+        cls.invalidate()
 
     #def update
 
@@ -181,24 +259,247 @@ class VectorDBlist(Data):
         rows = LocalDatabase.connect().execute("SELECT * FROM vectordb").fetchall()
         cls.data = {record["id"]: VectorDB(**record) for record in rows}
 
+class ModelGroupModel(BaseModel):
+    id: str                   # public model name clients ask for
+    model: str                # model name on each backend, e.g. "llama3.1:8b"
+    connections: List[str]    # connection ids serving it
+    strategy: Literal['least_outstanding', 'power_of_two'] = 'least_outstanding'
+
+class ModelGroups(Data):
+    @classmethod
+    def refresh(cls):
+        rows = LocalDatabase.connect().execute("SELECT * FROM modelgroups").fetchall()
+        cls.data = {record["id"]: ModelGroupModel(**{**record, "connections": json.loads(record["connections"])}) for record in rows}
+
+    @classmethod
+    def add(cls, key, value):
+        # connections is a list, stored as JSON
+        cls._ensure_fresh()
+        if key in cls.data:
+            raise ValueError(f"Data {key} already exists.")
+        conn = LocalDatabase.connect()
+        try:
+            conn.execute(
+                "INSERT INTO modelgroups (id, model, connections, strategy) VALUES (?, ?, ?, ?)",
+                (value.id, value.model, json.dumps(value.connections), value.strategy)
+            )
+            conn.connection.commit()
+        except Exception:
+            LocalDatabase.rollback()
+            raise
+        logger.info(f"Model group {key} added to database.")
+        cls._apply_local_write(conn, key, value)
+
+class CatalogModel(BaseModel):
+    model_ttl: float = 300     # seconds a discovered model list is served before it is fetched again
+    discovery_timeout: float = 5.0   # seconds each connection gets to list its models
+    discovery_workers: int = 16      # connections queried at the same time
+    tool_ttl: float = 300            # seconds between background fetches of the tool server lists
+
+
+class ConnectionHealth(BaseModel):
+    healthy: bool = False
+    models: int = 0
+    discovery_ms: Optional[float] = None       # duration of the last attempt, None while it never finished
+    last_attempt: Optional[float] = None
+    last_success: Optional[float] = None
+    error: Optional[str] = None
+    stale: bool = True                          # models come from an older discovery or are missing
+
+
 class LLMmodels():
+    """
+    In-memory catalog of the models offered by every LLM connection.
+    Reads never touch the network; the catalog is fetched in the background every
+    model_ttl seconds, or on demand through request_refresh().
+    """
     MODELS: Dict[str, Model] = {}
+    HEALTH: Dict[str, ConnectionHealth] = {}   # connection id -> outcome of its last discovery
+    settings: CatalogModel = CatalogModel()
+    refreshed_at: Optional[float] = None   # time.time() of the last completed refresh
+    _refresh_lock = threading.Lock()
+    _wake: Optional[asyncio.Event] = None
+    _loop: Optional[asyncio.AbstractEventLoop] = None
 
     def __init__(self) -> None:
-        # For each connection refresh the list so that we use the latest connection info
-        self.connections = LlmConnections.list()
-        logger.debug(self.connections)
-        for connection in self.connections:
-            connec = LlmConnections.get(connection)
-            if not connec:
-                logger.warning(f"Connection {connection} not found.")
-                continue
-            Client=llmClient(**connec.model_dump(exclude_unset=True))
-            models = Client.models()
-            if models:
-                for model in models:
-                    self.MODELS.update({model.get('name'):Model(**model)})
+        # kept for existing callers; without the background refresher (socket server, scripts)
+        # a stale catalog is refreshed on a thread while the current one is served
+        if not self._refresher_running() and self.is_stale():
+            threading.Thread(target=LLMmodels.refresh, name="lattice-model-refresh", daemon=True).start()
 
+    @classmethod
+    def configure(cls, settings: CatalogModel) -> None:
+        cls.settings = settings
+
+    @classmethod
+    def is_stale(cls) -> bool:
+        return cls.refreshed_at is None or time.time() - cls.refreshed_at >= cls.settings.model_ttl
+
+    @classmethod
+    def _refresher_running(cls) -> bool:
+        return cls._loop is not None and not cls._loop.is_closed()
+
+    @classmethod
+    def _discover(cls, connec: ConnectionModel) -> Tuple[Dict[str, Model], float]:
+        started = time.perf_counter()
+        Client = ClientPool.get(connec.model_dump(exclude_unset=True))
+        models = {model.get('name'): Model(**model) for model in Client.models(timeout=cls.settings.discovery_timeout)}
+        return models, (time.perf_counter() - started) * 1000
+
+    @classmethod
+    def refresh(cls) -> Dict[str, Any]:
+        """
+        Fetch the model list of every connection concurrently and swap it in as one new catalog.
+        Each connection has discovery_timeout seconds from when a worker picks it up; one that
+        fails or is late keeps the models it had and is reported unhealthy. A connection that no
+        worker got to keeps its models and its previous health. Concurrent calls wait for the
+        running refresh.
+        """
+        if not cls._refresh_lock.acquire(blocking=False):
+            with cls._refresh_lock:
+                return {"models": len(cls.MODELS), "errors": {}}
+        try:
+            connections = {cid: ConnectionModel(**c) for cid, c in LlmConnections.list().items()}
+            ClientPool.retain(connections)
+            models: Dict[str, Model] = {}
+            errors: Dict[str, str] = {}
+            health: Dict[str, ConnectionHealth] = {}
+            started = time.time()
+            timeout = cls.settings.discovery_timeout
+            workers = max(1, min(len(connections), cls.settings.discovery_workers))
+            picked_up: Dict[str, float] = {}   # connection id -> time.monotonic() a worker started on it
+            in_time: Dict[str, bool] = {}
+
+            def discover(cid: str, connec: ConnectionModel):
+                picked_up[cid] = time.monotonic()
+                try:
+                    return cls._discover(connec)
+                finally:
+                    in_time[cid] = time.monotonic() - picked_up[cid] <= timeout
+
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lattice-discovery")
+            try:
+                futures = {pool.submit(discover, cid, connec): cid for cid, connec in connections.items()}
+                # every connection gets its own deadline once it is picked up, so hung hosts holding
+                # the workers delay the queued ones instead of using up their time; the round as a
+                # whole is capped in case a client does not honour its timeout
+                round_deadline = time.monotonic() + timeout * (-(-len(connections) // workers) + 1)
+                while True:
+                    now = time.monotonic()
+                    running = [f for f in futures if not f.done()]
+                    queued = [f for f in running if futures[f] not in picked_up]
+                    deadlines = [picked_up[futures[f]] + timeout for f in running
+                                 if futures[f] in picked_up and now < picked_up[futures[f]] + timeout]
+                    if (not queued and not deadlines) or now >= round_deadline:
+                        break
+                    # a queued connection starts when any running one ends, look again shortly after
+                    wake = min(deadlines + [round_deadline] + ([now + 0.05] if queued else []))
+                    wait(running, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+            finally:
+                # late discoveries finish on their own within their client timeout, nobody waits for them
+                pool.shutdown(wait=False, cancel_futures=True)
+            for future, cid in futures.items():
+                previous = cls.HEALTH.get(cid, ConnectionHealth())
+                if cid not in picked_up:
+                    # never tried, nothing was learned about it
+                    models.update({name: m for name, m in cls.MODELS.items() if m.source.id == cid})
+                    health[cid] = previous.model_copy(update={"stale": True})
+                    logger.warning(f"Connection {cid} was not queried within the discovery round")
+                    continue
+                entry = ConnectionHealth(last_attempt=started, last_success=previous.last_success)
+                if future.done() and not future.cancelled() and future.exception() is None and in_time.get(cid):
+                    found, elapsed = future.result()
+                    models.update(found)
+                    entry.healthy, entry.stale, entry.models = True, False, len(found)
+                    entry.discovery_ms, entry.last_success = round(elapsed, 1), time.time()
+                else:
+                    if future.done() and not future.cancelled() and future.exception() is not None:
+                        entry.error = str(future.exception())
+                    else:
+                        entry.error = f"no answer within {timeout}s"
+                    kept = {name: m for name, m in cls.MODELS.items() if m.source.id == cid}
+                    models.update(kept)
+                    entry.models = len(kept)
+                    errors[cid] = entry.error
+                    logger.warning(f"Unable to list models of connection {cid}: {entry.error}")
+                health[cid] = entry
+            # readers always see either the old or the new catalog, never a half built one
+            cls.MODELS = models
+            cls.HEALTH = health
+            cls.refreshed_at = time.time()
+            save_catalog("models", {name: m.model_dump() for name, m in models.items()})
+            logger.info(f"Model catalog refreshed: {len(models)} models, {len(errors)} connections failed, "
+                        f"{cls.refreshed_at - started:.2f}s")
+            return {"models": len(models), "errors": errors}
+        finally:
+            cls._refresh_lock.release()
+
+    @classmethod
+    def load_snapshot(cls) -> int:
+        """
+        Serve the catalog saved by the last refresh until the first discovery completes.
+        Returns the number of models loaded.
+        """
+        if cls.refreshed_at is not None:
+            return len(cls.MODELS)
+        saved = load_catalog("models")
+        if not saved:
+            return 0
+        saved_at, payload = saved
+        try:
+            models = {name: Model(**m) for name, m in payload.items()}
+        except Exception as e:
+            logger.warning(f"Ignoring the saved model catalog: {e}")
+            return 0
+        health: Dict[str, ConnectionHealth] = {}
+        for m in models.values():
+            entry = health.setdefault(m.source.id, ConnectionHealth(last_success=saved_at))
+            entry.models += 1
+        cls.MODELS, cls.HEALTH, cls.refreshed_at = models, health, saved_at
+        logger.info(f"Loaded {len(models)} models saved {time.time() - saved_at:.0f}s ago")
+        return len(models)
+
+    @classmethod
+    def request_refresh(cls) -> None:
+        """
+        Ask the background refresher to run now, for example after a connection changed.
+        """
+        if cls._refresher_running():
+            cls._loop.call_soon_threadsafe(cls._wake.set)
+        else:
+            threading.Thread(target=LLMmodels.refresh, name="lattice-model-refresh", daemon=True).start()
+
+    @classmethod
+    async def run_refresher(cls) -> None:
+        """
+        Background task: refresh the catalog now and then every model_ttl seconds.
+        """
+        cls._loop = asyncio.get_running_loop()
+        cls._wake = asyncio.Event()
+        try:
+            while True:
+                try:
+                    await asyncio.to_thread(cls.refresh)
+                except Exception as e:
+                    logger.error(f"Model catalog refresh failed: {e}")
+                try:
+                    await asyncio.wait_for(cls._wake.wait(), timeout=cls.settings.model_ttl)
+                except asyncio.TimeoutError:
+                    pass
+                cls._wake.clear()
+        finally:
+            cls._loop = None
+
+    @classmethod
+    def status(cls) -> Dict[str, Any]:
+        return {
+            "models": len(cls.MODELS),
+            "refreshed_at": cls.refreshed_at,
+            "age": None if cls.refreshed_at is None else round(time.time() - cls.refreshed_at, 3),
+            "ttl": cls.settings.model_ttl,
+            "stale": cls.is_stale(),
+            "connections": {cid: entry.model_dump() for cid, entry in cls.HEALTH.items()},
+        }
 
     def listdown(self):
         if self.MODELS:
@@ -1,49 +1,341 @@
 #from LatticePy.tools.Agents import Agent
 
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple, Type, Union
+import asyncio
+import importlib
+import json
+import threading
+import logging
 
+from latticepy.engine.services.backendlimits import BackendLimits
+from latticepy.engine.interfaces.memoryinterface import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# entry point group third party packages use to add providers:
+#   [project.entry-points."latticepy.engine.providers"]
+#   myllm = "mypackage.provider:MyProvider"
+PROVIDER_ENTRY_POINTS = "latticepy.engine.providers"
+
+
+class LLMProvider:
+    """
+    Adapter between llmClient and one kind of LLM backend.
+    Provider modules are imported the first time a connection of their source is
+    used, so a backend's client library costs nothing until then.
+    """
+
+    def __init__(self, connection: Dict[str, Any], timeout: float):
+        self.connection = connection
+        self.timeout = timeout
+
+    def list_models(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Models offered by the backend, each a dict with at least a 'model' key.
+        timeout overrides the provider timeout for this call only.
+        """
+        raise NotImplementedError
+
+    def chat(self, model: str, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Returns the reply text and the tool calls requested by the model, [] when there are none.
+        """
+        raise NotImplementedError
+
+    async def achat(self, model: str, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Async chat. Providers without an async client run chat() on a worker thread,
+        so a slow generation never blocks the event loop.
+        """
+        return await asyncio.to_thread(self.chat, model, messages, tools)
+
+    def embed(self, model: str, texts: List[str]) -> List[List[float]]:
+        """
+        One embedding vector per text, from an embedding model of the backend.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support embeddings")
+
+    async def aembed(self, model: str, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed, model, texts)
+
+    async def astream(self, model: str, messages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        """
+        The reply as it is generated, piece by piece. Providers that cannot stream
+        yield the whole reply once.
+        """
+        content, _ = await self.achat(model, messages)
+        yield content
+
+    def close(self) -> None:
+        """
+        Release the backend's connections, called when the client is dropped from the pool.
+        """
+
+    async def aclose(self) -> None:
+        self.close()
+
+    def bound_loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        """
+        The event loop the provider's open async connections belong to, None when it has none.
+        Providers that keep an async client set _async_loop when they open it.
+        """
+        return getattr(self, '_async_loop', None)
+
+
+_closing: set = set()   # keeps pending close tasks alive until they finish
+
+
+def close_on_loop(aclose: Callable[[], Awaitable[None]], loop: Optional[asyncio.AbstractEventLoop],
+                  fallback: Callable[[], None], name: str) -> None:
+    """
+    Run aclose() on loop, the event loop the async connections it closes belong to, from any thread.
+    fallback() runs instead when there is no such loop or it has stopped.
+    """
+    if loop is None or not loop.is_running():
+        fallback()
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        task = loop.create_task(aclose())
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+        return
+    try:
+        future = asyncio.run_coroutine_threadsafe(aclose(), loop)
+    except RuntimeError:
+        # the loop closed in the meantime
+        fallback()
+        return
+    future.add_done_callback(lambda f: f.cancelled() or f.exception() is None or
+                             logger.warning(f"Error closing {name}: {f.exception()}"))
+
+
+# built in providers as "module:attribute", imported on first use
+PROVIDERS: Dict[str, Union[str, Type[LLMProvider]]] = {
+    "ollama": "latticepy.engine.providers.ollama:OllamaProvider",
+    "openai": "latticepy.engine.providers.openaicompat:OpenAICompatibleProvider",
+}
+_provider_lock = threading.Lock()
+_entry_points_loaded = False
+
+
+def register_provider(source: str, provider: Union[str, Type[LLMProvider]]) -> None:
+    """
+    Make connections with this source use provider, a class or a "module:attribute" path.
+    """
+    with _provider_lock:
+        PROVIDERS[source] = provider
+
+
+def _load_entry_points() -> None:
+    global _entry_points_loaded
+    from importlib.metadata import entry_points
+    eps = entry_points()
+    group = eps.select(group=PROVIDER_ENTRY_POINTS) if hasattr(eps, "select") else eps.get(PROVIDER_ENTRY_POINTS, [])
+    for ep in group:
+        # built in and explicitly registered providers win over plugins of the same name
+        PROVIDERS.setdefault(ep.name, ep.value)
+    _entry_points_loaded = True
+
+
+def provider_registered(source: str) -> bool:
+    """
+    Whether a provider exists for source, without importing it.
+    """
+    with _provider_lock:
+        if source not in PROVIDERS and not _entry_points_loaded:
+            _load_entry_points()
+        return source in PROVIDERS
+
+
+def get_provider(source: str) -> Type[LLMProvider]:
+    """
+    The provider class for a connection source, importing it on first use.
+    """
+    with _provider_lock:
+        if source not in PROVIDERS and not _entry_points_loaded:
+            _load_entry_points()
+        provider = PROVIDERS.get(source)
+        if provider is None:
+            raise ValueError(f"Unsupported LLM source: {source}, no provider is registered for it")
+        if isinstance(provider, str):
+            module_name, _, attr = provider.partition(":")
+            provider = getattr(importlib.import_module(module_name), attr)
+            PROVIDERS[source] = provider
+            logger.info(f"Loaded LLM provider {source} from {module_name}")
+        return provider
 
 
 class llmClient:
-    def __init__(self,**connection):
+    def __init__(self, timeout: Optional[float] = None, **connection):
         self.llmsource = connection
         self.url = connection.get('url', 'http://localhost:11434/')
         self.api_key =  connection.get('api_key', None)
         self.conid = connection.get('id', 'default')
         self._llmmodels=[]
-        self.timeout=300
-        self.cl=None
-        if self.llmsource['source'] == "ollama":
-            from ollama import Client as OllamaClient
-            self.cl=OllamaClient(self.url, timeout=self.timeout)
-            print(f"Connected to Ollama at {self.url}")
-            self._llmmodels=(self.cl.list()).model_dump()['models']
-        else:
-            raise ValueError(f"Unsupported LLM source: {self.llmsource}")
-        
-    def models(self):
+        self.timeout=timeout or 300
+        # the provider holds the backend's keep-alive connection pool; models are listed on demand
+        self.provider = get_provider(self.llmsource['source'])(connection, self.timeout)
+
+    def models(self, timeout: Optional[float] = None):
+        self._llmmodels=self.provider.list_models(timeout)
         mos=[]
         try:
             for mod in self._llmmodels:
                 mos.append({'name': f"{self.conid}_{mod.get('model', '')}", 'model':mod.get('model', ''), 'source': self.llmsource, 'details': mod})
             return mos
         except Exception as e:
-            print(f"unable to fetch model details {e}")
+            logger.debug(f"unable to fetch model details {e}")
         return []
 
-    def chat(self, model: str, prompt: str , message: str, tools: Optional[List[Dict[str, Any]]] = None) -> Tuple[str, List[Dict[str, Any]]]:
-            if self.llmsource['source'] == "ollama":
-                print(f"Sending message to Ollama model {model}")
-                if tools:
-                    # If tools are provided, use them in the chat
-                    res = self.cl.chat(model=model, messages=[{'role': 'system', 'content': prompt}, {'role': 'user', 'content': message}], tools=tools)
-                    if res.message.tool_calls:
-                        res_dict=res.model_dump()
-                        print(res_dict)
-                        return res_dict['message']['content'], res_dict['message']['tool_calls']
-                    return res.message.content, [{}]
-                res=self.cl.chat(model=model, messages=[{'role':'user', 'content':message}])
-                return res.message.content, [{}]
+    def chat(self, model: str, prompt: str , message: str, tools: Optional[List[Dict[str, Any]]] = None, history: Optional[List[Dict[str, str]]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+            # history holds earlier turns of the conversation, oldest first
+            history = history or []
+            logger.debug(f"Sending message to {self.llmsource['source']} model {model}")
+            if tools:
+                # If tools are provided, use them in the chat
+                content, tool_calls = self.provider.chat(model, [{'role': 'system', 'content': prompt}, *history, {'role': 'user', 'content': message}], tools=tools)
+                if tool_calls:
+                    return content, tool_calls
+                return content, [{}]
+            content, _ = self.provider.chat(model, [*history, {'role':'user', 'content':message}])
+            return content, [{}]
+
+    async def achat(self, model: str, prompt: str , message: str, tools: Optional[List[Dict[str, Any]]] = None, history: Optional[List[Dict[str, str]]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Same as chat(), awaited over the provider's shared async connections.
+        Waits for a slot of the connection's concurrency limit first.
+        """
+        history = history or []
+        logger.debug(f"Sending message to {self.llmsource['source']} model {model}")
+        async with BackendLimits.slot(self.conid) as sample:
+            if tools:
+                content, tool_calls = await self.provider.achat(model, [{'role': 'system', 'content': prompt}, *history, {'role': 'user', 'content': message}], tools=tools)
+                sample.done("reply", count_tokens(content or "") + count_tokens(json.dumps(tool_calls or [])))
+                return content, tool_calls or [{}]
+            content, _ = await self.provider.achat(model, [*history, {'role':'user', 'content':message}])
+            sample.done("reply", count_tokens(content or ""))
+            return content, [{}]
+
+    async def astream(self, model: str, message: str, history: Optional[List[Dict[str, str]]] = None) -> AsyncIterator[str]:
+        """
+        Streams the reply to a plain chat, without tools, as text pieces.
+        The connection slot is held until the stream ends.
+        """
+        async with BackendLimits.slot(self.conid) as sample:
+            async for piece in self.provider.astream(model, [*(history or []), {'role': 'user', 'content': message}]):
+                if piece:
+                    sample.first_piece()
+                    yield piece
+
+    async def aembed(self, model: str, texts: List[str]) -> List[List[float]]:
+        async with BackendLimits.slot(self.conid) as sample:
+            vectors = await self.provider.aembed(model, texts)
+            sample.done("embed", sum(count_tokens(text) for text in texts))
+            return vectors
+
+    def close(self) -> None:
+        self.provider.close()
+
+    async def aclose(self) -> None:
+        await self.provider.aclose()
+
+    def bound_loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        # registered providers need not derive from LLMProvider
+        bound_loop = getattr(self.provider, 'bound_loop', None)
+        return bound_loop() if bound_loop else None
+
+
+def connection_fingerprint(connection: Dict[str, Any]) -> str:
+    # unset and None fields are the same record, whichever way the caller dumped the model
+    return json.dumps({k: v for k, v in connection.items() if v is not None}, sort_keys=True, default=str)
+
+
+class ClientPool:
+    """
+    One long-lived llmClient per connection id, so chat requests and model discovery reuse
+    the backend's HTTP connections instead of opening new ones every time.
+    A client is rebuilt when the connection record it was built from changes.
+    """
+    _clients: Dict[str, Tuple[str, llmClient]] = {}
+    _lock = threading.Lock()
+    _created = 0
+    _reused = 0
+
+    @classmethod
+    def get(cls, connection: Dict[str, Any]) -> llmClient:
+        conid = connection.get('id', 'default')
+        fingerprint = connection_fingerprint(connection)
+        with cls._lock:
+            entry = cls._clients.get(conid)
+            if entry and entry[0] == fingerprint:
+                cls._reused += 1
+                return entry[1]
+            client = llmClient(**connection)
+            cls._clients[conid] = (fingerprint, client)
+            cls._created += 1
+        if entry:
+            logger.info(f"Connection {conid} changed, rebuilt its client")
+            cls._retire(entry[1])
+        return client
+
+    @classmethod
+    def discard(cls, conid: str) -> None:
+        with cls._lock:
+            entry = cls._clients.pop(conid, None)
+        if entry:
+            cls._retire(entry[1])
+
+    @classmethod
+    def retain(cls, conids) -> None:
+        """
+        Drop the clients of connections that no longer exist.
+        """
+        for conid in [c for c in list(cls._clients) if c not in set(conids)]:
+            cls.discard(conid)
+
+    @classmethod
+    def close_all(cls) -> None:
+        with cls._lock:
+            entries = list(cls._clients.values())
+            cls._clients.clear()
+        for _, client in entries:
+            cls._close(client)
+
+    @classmethod
+    async def aclose_all(cls) -> None:
+        """
+        Close every client, including async connections, which must be closed on the event loop that opened them.
+        """
+        with cls._lock:
+            entries = list(cls._clients.values())
+            cls._clients.clear()
+        for _, client in entries:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing LLM client {client.conid}: {e}")
+
+    @classmethod
+    def _retire(cls, client: llmClient) -> None:
+        # async connections belong to the event loop that opened them and must be closed there,
+        # also when the client is retired from another thread such as model discovery
+        close_on_loop(client.aclose, client.bound_loop(), lambda: cls._close(client), f"LLM client {client.conid}")
+
+    @staticmethod
+    def _close(client: llmClient) -> None:
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning(f"Error closing LLM client {client.conid}: {e}")
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        with cls._lock:
+            return {"clients": sorted(cls._clients), "created": cls._created, "reused": cls._reused}
             
 
 # class litellmClient:
\ No newline at end of file
@@ -0,0 +1,168 @@
+from pydantic import BaseModel
+from typing import List, Dict, Any, Optional
+import time
+import logging
+
+from latticepy.engine.services.localdatabase import LocalDatabase
+
+logger = logging.getLogger(__name__)
+
+# the conversation tables are created by services/migrations.py
+
+# roles are stored as small integers to keep message rows compact
+ROLE_CODES = {'system': 0, 'user': 1, 'assistant': 2, 'tool': 3}
+ROLE_NAMES = {code: role for role, code in ROLE_CODES.items()}
+
+# window() takes the configured token budget unless told otherwise; None there means no cap
+_DEFAULT: Any = object()
+
+
+class MemoryModel(BaseModel):
+    max_messages: int = 20              # most recent messages handed to the model
+    token_budget: Optional[int] = 2048  # cap on the approximate tokens of that history, None for no cap
+    retention_days: Optional[float] = 30  # sessions idle for longer are deleted, None keeps them forever
+    maintenance_interval: int = 3600    # seconds between retention and vacuum passes
+    vacuum_free_ratio: float = 0.25     # full VACUUM when this share of pages is free and auto_vacuum is off
+
+
+def count_tokens(text: str) -> int:
+    # same approximation the API uses for usage, a real tokenizer can replace both
+    return len(text.split())
+
+
+class ConversationStore:
+    """
+    Append-only message log per session, stored in SQLite.
+    """
+    settings: MemoryModel = MemoryModel()
+
+    @classmethod
+    def configure(cls, settings: MemoryModel) -> None:
+        cls.settings = settings
+
+    @staticmethod
+    def append(session_id: str, messages: List[Dict[str, Any]], agent: Optional[str] = None) -> int:
+        """
+        Append messages to the session log, creating the session on first use.
+        Returns the sequence number of the last stored message.
+        """
+        now = int(time.time())
+        cur = LocalDatabase.connect()
+        conn = cur.connection
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute(
+                "INSERT INTO conversation_sessions (session_id, agent, last_seq, updated_at) VALUES (?, ?, 0, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (session_id, agent, now)
+            )
+            last_seq = cur.execute("SELECT last_seq FROM conversation_sessions WHERE session_id = ?", (session_id,)).fetchone()[0]
+            rows = []
+            for message in messages:
+                last_seq += 1
+                content = message.get('content') or ''
+                rows.append((session_id, last_seq, ROLE_CODES.get(message.get('role'), ROLE_CODES['user']), content, count_tokens(content), now))
+            cur.executemany(
+                "INSERT INTO conversation_messages (session_id, seq, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            cur.execute("UPDATE conversation_sessions SET last_seq = ? WHERE session_id = ?", (last_seq, session_id))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error appending to session {session_id}: {e}")
+            raise ValueError(f"Error appending to session {session_id}: {e}")
+        return last_seq
+
+    @classmethod
+    def window(cls, session_id: str, max_messages: Optional[int] = None, token_budget: Optional[int] = _DEFAULT) -> List[Dict[str, str]]:
+        """
+        The most recent messages of a session, oldest first, limited by count and token budget.
+        token_budget defaults to the configured one, None lifts the cap.
+        One range scan over the (session_id, seq) primary key.
+        """
+        max_messages = max_messages if max_messages is not None else cls.settings.max_messages
+        token_budget = cls.settings.token_budget if token_budget is _DEFAULT else token_budget
+        rows = LocalDatabase.connect().execute(
+            "SELECT role, content FROM ("
+            "  SELECT seq, role, content, SUM(tokens) OVER (ORDER BY seq DESC ROWS UNBOUNDED PRECEDING) AS running"
+            "  FROM conversation_messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?"
+            ") WHERE ? IS NULL OR running <= ? ORDER BY seq",
+            (session_id, max_messages, token_budget, token_budget)
+        ).fetchall()
+        return [{'role': ROLE_NAMES.get(row['role'], 'user'), 'content': row['content']} for row in rows]
+
+    @staticmethod
+    def get(session_id: str) -> Dict[str, Any]:
+        row = LocalDatabase.connect().execute(
+            "SELECT session_id, agent, last_seq, updated_at FROM conversation_sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if not row:
+            logger.warning(f"Session {session_id} not found.")
+            return {}
+        return {**row}
+
+    @staticmethod
+    def delete(session_id: str) -> bool:
+        try:
+            conn = LocalDatabase.connect()
+            conn.execute("DELETE FROM conversation_messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM conversation_sessions WHERE session_id = ?", (session_id,))
+            conn.connection.commit()
+            logger.info(f"Session {session_id} deleted successfully.")
+            return True
+        except Exception as e:
+            LocalDatabase.rollback()
+            logger.error(f"Error deleting session {session_id}: {e}")
+            return False
+
+    @classmethod
+    def prune(cls, retention_days: Optional[float] = None) -> int:
+        """
+        Delete sessions idle for longer than the retention period, returns how many were removed.
+        """
+        retention_days = retention_days if retention_days is not None else cls.settings.retention_days
+        if retention_days is None:
+            return 0
+        cutoff = int(time.time() - retention_days * 86400)
+        cur = LocalDatabase.connect()
+        conn = cur.connection
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute(
+                "DELETE FROM conversation_messages WHERE session_id IN "
+                "(SELECT session_id FROM conversation_sessions WHERE updated_at < ?)", (cutoff,)
+            )
+            removed = cur.execute("DELETE FROM conversation_sessions WHERE updated_at < ?", (cutoff,)).rowcount
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error pruning conversation memory: {e}")
+            return 0
+        if removed:
+            logger.info(f"Pruned {removed} idle conversation sessions")
+        return removed
+
+    @classmethod
+    def vacuum(cls) -> None:
+        """
+        Return free pages to the file system. Incremental when the database supports it,
+        otherwise a full VACUUM once enough of the file is free.
+        """
+        cur = LocalDatabase.connect()
+        if cur.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            cur.execute("PRAGMA incremental_vacuum")
+            cur.fetchall()
+            return
+        pages = cur.execute("PRAGMA page_count").fetchone()[0]
+        free = cur.execute("PRAGMA freelist_count").fetchone()[0]
+        if pages and free / pages >= cls.settings.vacuum_free_ratio:
+            logger.info(f"Vacuuming database, {free} of {pages} pages free")
+            # switching to incremental mode only takes effect through a full VACUUM
+            cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cur.execute("VACUUM")
+
+    @classmethod
+    def maintain(cls) -> None:
+        cls.prune()
+        cls.vacuum()
@@ -2,22 +2,19 @@
 from pydantic import BaseModel, Field,  ValidationError
 from typing import Dict, Optional, Any, List, Tuple
 import requests
+import asyncio
+import threading
+import time
 import json
 import logging
 
 logger = logging.getLogger(__name__)
 
 from latticepy.engine.services.localdatabase import LocalDatabase
+from latticepy.engine.services.catalogcache import save_catalog, load_catalog
 
 
-LocalDatabase.create_tables(
-    'toolservers',
-    {
-        'id': 'TEXT PRIMARY KEY',
-        'url': 'TEXT',
-        'details': 'TEXT'
-    }   
-)
+# the toolservers table is created by services/migrations.py
 
 class ToolDetails(BaseModel):
     name: str
@@ -61,14 +58,65 @@ def callserver(toolname, arguments):
     
 
 class servertooldata:
+    """
+    Tools offered by the registered tool servers. The lists are kept in memory and
+    fetched again every ttl seconds in the background, or right after a server is
+    added or removed.
+    """
+    TOOLDATA: Dict[str, Any] = {}       # "<server>.<tool>" -> {'url', 'data'}
+    SERVER_TOOLS: Dict[str, Any] = {}   # server id -> list of tool details
+    refreshed_at: Optional[float] = None
+    ttl: float = 300
+    fetch_timeout: float = 10
+    _refresh_lock = threading.Lock()
+
     def __init__(self ):
-        self.tooldata, self.server_tools =self.listdetails()
+        if servertooldata.refreshed_at is None:
+            # nothing fetched yet, not even a saved copy
+            servertooldata.refresh()
+        self.tooldata, self.server_tools = servertooldata.TOOLDATA, servertooldata.SERVER_TOOLS
+
+    @classmethod
+    def refresh(cls) -> None:
+        with cls._refresh_lock:
+            tooldata, server_tools = cls.listdetails()
+            cls.TOOLDATA, cls.SERVER_TOOLS, cls.refreshed_at = tooldata, server_tools, time.time()
+        save_catalog("tools", {"tooldata": tooldata, "server_tools": server_tools})
+
+    @classmethod
+    def load_snapshot(cls) -> int:
+        """
+        Serve the tool lists saved by the last refresh until the first fetch completes.
+        Returns the number of tools loaded.
+        """
+        if cls.refreshed_at is not None:
+            return len(cls.TOOLDATA)
+        saved = load_catalog("tools")
+        if not saved:
+            return 0
+        saved_at, payload = saved
+        cls.TOOLDATA, cls.SERVER_TOOLS, cls.refreshed_at = payload["tooldata"], payload["server_tools"], saved_at
+        logger.info(f"Loaded {len(cls.TOOLDATA)} tools saved {time.time() - saved_at:.0f}s ago")
+        return len(cls.TOOLDATA)
+
+    @classmethod
+    async def run_refresher(cls) -> None:
+        """
+        Background task: fetch the tool lists now and then every ttl seconds.
+        """
+        while True:
+            try:
+                await asyncio.to_thread(cls.refresh)
+            except Exception as e:
+                logger.error(f"Tool catalog refresh failed: {e}")
+            await asyncio.sleep(cls.ttl)
 
-    def _get_tools(self, url) -> List:
-        # get the tools from each server
-        tool_models=[]
+    @classmethod
+    def _get_tools(cls, url) -> Optional[List]:
+        # get the tools from each server, None when the server could not be read
+        tool_models=None
         try:
-            res=requests.get(f'{url}/get-tool-functions')
+            res=requests.get(f'{url}/get-tool-functions', timeout=cls.fetch_timeout)
             logger.debug(res.json())
             res.raise_for_status()
             tools=res.json()
@@ -81,6 +129,35 @@ class servertooldata:
             logger.error(f"unknown error occured while fetching tools from server {e}")
         return tool_models
 
+    @staticmethod
+    def _store_tools(server_id: str, tools: List[ToolDetails]) -> None:
+        """
+        Keep the tools table, and with it the search index, in line with what the server returned.
+        Only rows that changed are written.
+        """
+        wanted = {
+            f'{server_id}.{tool.name}': (server_id, tool.name, tool.description, json.dumps(tool.toolschema, sort_keys=True))
+            for tool in tools
+        }
+        try:
+            cur = LocalDatabase.connect()
+            stored = {
+                row["id"]: (row["server_id"], row["name"], row["description"], row["toolschema"])
+                for row in cur.execute("SELECT * FROM tools WHERE server_id = ?", (server_id,)).fetchall()
+            }
+            changed = [(tool_id, *values) for tool_id, values in wanted.items() if stored.get(tool_id) != values]
+            removed = [(tool_id,) for tool_id in stored if tool_id not in wanted]
+            if not changed and not removed:
+                return
+            cur.executemany("DELETE FROM tools WHERE id = ?", removed)
+            cur.executemany(
+                "INSERT OR REPLACE INTO tools (id, server_id, name, description, toolschema) VALUES (?, ?, ?, ?, ?)", changed
+            )
+            cur.connection.commit()
+        except Exception as e:
+            LocalDatabase.rollback()
+            logger.error(f"Error storing tools of server {server_id}: {e}")
+
     @classmethod
     def add(cls, serverdata: ToolServer):
         # add in the database
@@ -95,6 +172,7 @@ class servertooldata:
             conn.connection.commit()
             conn.connection.commit()
         except Exception as e:
+            LocalDatabase.rollback()
             logger.error(f"Error adding server: {e}")
             raise ValueError(f"Error adding server: {e}")
 
@@ -107,6 +185,7 @@ class servertooldata:
             logger.info(f"Model {server_id} deleted successfully.")
             return True
         except Exception as e:
+            LocalDatabase.rollback()
             logger.error(f"Error deleting server {server_id}: {e}")
             return False
         
@@ -121,7 +200,8 @@ class servertooldata:
             print("No servers available.")
             return {}
     
-    def listdetails(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    @classmethod
+    def listdetails(cls) -> Tuple[Dict[str, Any], Dict[str, Any]]:
         #list the servers
         rows = LocalDatabase.connect().execute("SELECT * FROM toolservers").fetchall()
         #print(rows)
@@ -129,7 +209,13 @@ class servertooldata:
             data={}
             sdata={}
             for record in rows:
-                server_tools=self._get_tools(record["url"])
+                server_tools=cls._get_tools(record["url"])
+                if server_tools is None:
+                    # a server that is down keeps its last known tools, in memory and in the search index
+                    sdata[record["id"]]=cls.SERVER_TOOLS.get(record["id"], [])
+                    data.update({k: v for k, v in cls.TOOLDATA.items() if k.startswith(f'{record["id"]}.')})
+                    continue
+                cls._store_tools(record["id"], server_tools)
                 tooldata=[tool.model_dump() for tool in server_tools]
                 logger.debug(f'fetched server tools: {server_tools}')
                 sdata.update({record["id"]:tooldata})
@@ -2,6 +2,7 @@ import argparse
 import os
 import sys
 import shutil
+import sqlite3
 import platform
 import toml
 import logging
@@ -26,6 +27,15 @@ class MinimalFormatter(logging.Formatter):
 
 
 from latticepy.engine.services.localdatabase import LocalDatabase, LocalDBModel
+from latticepy.engine.services.migrations import migrate
+from latticepy.engine.interfaces.memoryinterface import MemoryModel
+from latticepy.engine.services.usageledger import UsageModel
+from latticepy.engine.services.responsecache import ResponseCacheModel
+from latticepy.engine.services.semanticcache import SemanticCacheModel
+from latticepy.engine.services.modelrouter import RoutingModel
+from latticepy.engine.services.backendlimits import LimiterModel
+from latticepy.engine.services.scheduler import SchedulingModel
+from latticepy.engine.interfaces.clientinterface import CatalogModel
 
 
 home_dir = str(Path.home())
@@ -42,6 +52,14 @@ class ConfigModel(BaseModel):
     SOCKET: Optional[bool] = False
     DATABASE: LocalDBModel
     TOOL_SERVER: Optional[str] = None
+    MEMORY: Optional[MemoryModel] = MemoryModel()
+    USAGE: Optional[UsageModel] = UsageModel()
+    CATALOG: Optional[CatalogModel] = CatalogModel()
+    RESPONSE_CACHE: Optional[ResponseCacheModel] = ResponseCacheModel()
+    SEMANTIC_CACHE: Optional[SemanticCacheModel] = SemanticCacheModel()
+    ROUTING: Optional[RoutingModel] = RoutingModel()
+    LIMITS: Optional[LimiterModel] = LimiterModel()
+    SCHEDULING: Optional[SchedulingModel] = SchedulingModel()
 
 
 class Config:
@@ -74,7 +92,10 @@ class Client:
         cls.config = config
         LocalDatabase(cls.config.DATABASE)
         os.environ["LATTICE_DB_PATH"] = os.path.join(cls.config.DATABASE.url_path, cls.config.DATABASE.name)
-        #LocalDatabase.drop(table_name='latticeagents')
+        # the web server runs in a fresh interpreter, it reloads the full config from here
+        os.environ["LATTICE_CONFIG_PATH"] = cls.config.config_path
+        schema_version = migrate()
+        logging.info(f"Database schema at version {schema_version}")
         import multiprocessing as mp
         from latticepy.engine.services.webserver import startwebserver
         cls.webprocess = mp.Process(target=startwebserver, args=(cls.config.address, cls.config.port))
@@ -86,6 +107,7 @@ class Client:
 
     @classmethod
     def stop(cls):
+        LocalDatabase.close_all()
         if cls.webprocess and cls.webprocess.is_alive():
             logging.info("Shutting down the web server process gracefully...")
             if cls.webprocess.is_alive():
@@ -93,32 +115,7 @@ class Client:
                 cls.webprocess.join()
 
 
-def main():
-    parser= argparse.ArgumentParser(description="LatticeAI Client")
-    subparsers = parser.add_subparsers(dest="command", required=True, help="mode to run the client")
-    run_parser = subparsers.add_parser("run", help="Run the client")
-    run_parser.add_argument("mode", type=str, nargs="?", help="mode to run the client", choices=["http", "daemon"], default='http')
-    run_parser.add_argument("--port", type=int, help="Port number to run the client on", default=44444)
-    run_parser.add_argument("--address", type=str, help="Address to run the client on", default="localhost")
-    run_parser.add_argument("--socket", action='store_true', help="to enable socket communication")
-    run_parser.add_argument("--config", type=str, help="Path to the configuration file", default=None)  
-    args= parser.parse_args()
-    
-    if not os.path.exists(lattice_path):
-        try:
-            os.makedirs(lattice_path)
-        except OSError as e:
-            print(f"Error creating directory '{lattice_path}': {e}")
-            sys.exit(1)
-
-def main():
-    parser= argparse.ArgumentParser(description="LatticeAI Client")
-    parser.add_argument("run", type=str, help="mode to run the client", choices=["web", "daemon"], default='web')
-    parser.add_argument("--port", type=int, help="Port number to run the client on", default=44444)
-    parser.add_argument("--address", type=str, help="Address to run the client on", default="localhost")
-    parser.add_argument("--socket", action='store_true', help="to enable socket communication")
-    parser.add_argument("--config", type=str, help="Path to the configuration file", default=None)  
-    args= parser.parse_args()
+def setup_logging():
     # Configure logging
     log_dir = os.path.join(home_dir, lattice_folder, 'engine', 'logs')
     os.makedirs(log_dir, exist_ok=True)
@@ -143,30 +140,109 @@ def main():
     console_handler.setFormatter(MinimalFormatter("%(message)s"))
     root_logger.addHandler(console_handler)
 
-    logger = logging.getLogger(__name__)
 
-    runtime_mode=args.mode
-    if args.config:
-        if os.path.exists(args.config):
-            config_path = args.config
-        else:
-            logger.error("Config file not found")
+def resolve_config_path(path):
+    if path:
+        if not os.path.exists(path):
+            logging.error(f"Provided config file does not exist: {path}")
             sys.exit(1)
-    else:
-        config_path = os.path.join(lattice_path, "config.toml")
-        
+        return path
+    return os.path.join(lattice_path, "config.toml")
+
+
+def default_database():
+    return LocalDBModel(name='localdb', url_path=lattice_path, db='sqlite3', password=None)
+
+
+def load_database_settings(config_path):
+    # snapshot and restore only need the database section, a missing config means the default location
+    if os.path.exists(config_path):
+        return Config().load(config_path).DATABASE
+    return default_database()
+
+
+def run_command(args):
+    logger = logging.getLogger(__name__)
+    runtime_mode = args.mode
+    config_path = resolve_config_path(args.config)
     conf=Config()
-    dbdata=LocalDBModel(name='localdb', url_path=lattice_path, db='sqlite3', password=None)
-    
     if not os.path.exists(config_path):
-        if args.config:
-            logger.error(f"Provided config file does not exist: {config_path}")
-            sys.exit(1)
-        config=ConfigModel(mode=runtime_mode, address=args.address, port=args.port, config_path=config_path, DATABASE=dbdata)
+        config=ConfigModel(mode=runtime_mode, address=args.address, port=args.port, config_path=config_path, DATABASE=default_database())
         conf.update(config)
     config=conf.load(config_path)
+    if args.from_snapshot:
+        from latticepy.engine.services.snapshot import restore_snapshot
+        db_path = os.path.join(config.DATABASE.url_path, config.DATABASE.name)
+        if os.path.exists(db_path):
+            logger.warning(f"Database {db_path} already exists, not restoring {args.from_snapshot}")
+        else:
+            try:
+                restore_snapshot(args.from_snapshot, db_path)
+            except ValueError as e:
+                logger.error(f"Unable to warm-start from snapshot: {e}")
+                sys.exit(1)
     logger.info(f"Starting Lattice Client in {runtime_mode} mode")
     Client.run(config)
 
+
+def snapshot_command(args):
+    from latticepy.engine.services.snapshot import create_snapshot
+    LocalDatabase(load_database_settings(resolve_config_path(args.config)))
+    try:
+        # same schema a starting engine would see, so the snapshot can seed a replica directly
+        migrate()
+        info = create_snapshot(args.output)
+    except (RuntimeError, ValueError, sqlite3.Error) as e:
+        logging.error(f"Snapshot failed: {e}")
+        sys.exit(1)
+    finally:
+        LocalDatabase.close_all()
+    print(f"Snapshot written to {info['path']} ({info['bytes']} bytes, schema version {info['schema_version']}, {info['seconds']}s)")
+
+
+def restore_command(args):
+    from latticepy.engine.services.snapshot import restore_snapshot
+    db = load_database_settings(resolve_config_path(args.config))
+    try:
+        info = restore_snapshot(args.snapshot, os.path.join(db.url_path, db.name), force=args.force)
+    except ValueError as e:
+        logging.error(f"Restore failed: {e}")
+        sys.exit(1)
+    print(f"Restored {info['restored_to']} from {info['path']} (schema version {info['schema_version']})")
+
+
+def main():
+    parser= argparse.ArgumentParser(description="LatticeAI Client")
+    subparsers = parser.add_subparsers(dest="command", required=True, help="command to run")
+    run_parser = subparsers.add_parser("run", help="Run the client")
+    run_parser.add_argument("mode", type=str, nargs="?", help="mode to run the client", choices=["http", "daemon"], default='http')
+    run_parser.add_argument("--port", type=int, help="Port number to run the client on", default=44444)
+    run_parser.add_argument("--address", type=str, help="Address to run the client on", default="localhost")
+    run_parser.add_argument("--socket", action='store_true', help="to enable socket communication")
+    run_parser.add_argument("--config", type=str, help="Path to the configuration file", default=None)  
+    run_parser.add_argument("--from-snapshot", type=str, help="Seed a new database from this snapshot before starting", default=None)
+    run_parser.set_defaults(handler=run_command)
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="Write an online snapshot of the engine database")
+    snapshot_parser.add_argument("output", type=str, nargs="?", help="Snapshot file, defaults to a timestamped file in the snapshots folder", default=None)
+    snapshot_parser.add_argument("--config", type=str, help="Path to the configuration file", default=None)
+    snapshot_parser.set_defaults(handler=snapshot_command)
+
+    restore_parser = subparsers.add_parser("restore", help="Replace the engine database with a snapshot, the engine must be stopped")
+    restore_parser.add_argument("snapshot", type=str, help="Snapshot file to restore")
+    restore_parser.add_argument("--force", action='store_true', help="overwrite an existing database")
+    restore_parser.add_argument("--config", type=str, help="Path to the configuration file", default=None)
+    restore_parser.set_defaults(handler=restore_command)
+    args= parser.parse_args()
+
+    if not os.path.exists(lattice_path):
+        try:
+            os.makedirs(lattice_path)
+        except OSError as e:
+            print(f"Error creating directory '{lattice_path}': {e}")
+            sys.exit(1)
+    setup_logging()
+    args.handler(args)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,87 @@
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+import asyncio
+import logging
+
+from ollama import AsyncClient as AsyncOllamaClient, Client as OllamaClient
+
+from latticepy.engine.interfaces.llminterface import LLMProvider, close_on_loop
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaProvider(LLMProvider):
+    """
+    Ollama servers, through the official ollama client.
+    """
+
+    def __init__(self, connection: Dict[str, Any], timeout: float):
+        super().__init__(connection, timeout)
+        url = connection.get('url') or 'http://localhost:11434/'
+        self.client = OllamaClient(url, timeout=timeout)
+        # created on first use, an httpx.AsyncClient is tied to the event loop it runs on
+        self.url = url
+        self._async_client: Optional[AsyncOllamaClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._discovery_client: Optional[OllamaClient] = None
+        self._discovery_timeout: Optional[float] = None
+        logger.debug(f"Connected to Ollama at {url}")
+
+    def list_models(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        client = self.client if timeout is None else self._lister(timeout)
+        return client.list().model_dump()['models']
+
+    def _lister(self, timeout: float) -> OllamaClient:
+        # discovery has a shorter deadline than chats, it gets a client of its own that is kept
+        # across discovery rounds so its connection stays alive
+        if self._discovery_client is None or self._discovery_timeout != timeout:
+            if self._discovery_client is not None:
+                self._discovery_client.close()
+            self._discovery_client = OllamaClient(self.url, timeout=timeout)
+            self._discovery_timeout = timeout
+        return self._discovery_client
+
+    def chat(self, model: str, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        res = self.client.chat(model=model, messages=messages, tools=tools)
+        if res.message.tool_calls:
+            res_dict = res.model_dump()
+            return res_dict['message']['content'], res_dict['message']['tool_calls']
+        return res.message.content, []
+
+    def _aclient(self) -> AsyncOllamaClient:
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            if self._async_client is not None:
+                # the client of the previous loop can only be closed on that loop
+                close_on_loop(self._async_client.close, self._async_loop, lambda: None, f"Ollama client for {self.url}")
+            self._async_client = AsyncOllamaClient(self.url, timeout=self.timeout)
+            self._async_loop = loop
+        return self._async_client
+
+    async def achat(self, model: str, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        res = await self._aclient().chat(model=model, messages=messages, tools=tools)
+        if res.message.tool_calls:
+            res_dict = res.model_dump()
+            return res_dict['message']['content'], res_dict['message']['tool_calls']
+        return res.message.content, []
+
+    async def astream(self, model: str, messages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        async for part in await self._aclient().chat(model=model, messages=messages, stream=True):
+            yield part.message.content or ''
+
+    def embed(self, model: str, texts: List[str]) -> List[List[float]]:
+        return list(self.client.embed(model=model, input=texts).embeddings)
+
+    async def aembed(self, model: str, texts: List[str]) -> List[List[float]]:
+        return list((await self._aclient().embed(model=model, input=texts)).embeddings)
+
+    def close(self) -> None:
+        self.client.close()
+        if self._discovery_client is not None:
+            self._discovery_client.close()
+
+    async def aclose(self) -> None:
+        self.close()
+        if self._async_client is not None and self._async_loop is asyncio.get_running_loop():
+            await self._async_client.close()
+        self._async_client = None
+        self._async_loop = None
@@ -0,0 +1,119 @@
+"""
+Servers that speak the OpenAI chat completions API: OpenAI itself and local
+continuous-batching servers such as vLLM, llama.cpp server and TGI.
+"""
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+import asyncio
+import json
+
+import httpx
+
+from latticepy.engine.interfaces.llminterface import LLMProvider, close_on_loop
+
+# many concurrent generations share a few long-lived connections to the server
+POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+
+
+def tool_calls_from(message: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    OpenAI tool calls in the shape the engine routes: function name and decoded arguments.
+    """
+    calls = []
+    for call in message.get('tool_calls') or []:
+        function = call.get('function', {})
+        arguments = function.get('arguments') or {}
+        if isinstance(arguments, str):
+            arguments = json.loads(arguments) if arguments.strip() else {}
+        calls.append({'id': call.get('id'), 'function': {'name': function.get('name'), 'arguments': arguments}})
+    return calls
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """
+    The url of the connection is the API base, usually ending in /v1.
+    """
+
+    def __init__(self, connection: Dict[str, Any], timeout: float):
+        super().__init__(connection, timeout)
+        self.base_url = (connection.get('url') or 'http://localhost:8000/v1').rstrip('/')
+        self.headers = {'Content-Type': 'application/json'}
+        if connection.get('api_key'):
+            self.headers['Authorization'] = f"Bearer {connection['api_key']}"
+        self.client = httpx.Client(base_url=self.base_url, headers=self.headers, timeout=timeout, limits=POOL_LIMITS)
+        # created on first use, an httpx.AsyncClient is tied to the event loop it runs on
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _aclient(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            if self._async_client is not None:
+                # the client of the previous loop can only be closed on that loop
+                close_on_loop(self._async_client.aclose, self._async_loop, lambda: None, f"client for {self.base_url}")
+            self._async_client = httpx.AsyncClient(base_url=self.base_url, headers=self.headers,
+                                                   timeout=self.timeout, limits=POOL_LIMITS)
+            self._async_loop = loop
+        return self._async_client
+
+    @staticmethod
+    def _body(model: str, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None, stream: bool = False) -> Dict[str, Any]:
+        body: Dict[str, Any] = {'model': model, 'messages': messages}
+        if tools:
+            body['tools'] = tools
+        if stream:
+            body['stream'] = True
+        return body
+
+    @staticmethod
+    def _reply(data: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
+        message = data['choices'][0]['message']
+        return message.get('content') or '', tool_calls_from(message)
+
+    def list_models(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        res = self.client.get('/models', timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT)
+        res.raise_for_status()
+        return [{**item, 'model': item['id']} for item in res.json().get('data', [])]
+
+    def chat(self, model: str, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        res = self.client.post('/chat/completions', json=self._body(model, messages, tools))
+        res.raise_for_status()
+        return self._reply(res.json())
+
+    async def achat(self, model: str, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        res = await self._aclient().post('/chat/completions', json=self._body(model, messages, tools))
+        res.raise_for_status()
+        return self._reply(res.json())
+
+    def embed(self, model: str, texts: List[str]) -> List[List[float]]:
+        res = self.client.post('/embeddings', json={'model': model, 'input': texts})
+        res.raise_for_status()
+        return [item['embedding'] for item in sorted(res.json()['data'], key=lambda item: item.get('index', 0))]
+
+    async def aembed(self, model: str, texts: List[str]) -> List[List[float]]:
+        res = await self._aclient().post('/embeddings', json={'model': model, 'input': texts})
+        res.raise_for_status()
+        return [item['embedding'] for item in sorted(res.json()['data'], key=lambda item: item.get('index', 0))]
+
+    async def astream(self, model: str, messages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        async with self._aclient().stream('POST', '/chat/completions', json=self._body(model, messages, stream=True)) as res:
+            res.raise_for_status()
+            async for line in res.aiter_lines():
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                for choice in json.loads(data).get('choices', []):
+                    piece = (choice.get('delta') or {}).get('content')
+                    if piece:
+                        yield piece
+
+    def close(self) -> None:
+        self.client.close()
+
+    async def aclose(self) -> None:
+        self.client.close()
+        if self._async_client is not None and self._async_loop is asyncio.get_running_loop():
+            await self._async_client.aclose()
+        self._async_client = None
+        self._async_loop = None
@@ -0,0 +1,312 @@
+"""
+Adaptive concurrency limits in front of every LLM connection.
+
+Each connection admits at most `limit` requests at a time; the rest wait in a
+bounded queue until a slot frees up or their deadline passes. The limit adapts
+by AIMD: it grows by one for every `limit` requests completed while saturated
+and within the latency tolerance, and shrinks by `backoff` on errors, timeouts
+included, or when a request takes longer than `latency_tolerance` times the usual
+for its size. A long answer takes long on an idle backend too, so the usual
+latency of each kind of request is kept as a line over its size: the first piece
+of a stream, a complete reply by its output tokens, embeddings by their input.
+A burst therefore queues in the engine instead of overloading the backend.
+"""
+from typing import Optional, Dict, Any, Deque, NamedTuple
+from collections import deque
+from contextlib import asynccontextmanager
+from pydantic import BaseModel
+import asyncio
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LimiterModel(BaseModel):
+    enabled: bool = True
+    initial_limit: int = 4           # concurrent requests per connection before anything is learned
+    min_limit: int = 1
+    max_limit: int = 64
+    max_queue: int = 256             # waiting requests per connection, more are rejected at once
+    queue_timeout: float = 30        # seconds a request may wait for a slot
+    latency_tolerance: float = 2.0   # slower than this times the usual for the request's size counts as overload
+    baseline_samples: int = 5        # uncongested requests of a kind seen before its latency is judged
+    backoff: float = 0.75            # the limit is multiplied by this on overload
+
+
+class BackendBusy(RuntimeError):
+    """
+    The connection is at its limit and the request could not be queued or waited too long.
+    """
+
+
+class Waiter:
+    __slots__ = ("future", "enqueued_at", "meta")
+
+    def __init__(self, future: "asyncio.Future", meta: Optional[Dict[str, Any]] = None):
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.meta = meta or {}
+
+
+class Signal(NamedTuple):
+    kind: str      # first_piece, reply or embed, each has its own baseline
+    size: float    # tokens the latency depends on, 0 for the first piece of a stream
+    ms: float
+
+
+class Sample:
+    """
+    What one request tells its limiter about the backend besides success or failure.
+    """
+    __slots__ = ("started", "signal")
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.signal: Optional[Signal] = None
+
+    def first_piece(self) -> None:
+        # time to the first piece is waiting on the backend, before the length of the answer counts
+        if self.signal is None:
+            self.signal = Signal("first_piece", 0.0, (time.monotonic() - self.started) * 1000)
+
+    def done(self, kind: str, size: float) -> None:
+        """
+        A complete request of size tokens, its latency is judged against the usual for that size.
+        """
+        self.signal = Signal(kind, float(size), (time.monotonic() - self.started) * 1000)
+
+
+class Baseline:
+    """
+    The usual latency of one kind of request as intercept + slope * size, fitted by moving
+    averages over uncongested requests.
+    """
+    __slots__ = ("count", "size", "ms", "size_sq", "size_ms")
+
+    def __init__(self):
+        self.count = 0
+        self.size = self.ms = self.size_sq = self.size_ms = 0.0
+
+    def add(self, size: float, ms: float) -> None:
+        self.count += 1
+        # a plain mean at first, then a slow moving one
+        alpha = max(1.0 / self.count, 0.05)
+        self.size += alpha * (size - self.size)
+        self.ms += alpha * (ms - self.ms)
+        self.size_sq += alpha * (size * size - self.size_sq)
+        self.size_ms += alpha * (size * ms - self.size_ms)
+
+    def line(self) -> "tuple[float, float]":
+        variance = self.size_sq - self.size * self.size
+        slope = max(0.0, (self.size_ms - self.size * self.ms) / variance) if variance > 1e-9 else 0.0
+        intercept = self.ms - slope * self.size
+        if intercept < 0:
+            # never predict less than nothing for small requests
+            intercept, slope = 0.0, (self.ms / self.size if self.size else 0.0)
+        return intercept, slope
+
+    def expected(self, size: float) -> float:
+        intercept, slope = self.line()
+        return intercept + slope * size
+
+
+class BackendLimiter:
+    """
+    Limit and queue of one connection. All methods run on the event loop.
+    """
+
+    def __init__(self, name: str, settings: LimiterModel):
+        self.name = name
+        self.settings = settings
+        self.limit = float(settings.initial_limit)
+        self.in_flight = 0
+        self.waiters: Deque[Waiter] = deque()
+        self.baselines: Dict[str, Baseline] = {}
+        self.admitted = 0
+        self.completed = 0
+        self.errors = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.overloads = 0
+        self.queued_total = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+
+    def _has_slot(self) -> bool:
+        return self.in_flight < max(int(self.limit), self.settings.min_limit)
+
+    def _queued(self) -> int:
+        return len(self.waiters)
+
+    def _next_waiter(self) -> Optional[Waiter]:
+        # first come, first served
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.future.done():
+                return waiter
+        return None
+
+    def _grant(self) -> None:
+        while self._has_slot():
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self.in_flight += 1
+            self.admitted += 1
+            waited = (time.monotonic() - waiter.enqueued_at) * 1000
+            self.wait_ms_total += waited
+            self.wait_ms_max = max(self.wait_ms_max, waited)
+            waiter.future.set_result(waited)
+
+    def _enqueue(self, waiter: Waiter) -> None:
+        self.waiters.append(waiter)
+
+    def _discard(self, waiter: Waiter) -> None:
+        try:
+            self.waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    async def acquire(self, timeout: Optional[float] = None, meta: Optional[Dict[str, Any]] = None) -> float:
+        """
+        Wait for a slot, returns the milliseconds spent queued. Raises BackendBusy when the
+        queue is full or no slot frees up within timeout (queue_timeout by default).
+        """
+        if self._has_slot() and not self._queued():
+            self.in_flight += 1
+            self.admitted += 1
+            return 0.0
+        if self._queued() >= self.settings.max_queue:
+            self.rejected += 1
+            raise BackendBusy(f"Connection {self.name} is busy, {self._queued()} requests are already queued")
+        waiter = Waiter(asyncio.get_running_loop().create_future(), meta)
+        self._enqueue(waiter)
+        self.queued_total += 1
+        try:
+            return await asyncio.wait_for(waiter.future, self.settings.queue_timeout if timeout is None else timeout)
+        except BaseException as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # the slot was granted as the caller gave up, hand it on
+                self.release(None)
+            else:
+                waiter.future.cancel()
+                self._discard(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise BackendBusy(f"Connection {self.name} did not free up within the queue timeout") from None
+            raise
+
+    def release(self, ok: Optional[bool] = True, signal: Optional[Signal] = None) -> None:
+        """
+        Give a slot back; ok and the latency signal of the finished request adapt the limit.
+        ok is None when the caller went away, which says nothing about the backend.
+        """
+        self.in_flight = max(0, self.in_flight - 1)
+        if ok is not None:
+            self._adapt(ok, signal)
+        self._grant()
+
+    def _adapt(self, ok: bool, signal: Optional[Signal]) -> None:
+        s = self.settings
+        if ok:
+            self.completed += 1
+        else:
+            self.errors += 1
+        baseline = None
+        if signal is not None:
+            baseline = self.baselines.get(signal.kind)
+            if baseline is None:
+                baseline = self.baselines[signal.kind] = Baseline()
+        slow = (baseline is not None and baseline.count >= s.baseline_samples
+                and signal.ms > s.latency_tolerance * baseline.expected(signal.size))
+        if not ok or slow:
+            self.overloads += 1
+            self.limit = max(float(s.min_limit), self.limit * s.backoff)
+            return
+        if baseline is not None:
+            # only uncongested requests move the baseline, so overload cannot raise its own threshold
+            baseline.add(signal.size, signal.ms)
+        # grow only while the limit is what holds requests back
+        if self.in_flight + 1 >= int(self.limit) or self._queued():
+            self.limit = min(float(s.max_limit), self.limit + 1.0 / self.limit)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = self.admitted
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": self._queued(),
+            "max_queue": self.settings.max_queue,
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "errors": self.errors,
+            "overloads": self.overloads,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_ms_avg": round(self.wait_ms_total / waits, 2) if waits else None,
+            "wait_ms_max": round(self.wait_ms_max, 2),
+            "baselines": {
+                kind: {"samples": b.count, "ms": round(b.line()[0], 2), "ms_per_token": round(b.line()[1], 4)}
+                for kind, b in sorted(self.baselines.items())
+            },
+        }
+
+
+class BackendLimits:
+    """
+    One BackendLimiter per connection id.
+    """
+    settings: LimiterModel = LimiterModel()
+    limiter_class = BackendLimiter
+    _limiters: Dict[str, BackendLimiter] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, settings: LimiterModel) -> None:
+        cls.settings = settings
+        with cls._lock:
+            cls._limiters.clear()
+
+    @classmethod
+    def get(cls, conid: str) -> BackendLimiter:
+        with cls._lock:
+            limiter = cls._limiters.get(conid)
+            if limiter is None:
+                limiter = cls._limiters[conid] = cls.limiter_class(conid, cls.settings)
+            return limiter
+
+    @classmethod
+    @asynccontextmanager
+    async def slot(cls, conid: str, meta: Optional[Dict[str, Any]] = None):
+        """
+        Hold one of the connection's slots for the duration of the block, which gets the
+        request's Sample to mark the first piece of a stream, or the size of a complete request, on.
+        Raising inside the block counts as an error of the backend, except for cancellation.
+        """
+        if not cls.settings.enabled:
+            yield Sample()
+            return
+        limiter = cls.get(conid)
+        await limiter.acquire(meta=meta)
+        # timed from the grant, time in the queue is the engine's, not the backend's
+        sample = Sample()
+        outcome: Optional[bool] = True
+        try:
+            yield sample
+        except (asyncio.CancelledError, GeneratorExit):
+            # the caller went away, that says nothing about the backend
+            outcome = None
+            raise
+        except Exception:
+            outcome = False
+            raise
+        finally:
+            limiter.release(outcome, sample.signal)
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        with cls._lock:
+            limiters = dict(cls._limiters)
+        return {name: limiter.stats() for name, limiter in sorted(limiters.items())}
@@ -0,0 +1,189 @@
+"""
+Bulk NDJSON import and export of the engine catalogs.
+
+Imports validate every line on its own and report failures per line; the valid rows
+are written with executemany inside one transaction. Exports stream rows straight
+from a cursor on a dedicated read connection, so the table is never loaded at once.
+"""
+from pydantic import BaseModel, ValidationError
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Literal, NamedTuple, Optional, Tuple, Type
+import json
+import logging
+
+from latticepy.engine.services.localdatabase import LocalDatabase
+from latticepy.engine.interfaces.clientinterface import ConnectionModel, PromptModel, LlmConnections, Promptlist
+from latticepy.engine.interfaces.agentinterface import LatticeAgent
+from latticepy.engine.interfaces.serverinterface import ToolServer, servertooldata
+
+logger = logging.getLogger(__name__)
+
+ConflictMode = Literal['error', 'skip', 'replace']
+
+
+class BulkKind(NamedTuple):
+    table: str
+    columns: List[str]
+    model: Type[BaseModel]
+    to_row: Callable[[Any], Tuple]
+    from_row: Callable[[Any], Dict[str, Any]]
+    catalog: Optional[Any] = None   # Data subclass whose snapshot must be dropped after an import
+    refresh: Optional[Callable[[], None]] = None   # reloads an in-memory view of the table, may call out over the network
+
+
+def _plain_row(columns):
+    def to_row(item):
+        data = item.model_dump()
+        return tuple(data[col] for col in columns)
+    return to_row
+
+
+BULK_KINDS: Dict[str, BulkKind] = {
+    'prompts': BulkKind(
+        table='prompts', columns=['id', 'prompt'], model=PromptModel,
+        to_row=_plain_row(['id', 'prompt']), from_row=lambda row: {**row}, catalog=Promptlist),
+    'connections': BulkKind(
+        table='connections', columns=['id', 'source', 'url', 'api_key'], model=ConnectionModel,
+        to_row=_plain_row(['id', 'source', 'url', 'api_key']), from_row=lambda row: {**row}, catalog=LlmConnections),
+    'toolservers': BulkKind(
+        table='toolservers', columns=['id', 'url', 'details'], model=ToolServer,
+        to_row=lambda item: (item.id, item.url, json.dumps(item.details)),
+        from_row=lambda row: {'id': row['id'], 'url': row['url'], 'details': json.loads(row['details']) if row['details'] else None},
+        refresh=servertooldata.refresh),
+    'agents': BulkKind(
+        table='latticeagents', columns=['id', 'prompt', 'tools', 'details'], model=LatticeAgent,
+        to_row=lambda item: item.to_record(), from_row=LatticeAgent.from_record),
+}
+
+
+def get_kind(kind: str) -> BulkKind:
+    if kind not in BULK_KINDS:
+        raise ValueError(f"Unknown bulk kind {kind}, expected one of {', '.join(BULK_KINDS)}")
+    return BULK_KINDS[kind]
+
+
+class BulkImport:
+    """
+    Collects validated rows from NDJSON lines, then writes them in a single transaction.
+    feed() holds no database lock, so a slow upload never blocks other writers.
+    """
+
+    def __init__(self, kind: str, on_conflict: ConflictMode = 'error', atomic: bool = False):
+        self.kind = get_kind(kind)
+        self.on_conflict = on_conflict
+        self.atomic = atomic
+        self.rows: List[Tuple] = []
+        self.lines: List[int] = []      # source line of every buffered row
+        self.errors: List[Dict[str, Any]] = []
+        self.seen: Dict[str, int] = {}  # id -> first line it appeared on
+        self.line_no = 0
+        self.received = 0
+
+    def _error(self, line: int, row_id: Optional[str], error: str) -> None:
+        self.errors.append({'line': line, 'id': row_id, 'error': error})
+
+    def feed(self, lines: Iterable[Any]) -> None:
+        for raw in lines:
+            self.line_no += 1
+            if isinstance(raw, bytes):
+                raw = raw.decode('utf-8')
+            raw = raw.strip()
+            if not raw:
+                continue
+            self.received += 1
+            row_id = None
+            try:
+                payload = json.loads(raw)
+                row_id = payload.get('id') if isinstance(payload, dict) else None
+                item = self.kind.model.model_validate(payload)
+                row = self.kind.to_row(item)
+            except ValidationError as e:
+                self._error(self.line_no, row_id, f"validation failed: {e.errors(include_url=False)}")
+                continue
+            except Exception as e:
+                self._error(self.line_no, row_id, str(e))
+                continue
+            if row[0] in self.seen:
+                self._error(self.line_no, row_id, f"duplicate id, first seen on line {self.seen[row[0]]}")
+                continue
+            self.seen[row[0]] = self.line_no
+            self.rows.append(row)
+            self.lines.append(self.line_no)
+
+    def commit(self, batch_size: int = 500) -> Dict[str, Any]:
+        """
+        Write the buffered rows and return the import report.
+        """
+        table = self.kind.table
+        columns = ", ".join(self.kind.columns)
+        placeholders = ", ".join(["?"] * len(self.kind.columns))
+        verb = {'error': 'INSERT', 'skip': 'INSERT OR IGNORE', 'replace': 'INSERT OR REPLACE'}[self.on_conflict]
+        sql = f"{verb} INTO {table} ({columns}) VALUES ({placeholders})"
+        written = 0
+        attempted = 0
+        cur = LocalDatabase.connect()
+        conn = cur.connection
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            rows = self.rows
+            if self.on_conflict == 'error':
+                rows = self._drop_existing(cur, batch_size)
+            if self.atomic and self.errors:
+                conn.rollback()
+                logger.warning(f"Bulk import into {table} rolled back, {len(self.errors)} rows failed")
+                return self.report(0, 0, rolled_back=True)
+            for start in range(0, len(rows), batch_size):
+                cur.executemany(sql, rows[start:start + batch_size])
+                written += cur.rowcount
+            attempted = len(rows)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Bulk import into {table} failed: {e}")
+            raise ValueError(f"Bulk import into {table} failed: {e}")
+        if self.kind.catalog is not None:
+            self.kind.catalog.invalidate()
+        logger.info(f"Bulk import into {table}: {written} rows written, {len(self.errors)} errors")
+        return self.report(written, attempted)
+
+    def _drop_existing(self, cur, batch_size: int) -> List[Tuple]:
+        existing = set()
+        ids = [row[0] for row in self.rows]
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            marks = ", ".join(["?"] * len(chunk))
+            existing.update(r[0] for r in cur.execute(f"SELECT id FROM {self.kind.table} WHERE id IN ({marks})", chunk))
+        rows = []
+        for row, line in zip(self.rows, self.lines):
+            if row[0] in existing:
+                self._error(line, row[0], "already exists")
+            else:
+                rows.append(row)
+        return rows
+
+    def report(self, written: int, attempted: int, rolled_back: bool = False) -> Dict[str, Any]:
+        return {
+            'kind': self.kind.table,
+            'received': self.received,
+            'written': written,
+            'skipped': attempted - written,   # rows ignored by on_conflict=skip
+            'failed': len(self.errors),
+            'rolled_back': rolled_back,
+            'errors': sorted(self.errors, key=lambda e: e['line']),
+        }
+
+
+def export_ndjson(kind: str, batch_size: int = 500) -> Iterator[bytes]:
+    """
+    Yield one NDJSON line per row, reading the table in batches from a private cursor.
+    """
+    spec = get_kind(kind)
+    conn = LocalDatabase.open_reader()
+    try:
+        cur = conn.execute(f"SELECT {', '.join(spec.columns)} FROM {spec.table} ORDER BY id")
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield b"".join(json.dumps(spec.from_row(row)).encode('utf-8') + b"\n" for row in rows)
+    finally:
+        conn.close()
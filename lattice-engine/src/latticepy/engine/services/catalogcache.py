@@ -0,0 +1,55 @@
+"""
+Last known copies of catalogs that are expensive to rebuild, such as the models
+discovered on every LLM connection and the tools listed by every tool server.
+
+They are loaded when the engine starts so requests are served right away, while
+the live catalogs are revalidated in the background.
+"""
+from typing import Any, Optional, Tuple
+import json
+import time
+import logging
+
+from latticepy.engine.services.localdatabase import LocalDatabase
+
+logger = logging.getLogger(__name__)
+
+
+def save_catalog(name: str, payload: Any) -> bool:
+    """
+    Store payload as the last known copy of catalog name. Returns False when it was unchanged,
+    in which case only the timestamp moves.
+    """
+    text = json.dumps(payload, sort_keys=True)
+    cur = LocalDatabase.connect()
+    try:
+        row = cur.execute("SELECT payload FROM catalog_cache WHERE name = ?", (name,)).fetchone()
+        if row and row["payload"] == text:
+            cur.execute("UPDATE catalog_cache SET saved_at = ? WHERE name = ?", (time.time(), name))
+            cur.connection.commit()
+            return False
+        cur.execute(
+            "INSERT OR REPLACE INTO catalog_cache (name, saved_at, payload) VALUES (?, ?, ?)", (name, time.time(), text)
+        )
+        cur.connection.commit()
+    except Exception as e:
+        cur.connection.rollback()
+        logger.error(f"Error saving the {name} catalog: {e}")
+        return False
+    return True
+
+
+def load_catalog(name: str) -> Optional[Tuple[float, Any]]:
+    """
+    The last stored copy of catalog name and when it was saved, or None.
+    """
+    try:
+        row = LocalDatabase.connect().execute(
+            "SELECT saved_at, payload FROM catalog_cache WHERE name = ?", (name,)
+        ).fetchone()
+    except Exception as e:
+        logger.error(f"Error loading the {name} catalog: {e}")
+        return None
+    if not row:
+        return None
+    return row["saved_at"], json.loads(row["payload"])
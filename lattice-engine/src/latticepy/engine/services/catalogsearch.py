@@ -0,0 +1,74 @@
+"""
+Ranked full text search over prompts, agents and tools.
+
+The FTS5 indexes are created and kept in sync by triggers in services/migrations.py.
+Results carry ids, scores and a short snippet, never the full records.
+"""
+from typing import Dict, Any, List, NamedTuple, Tuple
+import re
+import logging
+
+from latticepy.engine.services.localdatabase import LocalDatabase
+
+logger = logging.getLogger(__name__)
+
+_TOKENS = re.compile(r"\w+", re.UNICODE)
+
+
+class SearchKind(NamedTuple):
+    table: str
+    weights: Tuple[float, ...]  # bm25 weight per indexed column, ids and names count more than body text
+    snippet_column: int
+    id_prefix: str = ""
+
+
+SEARCH_KINDS: Dict[str, SearchKind] = {
+    "prompts": SearchKind("prompts", (5.0, 1.0), 1),
+    "agents": SearchKind("latticeagents", (5.0, 1.0), 1, id_prefix="AGENT_"),
+    "tools": SearchKind("tools", (2.0, 5.0, 1.0), 2),
+}
+
+
+def get_search_kind(name: str) -> SearchKind:
+    if name not in SEARCH_KINDS:
+        raise ValueError(f"Unknown search kind {name}, expected one of {', '.join(SEARCH_KINDS)}")
+    return SEARCH_KINDS[name]
+
+
+def fts_query(text: str) -> str:
+    """
+    Turn free text into an FTS5 query: every word must match, the last one as a prefix.
+    Words are quoted so FTS5 operators in the input are treated as plain text.
+    """
+    words = _TOKENS.findall(text or "")
+    if not words:
+        raise ValueError("Search text must contain at least one word")
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(kind: str, text: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    Best matches of text in one catalog, best first.
+    """
+    spec = get_search_kind(kind)
+    fts = f"{spec.table}_fts"
+    weights = ", ".join(str(w) for w in spec.weights)
+    rows = LocalDatabase.connect().execute(
+        f"SELECT id, bm25({fts}, {weights}) AS score, snippet({fts}, {spec.snippet_column}, '[', ']', '...', 12) AS snippet "
+        f"FROM {fts} WHERE {fts} MATCH ? ORDER BY score LIMIT ?",
+        (fts_query(text), max(1, min(int(limit), 200)))
+    ).fetchall()
+    results = []
+    for row in rows:
+        item_id = row["id"]
+        if spec.id_prefix and item_id.startswith(spec.id_prefix):
+            item_id = item_id[len(spec.id_prefix):]
+        # bm25 is lower for better matches, flip it so higher reads as better
+        results.append({"id": item_id, "score": round(-row["score"], 4), "snippet": row["snippet"]})
+    return results
+
+
+def search_all(text: str, limit: int = 20) -> Dict[str, List[Dict[str, Any]]]:
+    return {kind: search(kind, text, limit) for kind in SEARCH_KINDS}
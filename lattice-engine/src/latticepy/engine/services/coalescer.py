@@ -0,0 +1,117 @@
+"""
+Coalescing of identical in-flight chat requests.
+
+When several requests with the same model, agent, messages and options arrive while
+the first is still running, they all wait for that one execution instead of starting
+their own. Only requests of the same priority class share an execution, which runs
+with the class of the request that started it. Streaming requests subscribe to the same token stream; a subscriber that
+joins late first receives the pieces already sent.
+"""
+from typing import Optional, Dict, Any, List, Callable, Awaitable, AsyncIterator, Tuple
+import asyncio
+import logging
+
+from latticepy.engine.services.responsecache import cache_key
+
+logger = logging.getLogger(__name__)
+
+
+def request_key(model: str, agent: Optional[str], messages: List[Dict[str, Any]],
+                options: Optional[Dict[str, Any]] = None, format: Optional[str] = None, stream: bool = False,
+                priority: str = "") -> str:
+    # streamed and complete replies come from different pipelines, they are never shared with each other;
+    # nor is a batch request's execution with an interactive one, which would wait in the batch queue
+    return ("stream:" if stream else "reply:") + priority + ":" + cache_key(model, agent, None, messages, options, format)
+
+
+class Broadcast:
+    """
+    One token stream with any number of subscribers, each receiving every piece from the start.
+    """
+
+    def __init__(self, source: AsyncIterator[str]):
+        self.pieces: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[str]) -> None:
+        try:
+            async for piece in source:
+                self.pieces.append(piece)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        sent = 0
+        while True:
+            changed = self._changed
+            while sent < len(self.pieces):
+                yield self.pieces[sent]
+                sent += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+class RequestCoalescer:
+    _replies: Dict[str, "asyncio.Future"] = {}
+    _streams: Dict[str, Broadcast] = {}
+    _counters: Dict[str, int] = {"executions": 0, "coalesced": 0, "stream_executions": 0, "stream_coalesced": 0}
+
+    @classmethod
+    async def run(cls, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Result of factory(), shared with every concurrent call for the same key.
+        Returns (result, shared), shared is True when another request did the work.
+        A caller that goes away does not cancel the execution the others wait for.
+        """
+        flight = cls._replies.get(key)
+        if flight is not None:
+            cls._counters["coalesced"] += 1
+            return await asyncio.shield(flight), True
+        flight = asyncio.ensure_future(factory())
+        cls._replies[key] = flight
+        flight.add_done_callback(lambda _: cls._replies.pop(key, None))
+        cls._counters["executions"] += 1
+        return await asyncio.shield(flight), False
+
+    @classmethod
+    def stream(cls, key: str, factory: Callable[[], AsyncIterator[str]]) -> Tuple[AsyncIterator[str], bool]:
+        """
+        A subscription to the running stream for key, or to a new one started from factory().
+        """
+        broadcast = cls._streams.get(key)
+        if broadcast is not None and not broadcast.done:
+            cls._counters["stream_coalesced"] += 1
+            return broadcast.subscribe(), True
+        broadcast = Broadcast(factory())
+        cls._streams[key] = broadcast
+        broadcast.task.add_done_callback(lambda _: cls._streams.pop(key, None) if cls._streams.get(key) is broadcast else None)
+        cls._counters["stream_executions"] += 1
+        return broadcast.subscribe(), False
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        requests = sum(cls._counters.values())
+        shared = cls._counters["coalesced"] + cls._counters["stream_coalesced"]
+        return {
+            **cls._counters,
+            "in_flight": len(cls._replies) + len(cls._streams),
+            "coalesced_ratio": round(shared / requests, 4) if requests else None,
+        }
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        cls._counters = dict.fromkeys(cls._counters, 0)
@@ -1,8 +1,14 @@
-from typing import Optional, Dict
+from typing import Optional, Dict, Any, Literal, Callable, List
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel
 import os
+import re
 import sys
+import time
 import sqlite3
+import asyncio
+import functools
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,22 +16,385 @@ logger = logging.getLogger(__name__)
 class LocalDBModel(BaseModel):
     name: str
     db: Optional[str] = "sqlite3"
-    url_path: str 
+    url_path: str
     password: Optional[str] = None
+    # connection tuning, applied to every pooled connection
+    journal_mode: Optional[Literal['WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY']] = 'WAL'
+    synchronous: Optional[Literal['OFF', 'NORMAL', 'FULL', 'EXTRA']] = 'NORMAL'
+    cache_size: Optional[int] = -16000        # negative values are KiB, positive values are pages
+    mmap_size: Optional[int] = 268435456      # bytes, 0 disables memory mapped I/O
+    busy_timeout: Optional[int] = 5000        # milliseconds to wait on a locked database
+    executor_workers: Optional[int] = 4       # threads serving database calls for async endpoints
+    query_stats: Optional[bool] = True        # time every statement run through pooled connections
+    slow_query_ms: Optional[float] = 100      # log statements slower than this, None disables the log
+
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """
+    Collapse a statement to its shape: literals become ?, IN lists become (...), whitespace is folded.
+    """
+    sql = _LITERALS.sub("?", " ".join(sql.split()))
+    return _IN_LISTS.sub("IN (...)", sql)
+
+
+def param_shape(params: Any) -> str:
+    """
+    Types of the bind parameters, without their values.
+    """
+    def describe(value):
+        if isinstance(value, (str, bytes)):
+            return f"{type(value).__name__}[{len(value)}]"
+        return type(value).__name__
+    if not params:
+        return "()"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {describe(v)}" for k, v in params.items()) + "}"
+    return "(" + ", ".join(describe(v) for v in params) + ")"
+
+
+class QueryStats:
+    """
+    Process wide timing of SQL statements, keyed by normalized statement.
+    """
+    _lock = threading.Lock()
+    _stats: Dict[str, List] = {}   # sql -> [calls, total seconds, max seconds, rows]
+    slow_query_ms: Optional[float] = 100
+
+    @classmethod
+    def add(cls, sql: str, calls: int, elapsed: float, rows: int, statement_elapsed: float) -> None:
+        with cls._lock:
+            entry = cls._stats.get(sql)
+            if entry is None:
+                entry = cls._stats[sql] = [0, 0.0, 0.0, 0]
+            entry[0] += calls
+            entry[1] += elapsed
+            entry[2] = max(entry[2], statement_elapsed)
+            entry[3] += rows
+
+    @classmethod
+    def report(cls, order: str = "total", limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        keys = {"total": 1, "max": 2, "calls": 0, "rows": 3}
+        if order not in keys:
+            raise ValueError(f"order must be one of {', '.join(keys)}")
+        with cls._lock:
+            items = sorted(cls._stats.items(), key=lambda item: item[1][keys[order]], reverse=True)
+        return [
+            {
+                "sql": sql, "calls": calls, "rows": rows,
+                "total_ms": round(total * 1000, 3), "avg_ms": round(total * 1000 / calls, 3) if calls else 0.0,
+                "max_ms": round(longest * 1000, 3),
+            }
+            for sql, (calls, total, longest, rows) in items[:limit]
+        ]
+
+    @classmethod
+    def reset(cls) -> None:
+        with cls._lock:
+            cls._stats.clear()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor that adds the time spent in execute and fetch calls, and the rows fetched,
+    to QueryStats under the normalized statement. They are counted on the cursor and
+    added once per statement, when its rows are exhausted, the next statement starts
+    or the cursor is closed, so large scans do not take the QueryStats lock per row.
+    """
+    _sql: Optional[str] = None
+    _shape: str = "()"
+    _elapsed = 0.0
+    _calls = 0
+    _rows = 0
+    _logged = False
+
+    def _begin(self, sql: str, shape: str) -> None:
+        self._flush()
+        self._sql = normalize_sql(sql)
+        self._shape = shape
+        self._elapsed = 0.0
+        self._calls = 0
+        self._rows = 0
+        self._logged = False
+
+    def _account(self, elapsed: float, rows: int, calls: int = 0, done: bool = False) -> None:
+        if self._sql is None:
+            return
+        self._elapsed += elapsed
+        self._calls += calls
+        self._rows += rows
+        threshold = QueryStats.slow_query_ms
+        if threshold is not None and not self._logged and self._elapsed * 1000 >= threshold:
+            self._logged = True
+            logger.warning(f"Slow query ({self._elapsed * 1000:.1f} ms): {self._sql} params {self._shape}")
+        if done:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._sql is not None:
+            QueryStats.add(self._sql, self._calls, self._elapsed, self._rows, self._elapsed)
+            self._sql = None
+
+    def close(self):
+        self._flush()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._flush()
+        except Exception:
+            pass
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, param_shape(parameters))
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            # statements without a result set are done once executed
+            self._account(time.perf_counter() - started, 0, calls=1, done=self.description is None)
+
+    def executemany(self, sql, seq_of_parameters):
+        if isinstance(seq_of_parameters, (list, tuple)):
+            first = seq_of_parameters[0] if seq_of_parameters else ()
+            shape = f"{len(seq_of_parameters)} x {param_shape(first)}"
+        else:
+            shape = "iterator"
+        self._begin(sql, shape)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._account(time.perf_counter() - started, 0, calls=1, done=True)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._account(time.perf_counter() - started, 0 if row is None else 1, done=row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._account(time.perf_counter() - started, len(rows), done=len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._account(time.perf_counter() - started, len(rows), done=True)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._account(time.perf_counter() - started, 0, done=True)
+            raise
+        self._account(time.perf_counter() - started, 1)
+        return row
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    Connection whose cursors, and shortcut execute calls, are TimedCursors.
+    """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            elapsed = time.perf_counter() - started
+            QueryStats.add("COMMIT", 1, elapsed, 0, elapsed)
+
+
+class ConnectionPool:
+    """
+    Hands out one long-lived sqlite3 connection per thread.
+    Connections are opened lazily, tuned once with the pragmas from LocalDBModel
+    and reused for every later call made from the same thread.
+    """
+
+    def __init__(self, db_path: str, settings: Optional[LocalDBModel] = None):
+        self.db_path = db_path
+        self.settings = settings
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: Dict[int, Any] = {}   # thread ident -> (thread, connection)
+        self._opened = 0
+        self._closed = 0
+        self._reused = 0
+        self._rolled_back = 0
+
+    def _configure(self, conn: sqlite3.Connection) -> None:
+        settings = self.settings
+        if settings is None:
+            settings = LocalDBModel(name=os.path.basename(self.db_path), url_path=os.path.dirname(self.db_path))
+        conn.execute(f"PRAGMA busy_timeout = {int(settings.busy_timeout or 0)}")
+        # INSERT OR REPLACE only fires delete triggers with this on, the full text indexes depend on them
+        conn.execute("PRAGMA recursive_triggers = ON")
+        if settings.journal_mode:
+            mode = conn.execute(f"PRAGMA journal_mode = {settings.journal_mode}").fetchone()[0]
+            if mode.upper() != settings.journal_mode:
+                logger.warning(f"Requested journal_mode {settings.journal_mode}, database is using {mode}")
+        if settings.synchronous:
+            conn.execute(f"PRAGMA synchronous = {settings.synchronous}")
+        if settings.cache_size is not None:
+            conn.execute(f"PRAGMA cache_size = {int(settings.cache_size)}")
+        if settings.mmap_size is not None:
+            conn.execute(f"PRAGMA mmap_size = {int(settings.mmap_size)}")
+
+    def _open(self) -> sqlite3.Connection:
+        settings = self.settings
+        timeout = (settings.busy_timeout if settings and settings.busy_timeout is not None else 5000) / 1000
+        factory = TimedConnection if settings is None or settings.query_stats else sqlite3.Connection
+        # the pool guarantees thread affinity itself; disabling the check lets close_all() run from any thread
+        conn = sqlite3.connect(self.db_path, timeout=timeout, check_same_thread=False, factory=factory)
+        conn.row_factory = sqlite3.Row
+        self._configure(conn)
+        return conn
+
+    def _prune(self) -> None:
+        """
+        Close connections owned by threads that have exited. Caller holds the lock.
+        """
+        for ident, (thread, conn) in list(self._connections.items()):
+            if not thread.is_alive():
+                conn.close()
+                self._closed += 1
+                del self._connections[ident]
+
+    def _reset_after_fork(self) -> None:
+        # connections must never be shared with a forked child, drop the inherited ones without closing them
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {}
+
+    def acquire(self) -> sqlite3.Connection:
+        """
+        Return the connection bound to the calling thread, opening it on first use.
+        """
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self.reset()
+            with self._lock:
+                self._reused += 1
+            return conn
+        conn = self._open()
+        self._local.conn = conn
+        with self._lock:
+            self._prune()
+            self._connections[threading.get_ident()] = (threading.current_thread(), conn)
+            self._opened += 1
+        logger.debug(f"Opened pooled connection to {self.db_path} for thread {threading.current_thread().name}")
+        return conn
+
+    def rollback(self) -> bool:
+        """
+        Roll back the open transaction of the calling thread's connection, if any.
+        Returns whether there was one.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or not conn.in_transaction:
+            return False
+        conn.rollback()
+        return True
+
+    def reset(self) -> None:
+        """
+        Roll back a transaction the calling thread's connection was left in, such as by a
+        failed write; its write lock would block every other connection until this thread
+        used the database again.
+        """
+        if not self.rollback():
+            return
+        with self._lock:
+            self._rolled_back += 1
+        logger.warning(f"Rolled back a transaction left open on thread {threading.current_thread().name}")
+
+    def release(self) -> None:
+        """
+        Close the connection owned by the calling thread, if any.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._lock:
+            self._connections.pop(threading.get_ident(), None)
+            conn.close()
+            self._closed += 1
+
+    def close_all(self) -> None:
+        """
+        Close every connection in the pool, used on shutdown.
+        """
+        with self._lock:
+            for thread, conn in self._connections.values():
+                try:
+                    conn.close()
+                except sqlite3.Error as e:
+                    logger.warning(f"Error closing connection for thread {thread.name}: {e}")
+                self._closed += 1
+            self._connections.clear()
+        self._local = threading.local()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._prune()
+            return {
+                "db_path": self.db_path,
+                "open_connections": len(self._connections),
+                "opened": self._opened,
+                "closed": self._closed,
+                "reused": self._reused,
+                "rolled_back": self._rolled_back,   # transactions found left open by a failed write
+                "threads": sorted(thread.name for thread, _ in self._connections.values()),
+            }
+
 
 class LocalDatabase:
+    settings: Optional[LocalDBModel] = None
+    _pool: Optional[ConnectionPool] = None
+    _pool_lock = threading.Lock()
+    _executor: Optional[ThreadPoolExecutor] = None
+
     def __init__(self, db: LocalDBModel):
-        
+
         """
         Initialize the local database with a given path.
         """
-        
+
         if db.db == "sqlite3":
             self.db_path = os.path.join(db.url_path, db.name)
             if not os.path.exists(self.db_path):
                 try:
                     os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-                    sqlite3.connect(self.db_path).close()
+                    conn = sqlite3.connect(self.db_path)
+                    # must be set before the first table exists, lets freed pages be reclaimed in small steps
+                    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                    conn.execute("VACUUM")
+                    conn.close()
                     logger.info(f"Database created at {self.db_path}")
                 except OSError as e:
                     logger.error(f"Error creating database: {e}")
@@ -40,6 +409,7 @@ class LocalDatabase:
         self.db_name = db.name
         self.db_url = db.url_path
         self.db_password = db.password
+        LocalDatabase.configure(db)
 
     @classmethod
     def new_db( cls, dbconfig: LocalDBModel):
@@ -47,15 +417,106 @@ class LocalDatabase:
         Create a new local database at the specified path.
         """
         pass
-    
+
+    @classmethod
+    def configure(cls, db: LocalDBModel) -> None:
+        """
+        Use the given settings for connections opened from now on.
+        Connections opened with the previous settings are closed.
+        """
+        with cls._pool_lock:
+            cls.settings = db
+            QueryStats.slow_query_ms = db.slow_query_ms
+            if cls._pool is not None:
+                cls._pool.close_all()
+                cls._pool = None
+
+    @classmethod
+    def pool(cls) -> ConnectionPool:
+        """
+        Return the process wide connection pool, creating it on first use.
+        """
+        if cls._pool is None:
+            with cls._pool_lock:
+                if cls._pool is None:
+                    if cls.settings is not None:
+                        db_path = os.path.join(cls.settings.url_path, cls.settings.name)
+                    else:
+                        db_path = os.environ.get("LATTICE_DB_PATH")
+                    if not db_path:
+                        raise RuntimeError("LATTICE_DB_PATH is not set and the local database is not configured.")
+                    cls._pool = ConnectionPool(db_path, cls.settings)
+        return cls._pool
+
     @staticmethod
     def connect():
-        db_path=os.environ.get("LATTICE_DB_PATH")
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
+        conn = LocalDatabase.pool().acquire()
         cur = conn.cursor()
         return cur
-    
+
+    @classmethod
+    def rollback(cls) -> None:
+        """
+        Undo the failed unit of work of the calling thread, so its write lock is released at once.
+        """
+        cls.pool().rollback()
+
+    @classmethod
+    def open_reader(cls) -> sqlite3.Connection:
+        """
+        Open a tuned connection outside the pool for long running reads such as exports.
+        It is not bound to a thread; the caller must close it.
+        """
+        return cls.pool()._open()
+
+    @classmethod
+    def executor(cls) -> ThreadPoolExecutor:
+        """
+        Return the bounded thread pool that serves database calls for async code.
+        Every worker keeps its own pooled connection.
+        """
+        if cls._executor is None:
+            with cls._pool_lock:
+                if cls._executor is None:
+                    workers = (cls.settings.executor_workers if cls.settings else None) or 4
+                    cls._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lattice-db")
+        return cls._executor
+
+    @classmethod
+    async def run(cls, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Await a blocking database call without stalling the event loop.
+        A transaction the call leaves open is rolled back before the worker is handed on.
+        """
+        def unit():
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                cls.pool().reset()
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(cls.executor(), unit)
+
+    @classmethod
+    def close_all(cls) -> None:
+        """
+        Close all pooled connections, called when the engine shuts down.
+        """
+        with cls._pool_lock:
+            executor, cls._executor = cls._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with cls._pool_lock:
+            if cls._pool is not None:
+                cls._pool.close_all()
+                cls._pool = None
+
+    @classmethod
+    def pool_stats(cls) -> Dict[str, Any]:
+        if cls._pool is None:
+            return {"db_path": None, "open_connections": 0, "opened": 0, "closed": 0, "reused": 0, "threads": []}
+        return cls._pool.stats()
+
     @staticmethod
     def create_tables(table_name: str, columns: Dict[str, str]):
         columns_str = ", ".join([f"{col} {typ}" for col, typ in columns.items()])
@@ -77,4 +538,4 @@ class LocalDatabase:
         """
         Disconnect from the local database.
         """
-        pass
\ No newline at end of file
+        LocalDatabase.close_all()
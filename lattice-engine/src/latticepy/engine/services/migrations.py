@@ -0,0 +1,179 @@
+"""
+Versioned schema migrations for the engine database.
+
+Every migration is applied once, in order, inside its own transaction and recorded
+in the schema_version table. Add new migrations to the end of MIGRATIONS; never
+edit one that has shipped.
+"""
+from typing import List, NamedTuple
+from datetime import datetime, timezone
+import logging
+
+from latticepy.engine.services.localdatabase import LocalDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    statements: List[str]
+
+
+def _track_changes(table_name: str) -> List[str]:
+    """
+    Statements that keep catalog_versions.<table_name> bumped on every write to the table.
+    """
+    statements = [f"INSERT OR IGNORE INTO catalog_versions (name, version) VALUES ('{table_name}', 0)"]
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        statements.append(
+            f"CREATE TRIGGER IF NOT EXISTS {table_name}_{event.lower()}_version AFTER {event} ON {table_name} "
+            f"BEGIN UPDATE catalog_versions SET version = version + 1 WHERE name = '{table_name}'; END"
+        )
+    return statements
+
+
+def _full_text_index(table_name: str, columns: List[str]) -> List[str]:
+    """
+    Statements for an external content FTS5 index <table_name>_fts over columns, kept in sync by triggers.
+    The index stores only tokens, the text itself stays in table_name.
+    """
+    fts = f"{table_name}_fts"
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table_name}', content_rowid='rowid', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {table_name}_fts_insert AFTER INSERT ON {table_name} "
+        f"BEGIN INSERT INTO {fts} (rowid, {cols}) VALUES (new.rowid, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table_name}_fts_delete AFTER DELETE ON {table_name} "
+        f"BEGIN INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.rowid, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table_name}_fts_update AFTER UPDATE ON {table_name} "
+        f"BEGIN INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.rowid, {old}); "
+        f"INSERT INTO {fts} (rowid, {cols}) VALUES (new.rowid, {new}); END",
+        # index the rows that already exist
+        f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+    ]
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "catalog tables", [
+        # IF NOT EXISTS adopts databases created before migrations existed
+        "CREATE TABLE IF NOT EXISTS connections (id TEXT PRIMARY KEY, source TEXT, url TEXT, api_key TEXT)",
+        "CREATE TABLE IF NOT EXISTS prompts (id TEXT PRIMARY KEY, prompt TEXT)",
+        "CREATE TABLE IF NOT EXISTS vectordb (id TEXT PRIMARY KEY, db TEXT, url TEXT, password TEXT, tablename TEXT)",
+        "CREATE TABLE IF NOT EXISTS latticeagents (id TEXT PRIMARY KEY, prompt TEXT, tools TEXT, details TEXT)",
+        "CREATE TABLE IF NOT EXISTS toolservers (id TEXT PRIMARY KEY, url TEXT, details TEXT)",
+    ]),
+    Migration(2, "catalog change counters", [
+        # looked up by name on every cached catalog read, a clustered key keeps it to one b-tree probe
+        "CREATE TABLE IF NOT EXISTS catalog_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID",
+        *_track_changes("connections"),
+        *_track_changes("prompts"),
+        *_track_changes("vectordb"),
+    ]),
+    Migration(3, "conversation memory", [
+        "CREATE TABLE IF NOT EXISTS conversation_sessions ("
+        " session_id TEXT PRIMARY KEY, agent TEXT, last_seq INTEGER NOT NULL DEFAULT 0, updated_at INTEGER NOT NULL"
+        ") WITHOUT ROWID",
+        # retention deletes by idle time
+        "CREATE INDEX IF NOT EXISTS conversation_sessions_updated ON conversation_sessions (updated_at)",
+        # clustered on (session_id, seq): the context window is one contiguous range read
+        "CREATE TABLE IF NOT EXISTS conversation_messages ("
+        " session_id TEXT NOT NULL, seq INTEGER NOT NULL, role INTEGER NOT NULL, content TEXT NOT NULL,"
+        " tokens INTEGER NOT NULL, created_at INTEGER NOT NULL, PRIMARY KEY (session_id, seq)"
+        ") WITHOUT ROWID",
+    ]),
+    Migration(4, "usage ledger", [
+        "CREATE TABLE IF NOT EXISTS usage_events ("
+        " id INTEGER PRIMARY KEY, ts REAL NOT NULL, agent TEXT NOT NULL, model TEXT NOT NULL, api_key TEXT NOT NULL,"
+        " prompt_tokens INTEGER NOT NULL, completion_tokens INTEGER NOT NULL, latency_ms REAL NOT NULL, ok INTEGER NOT NULL"
+        ")",
+        "CREATE INDEX IF NOT EXISTS usage_events_ts ON usage_events (ts)",
+        # rollups are keyed by bucket first so time range queries are a single range scan
+        *[
+            f"CREATE TABLE IF NOT EXISTS usage_{period} ("
+            " bucket INTEGER NOT NULL, agent TEXT NOT NULL, model TEXT NOT NULL, api_key TEXT NOT NULL,"
+            " requests INTEGER NOT NULL, errors INTEGER NOT NULL, prompt_tokens INTEGER NOT NULL,"
+            " completion_tokens INTEGER NOT NULL, latency_ms_total REAL NOT NULL, latency_ms_max REAL NOT NULL,"
+            " PRIMARY KEY (bucket, agent, model, api_key)"
+            ") WITHOUT ROWID"
+            for period in ("hourly", "daily")
+        ],
+    ]),
+    Migration(5, "full text search", [
+        # tools are served by the tool servers, this table keeps the last fetched list so it can be searched
+        "CREATE TABLE IF NOT EXISTS tools ("
+        " id TEXT PRIMARY KEY, server_id TEXT NOT NULL, name TEXT NOT NULL, description TEXT, toolschema TEXT"
+        ")",
+        "CREATE INDEX IF NOT EXISTS tools_server ON tools (server_id)",
+        "CREATE TRIGGER IF NOT EXISTS toolservers_delete_tools AFTER DELETE ON toolservers "
+        "BEGIN DELETE FROM tools WHERE server_id = old.id; END",
+        *_full_text_index("prompts", ["id", "prompt"]),
+        *_full_text_index("latticeagents", ["id", "prompt"]),
+        *_full_text_index("tools", ["id", "name", "description"]),
+    ]),
+    Migration(6, "catalog warm start cache", [
+        "CREATE TABLE IF NOT EXISTS catalog_cache (name TEXT PRIMARY KEY, saved_at REAL NOT NULL, payload TEXT NOT NULL) WITHOUT ROWID",
+    ]),
+    Migration(7, "response cache", [
+        "CREATE TABLE IF NOT EXISTS response_cache ("
+        " key TEXT PRIMARY KEY, agent TEXT NOT NULL, expires_at REAL NOT NULL, payload TEXT NOT NULL"
+        ") WITHOUT ROWID",
+        # expired rows are pruned by time, cleared by agent
+        "CREATE INDEX IF NOT EXISTS response_cache_expires ON response_cache (expires_at)",
+        "CREATE INDEX IF NOT EXISTS response_cache_agent ON response_cache (agent)",
+    ]),
+    Migration(8, "model groups", [
+        # one public model name served by several connections, connections is a JSON list of connection ids
+        "CREATE TABLE IF NOT EXISTS modelgroups (id TEXT PRIMARY KEY, model TEXT NOT NULL, connections TEXT NOT NULL, strategy TEXT NOT NULL)",
+        *_track_changes("modelgroups"),
+    ]),
+]
+
+
+def current_version() -> int:
+    cur = LocalDatabase.connect()
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version "
+        "(version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TEXT NOT NULL)"
+    )
+    cur.connection.commit()
+    return cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate() -> int:
+    """
+    Bring the database up to the latest schema version and return that version.
+    Safe to call from several processes, each migration is applied under the write lock.
+    """
+    version = current_version()
+    pending = [m for m in MIGRATIONS if m.version > version]
+    if not pending:
+        logger.debug(f"Database schema is current at version {version}")
+        return version
+    cur = LocalDatabase.connect()
+    conn = cur.connection
+    for migration in pending:
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            # another process may have applied it while we waited for the lock
+            applied = cur.execute("SELECT 1 FROM schema_version WHERE version = ?", (migration.version,)).fetchone()
+            if applied:
+                conn.rollback()
+                continue
+            for statement in migration.statements:
+                cur.execute(statement)
+            cur.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (migration.version, migration.description, datetime.now(timezone.utc).isoformat())
+            )
+            conn.commit()
+            logger.info(f"Applied migration {migration.version}: {migration.description}")
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Migration {migration.version} ({migration.description}) failed: {e}")
+            raise
+        version = migration.version
+    return version
@@ -0,0 +1,147 @@
+"""
+Routing of model group requests to one of their replicas.
+
+A model group maps a public model name to the same model on several connections.
+Each request goes to the replica with the fewest requests in flight
+(least_outstanding), or to the less busy of two random replicas (power_of_two).
+A replica that fails eject_after times in a row is ejected for eject_seconds,
+doubling on every further ejection, then offered requests again; one success
+restores it. Replicas whose last model discovery failed are skipped as well.
+"""
+from typing import Dict, Any, List
+from pydantic import BaseModel
+import random
+import threading
+import time
+import logging
+
+from latticepy.engine.interfaces.clientinterface import LLMmodels, ModelGroupModel
+
+logger = logging.getLogger(__name__)
+
+
+class RoutingModel(BaseModel):
+    eject_after: int = 3             # consecutive failures that eject a replica
+    eject_seconds: float = 30        # first ejection, doubled on each further one
+    max_eject_seconds: float = 600
+
+
+class NoReplicaAvailable(ValueError):
+    pass
+
+
+class ReplicaState:
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0          # consecutive
+        self.ejections = 0         # consecutive, sets the next ejection time
+        self.ejected_until = 0.0
+
+    def as_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_failures": self.failures,
+            "ejected": self.ejected_until > now,
+            "ejected_for": round(max(0.0, self.ejected_until - now), 1),
+        }
+
+
+class Route:
+    """
+    One request's claim on a replica, released with its outcome.
+    """
+
+    def __init__(self, group: str, connection: str, model: str):
+        self.group = group
+        self.connection = connection
+        self.model = model   # catalog name of the chosen replica, "<connection>_<model>"
+        self._released = False
+
+    def release(self, ok: bool) -> None:
+        if not self._released:
+            self._released = True
+            ModelRouter.release(self.connection, ok)
+
+
+class ModelRouter:
+    settings: RoutingModel = RoutingModel()
+    _replicas: Dict[str, ReplicaState] = {}   # connection id -> state, shared by every group on that connection
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, settings: RoutingModel) -> None:
+        cls.settings = settings
+
+    @classmethod
+    def _state(cls, connection: str) -> ReplicaState:
+        state = cls._replicas.get(connection)
+        if state is None:
+            state = cls._replicas[connection] = ReplicaState()
+        return state
+
+    @staticmethod
+    def _discovery_failed(connection: str) -> bool:
+        health = LLMmodels.HEALTH.get(connection)
+        return health is not None and health.last_attempt is not None and not health.healthy
+
+    @classmethod
+    def replicas(cls, group: ModelGroupModel) -> List[str]:
+        """
+        Connections of the group that currently offer its model.
+        """
+        return [cid for cid in group.connections if f"{cid}_{group.model}" in LLMmodels.MODELS]
+
+    @classmethod
+    def route(cls, group: ModelGroupModel) -> Route:
+        now = time.time()
+        known = cls.replicas(group)
+        if not known:
+            raise NoReplicaAvailable(f"No connection of model group {group.id} offers {group.model}")
+        with cls._lock:
+            candidates = [cid for cid in known
+                          if cls._state(cid).ejected_until <= now and not cls._discovery_failed(cid)]
+            if not candidates:
+                # every replica is ejected: keep serving from all of them rather than failing every request
+                logger.warning(f"All replicas of {group.id} are ejected, routing to any of them")
+                candidates = known
+            if group.strategy == 'power_of_two' and len(candidates) > 2:
+                candidates = random.sample(candidates, 2)
+            # ties are broken at random so idle replicas share the load
+            lowest = min(cls._state(cid).in_flight for cid in candidates)
+            connection = random.choice([cid for cid in candidates if cls._state(cid).in_flight == lowest])
+            state = cls._state(connection)
+            state.in_flight += 1
+            state.requests += 1
+        return Route(group.id, connection, f"{connection}_{group.model}")
+
+    @classmethod
+    def release(cls, connection: str, ok: bool) -> None:
+        with cls._lock:
+            state = cls._state(connection)
+            state.in_flight = max(0, state.in_flight - 1)
+            if ok:
+                state.failures = 0
+                state.ejections = 0
+                return
+            state.errors += 1
+            state.failures += 1
+            if state.failures >= cls.settings.eject_after:
+                seconds = min(cls.settings.eject_seconds * 2 ** state.ejections, cls.settings.max_eject_seconds)
+                state.ejected_until = time.time() + seconds
+                state.ejections += 1
+                logger.warning(f"Connection {connection} ejected for {seconds:.0f}s after {state.failures} failures")
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        now = time.time()
+        with cls._lock:
+            return {cid: state.as_dict(now) for cid, state in sorted(cls._replicas.items())}
+
+    @classmethod
+    def reset(cls) -> None:
+        with cls._lock:
+            cls._replicas.clear()
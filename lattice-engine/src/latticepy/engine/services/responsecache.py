@@ -0,0 +1,240 @@
+"""
+Exact-match cache of chat completions.
+
+A request is looked up by a hash of everything that shapes its reply: model, agent
+version, system prompt, messages, tools and options. Hits are served from an in-memory
+LRU first and from the response_cache table when the SQLite tier is enabled. The cache
+is opt-in, each agent can have its own TTL, and a request can bypass it with Cache-Control.
+"""
+from typing import Optional, Dict, Any, List, NamedTuple, Tuple
+from collections import OrderedDict
+from pydantic import BaseModel
+import hashlib
+import json
+import threading
+import time
+import logging
+
+from latticepy.engine.services.localdatabase import LocalDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCacheModel(BaseModel):
+    enabled: bool = False              # opt-in, repeated questions are answered from the cache
+    ttl: float = 300                   # seconds a reply is reused
+    agent_ttls: Dict[str, float] = {}  # per agent TTL, 0 disables caching for that agent
+    max_entries: int = 1024            # replies kept in the in-memory LRU
+    sqlite: bool = False               # also keep replies in the response_cache table, shared by processes and restarts
+
+
+class CachedReply(NamedTuple):
+    content: str
+    more: Any
+    headers: Dict[str, Any]
+
+
+class CachePolicy:
+    """
+    What the cache may do for one request, and what it did: status is hit, miss or bypass.
+    """
+
+    def __init__(self, key: Optional[str], ttl: float, lookup: bool, store: bool):
+        self.key = key
+        self.ttl = ttl
+        self.lookup = lookup
+        self.store = store
+        self.status = "miss" if lookup else "bypass"
+        self.semantic = None   # the SemanticLookup of the request when the semantic tier applies
+        self.semantic_request = None   # arguments of SemanticCache.prepare until the question is embedded
+
+
+def cache_key(model: str, agent: Optional[str], agent_record: Optional[Dict[str, Any]],
+              messages: List[Dict[str, Any]], options: Optional[Dict[str, Any]] = None,
+              format: Optional[str] = None) -> str:
+    # the agent record carries the system prompt and tools; when the agent is edited its hash changes
+    agent_record = agent_record or {}
+    agent_version = hashlib.sha256(json.dumps(agent_record, sort_keys=True, default=str).encode()).hexdigest()
+    payload = {
+        "model": model,
+        "agent": agent or "",
+        "agent_version": agent_version,
+        "system_prompt": agent_record.get("prompt"),
+        "tools": agent_record.get("tools"),
+        "messages": messages,
+        "options": options or {},
+        "format": format,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def parse_cache_control(value: Optional[str]) -> Tuple[bool, bool]:
+    """
+    (lookup, store) allowed by a Cache-Control request header.
+    no-cache fetches a fresh reply and caches it, no-store keeps the cache out of the request entirely.
+    """
+    directives = {d.strip().lower() for d in (value or "").split(",")}
+    if "no-store" in directives:
+        return False, False
+    if "no-cache" in directives:
+        return False, True
+    return True, True
+
+
+class ResponseCache:
+    settings: ResponseCacheModel = ResponseCacheModel()
+    _entries: "OrderedDict[str, Tuple[float, CachedReply]]" = OrderedDict()
+    _lock = threading.Lock()
+    _counters: Dict[str, int] = {"hits": 0, "memory_hits": 0, "sqlite_hits": 0, "misses": 0,
+                                 "bypasses": 0, "stores": 0, "evictions": 0}
+    _last_prune = 0.0
+
+    @classmethod
+    def configure(cls, settings: ResponseCacheModel) -> None:
+        cls.settings = settings
+        cls.clear(persistent=False)
+
+    @classmethod
+    def ttl_for(cls, agent: Optional[str]) -> float:
+        ttls = cls.settings.agent_ttls
+        if agent:
+            # agents are addressed as AGENT_<id>, configured by <id>
+            for name in (agent, agent[len("AGENT_"):] if agent.startswith("AGENT_") else f"AGENT_{agent}"):
+                if name in ttls:
+                    return ttls[name]
+        return cls.settings.ttl
+
+    @classmethod
+    def policy(cls, model: str, agent: Optional[str], agent_record: Optional[Dict[str, Any]],
+               messages: List[Dict[str, Any]], options: Optional[Dict[str, Any]] = None,
+               format: Optional[str] = None, cache_control: Optional[str] = None) -> CachePolicy:
+        ttl = cls.ttl_for(agent)
+        if not cls.settings.enabled or ttl <= 0:
+            policy = CachePolicy(None, 0, False, False)
+        else:
+            lookup, store = parse_cache_control(cache_control)
+            key = cache_key(model, agent, agent_record, messages, options, format) if lookup or store else None
+            policy = CachePolicy(key, ttl, lookup, store)
+        if cls.settings.enabled and not policy.lookup:
+            cls._count("bypasses")
+        return policy
+
+    @classmethod
+    def _count(cls, name: str) -> None:
+        with cls._lock:
+            cls._counters[name] += 1
+
+    @classmethod
+    def get(cls, policy: CachePolicy) -> Optional[CachedReply]:
+        """
+        The cached reply for the request, memory first, then the SQLite tier.
+        """
+        if not policy.lookup:
+            return None
+        now = time.time()
+        with cls._lock:
+            entry = cls._entries.get(policy.key)
+            if entry and entry[0] > now:
+                cls._entries.move_to_end(policy.key)
+                cls._counters["hits"] += 1
+                cls._counters["memory_hits"] += 1
+                policy.status = "hit"
+                return entry[1]
+            if entry:
+                del cls._entries[policy.key]
+        if cls.settings.sqlite:
+            row = LocalDatabase.connect().execute(
+                "SELECT expires_at, payload FROM response_cache WHERE key = ? AND expires_at > ?", (policy.key, now)
+            ).fetchone()
+            if row:
+                reply = CachedReply(*json.loads(row["payload"]))
+                cls._remember(policy.key, row["expires_at"], reply)
+                with cls._lock:
+                    cls._counters["hits"] += 1
+                    cls._counters["sqlite_hits"] += 1
+                policy.status = "hit"
+                return reply
+        cls._count("misses")
+        return None
+
+    @classmethod
+    def _remember(cls, key: str, expires_at: float, reply: CachedReply) -> None:
+        with cls._lock:
+            cls._entries[key] = (expires_at, reply)
+            cls._entries.move_to_end(key)
+            while len(cls._entries) > cls.settings.max_entries:
+                cls._entries.popitem(last=False)
+                cls._counters["evictions"] += 1
+
+    @classmethod
+    def put(cls, policy: CachePolicy, reply: CachedReply, agent: Optional[str] = None) -> None:
+        if not policy.store:
+            return
+        expires_at = time.time() + policy.ttl
+        cls._remember(policy.key, expires_at, reply)
+        cls._count("stores")
+        if cls.settings.sqlite:
+            cur = LocalDatabase.connect()
+            try:
+                cur.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, agent, expires_at, payload) VALUES (?, ?, ?, ?)",
+                    (policy.key, agent or "", expires_at, json.dumps(list(reply), default=str))
+                )
+                cur.connection.commit()
+            except Exception:
+                LocalDatabase.rollback()
+                raise
+            cls._prune()
+
+    @classmethod
+    def _prune(cls) -> None:
+        now = time.time()
+        # once a minute is enough, expired rows are never served anyway
+        if now - cls._last_prune < 60:
+            return
+        cls._last_prune = now
+        cur = LocalDatabase.connect()
+        cur.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
+        cur.connection.commit()
+
+    @classmethod
+    def clear(cls, agent: Optional[str] = None, persistent: bool = True) -> int:
+        """
+        Drop cached replies, of one agent or all of them. Returns the number of rows removed from SQLite.
+        Entries of one agent cannot be told apart in memory, so the memory tier is always emptied.
+        """
+        with cls._lock:
+            cls._entries.clear()
+        if not persistent or not cls.settings.sqlite:
+            return 0
+        cur = LocalDatabase.connect()
+        try:
+            if agent is None:
+                cur.execute("DELETE FROM response_cache")
+            else:
+                cur.execute("DELETE FROM response_cache WHERE agent = ?", (agent,))
+            cur.connection.commit()
+        except Exception:
+            LocalDatabase.rollback()
+            raise
+        return cur.rowcount
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        with cls._lock:
+            counters = dict(cls._counters)
+            entries = len(cls._entries)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "enabled": cls.settings.enabled,
+            "entries": entries,
+            "max_entries": cls.settings.max_entries,
+            "sqlite": cls.settings.sqlite,
+            **counters,
+            "hit_ratio": round(counters["hits"] / lookups, 4) if lookups else None,
+        }
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        with cls._lock:
+            cls._counters = dict.fromkeys(cls._counters, 0)
@@ -0,0 +1,186 @@
+"""
+Priority classes and fair sharing between API keys for requests waiting on a connection.
+
+Every chat request is given a class, such as interactive or batch, from the
+X-Lattice-Priority header or from its API key, and runs with it as the current
+request class. When a connection is at its concurrency limit (services/backendlimits.py),
+waiting requests of a higher class always go first. Within a class, API keys
+share the freed slots by weighted fair queuing, so a key that queues a thousand
+requests delays a key with one request by at most one turn per weight.
+"""
+from typing import Optional, Dict, Any, List, NamedTuple, Tuple
+from contextvars import ContextVar
+from pydantic import BaseModel
+import heapq
+import itertools
+import time
+import logging
+
+from latticepy.engine.services.backendlimits import BackendLimits, BackendLimiter, LimiterModel, Waiter
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulingModel(BaseModel):
+    enabled: bool = True
+    header: str = "X-Lattice-Priority"
+    classes: List[str] = ["interactive", "batch"]   # highest priority first
+    default_class: str = "interactive"
+    key_classes: Dict[str, str] = {}   # key owner -> its class, also the highest it may ask for by header
+    key_weights: Dict[str, float] = {}   # key owner -> share of slots within its class
+    default_weight: float = 1.0
+
+
+class RequestClass(NamedTuple):
+    priority: str
+    rank: int          # position in classes, 0 is served first
+    tenant: str        # the API key label the fair share is kept for
+    weight: float
+
+
+_current: ContextVar[Optional[RequestClass]] = ContextVar("lattice_request_class", default=None)
+
+
+class FairLimiter(BackendLimiter):
+    """
+    BackendLimiter that orders its queue by request class, then by weighted fair share.
+    Each waiter gets a virtual finish tag of max(virtual time, its key's last tag) + 1 / weight;
+    the smallest tag of the highest class is granted next.
+    """
+
+    def __init__(self, name: str, settings: LimiterModel):
+        super().__init__(name, settings)
+        self._heaps: Dict[int, List[Tuple[float, int, Waiter]]] = {}
+        self._vtime: Dict[int, float] = {}
+        self._finish: Dict[Tuple[int, str], float] = {}
+        self._seq = itertools.count()
+        self.class_stats: Dict[str, Dict[str, float]] = {}
+
+    def _class_stats(self, priority: str) -> Dict[str, float]:
+        stats = self.class_stats.get(priority)
+        if stats is None:
+            stats = self.class_stats[priority] = {"queued": 0, "admitted": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+        return stats
+
+    def _queued(self) -> int:
+        return sum(len(heap) for heap in self._heaps.values())
+
+    def _enqueue(self, waiter: Waiter) -> None:
+        rc = waiter.meta.get("class") or RequestScheduler.current()
+        waiter.meta["class"] = rc
+        vtime = self._vtime.get(rc.rank, 0.0)
+        tag = max(vtime, self._finish.get((rc.rank, rc.tenant), 0.0)) + 1.0 / rc.weight
+        self._finish[(rc.rank, rc.tenant)] = tag
+        heapq.heappush(self._heaps.setdefault(rc.rank, []), (tag, next(self._seq), waiter))
+        self._class_stats(rc.priority)["queued"] += 1
+
+    def _next_waiter(self) -> Optional[Waiter]:
+        for rank in sorted(self._heaps):
+            heap = self._heaps[rank]
+            while heap:
+                tag, _, waiter = heapq.heappop(heap)
+                rc = waiter.meta["class"]
+                stats = self._class_stats(rc.priority)
+                stats["queued"] -= 1
+                if waiter.future.done():
+                    continue
+                self._vtime[rank] = tag
+                if not heap:
+                    self._idle(rank)
+                waited = (time.monotonic() - waiter.enqueued_at) * 1000
+                stats["admitted"] += 1
+                stats["wait_ms_total"] += waited
+                stats["wait_ms_max"] = max(stats["wait_ms_max"], waited)
+                return waiter
+            self._idle(rank)
+        return None
+
+    def _idle(self, rank: int) -> None:
+        # an empty class starts over, keys keep no credit or debt from an earlier busy period
+        self._heaps.pop(rank, None)
+        self._vtime.pop(rank, None)
+        for key in [k for k in self._finish if k[0] == rank]:
+            del self._finish[key]
+
+    def _discard(self, waiter: Waiter) -> None:
+        rc = waiter.meta.get("class")
+        heap = self._heaps.get(rc.rank) if rc else None
+        if not heap:
+            return
+        for i, entry in enumerate(heap):
+            if entry[2] is waiter:
+                heap[i] = heap[-1]
+                heap.pop()
+                heapq.heapify(heap)
+                self._class_stats(rc.priority)["queued"] -= 1
+                break
+        if not heap:
+            self._idle(rc.rank)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["classes"] = {
+            priority: {
+                "queued": int(s["queued"]),
+                "admitted_from_queue": int(s["admitted"]),
+                "wait_ms_avg": round(s["wait_ms_total"] / s["admitted"], 2) if s["admitted"] else None,
+                "wait_ms_max": round(s["wait_ms_max"], 2),
+            }
+            for priority, s in sorted(self.class_stats.items())
+        }
+        return stats
+
+
+class RequestScheduler:
+    settings: SchedulingModel = SchedulingModel()
+
+    @classmethod
+    def configure(cls, settings: SchedulingModel) -> None:
+        if settings.default_class not in settings.classes:
+            raise ValueError(f"default_class {settings.default_class} is not one of {', '.join(settings.classes)}")
+        unknown = sorted(set(settings.key_classes.values()) - set(settings.classes))
+        if unknown:
+            raise ValueError(f"key_classes use unknown classes {', '.join(unknown)}")
+        cls.settings = settings
+        BackendLimits.limiter_class = FairLimiter if settings.enabled else BackendLimiter
+        # limiters already created keep their old queue discipline, start over
+        BackendLimits.configure(BackendLimits.settings)
+
+    @classmethod
+    def classify(cls, tenant: str, requested: Optional[str] = None) -> RequestClass:
+        """
+        The class of a request from the label of its API key and the class asked for in
+        the priority header, if any. The header may lower the key's class, never raise it.
+        Raises ValueError for a class that is not configured.
+        """
+        s = cls.settings
+        allowed = s.key_classes.get(tenant, s.default_class)
+        priority = allowed
+        if requested:
+            requested = requested.strip().lower()
+            if requested not in s.classes:
+                raise ValueError(f"Unknown priority {requested}, expected one of {', '.join(s.classes)}")
+            if s.classes.index(requested) > s.classes.index(allowed):
+                priority = requested
+        weight = s.key_weights.get(tenant, s.default_weight)
+        return RequestClass(priority, s.classes.index(priority), tenant, weight if weight > 0 else s.default_weight)
+
+    @classmethod
+    def enter(cls, request_class: RequestClass) -> None:
+        """
+        Make request_class the class of everything the current request does from here on,
+        including tasks it starts.
+        """
+        _current.set(request_class)
+
+    @classmethod
+    def current(cls) -> RequestClass:
+        rc = _current.get()
+        if rc is None:
+            # work started outside a chat request, such as model discovery
+            return cls.classify("")
+        return rc
+
+
+# the default settings apply before configure() is called, and to an engine run without a config file
+BackendLimits.limiter_class = FairLimiter if RequestScheduler.settings.enabled else BackendLimiter
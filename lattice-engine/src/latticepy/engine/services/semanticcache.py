@@ -0,0 +1,274 @@
+"""
+Semantic cache of chat completions.
+
+Questions are embedded with the configured embedding model and compared with the
+questions already answered for the same agent, model, agent version, options and format. When the
+closest one is similar enough, its answer is returned without calling the LLM.
+Each partition holds its vectors in one NumPy matrix, so a lookup is a single
+matrix-vector product. Memory is bounded by max_partitions * max_entries vectors.
+
+NumPy is an optional dependency (pip install lattice-engine[semantic]) and is only
+imported when the cache is enabled.
+"""
+from typing import Optional, Dict, Any, List
+from collections import OrderedDict
+from pydantic import BaseModel
+import hashlib
+import json
+import threading
+import time
+import logging
+
+from latticepy.engine.services.responsecache import CachedReply, parse_cache_control
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCacheModel(BaseModel):
+    enabled: bool = False
+    embedding_model: Optional[str] = None  # catalog name of the embedding model, e.g. "local_nomic-embed-text"
+    threshold: float = 0.92                # cosine similarity from which a cached answer is reused
+    ttl: float = 600                       # seconds an answer is reused
+    agent_ttls: Dict[str, float] = {}      # per agent TTL, 0 disables the semantic cache for that agent
+    max_entries: int = 512                 # cached questions per agent, least recently used are evicted
+    max_partitions: int = 64               # agent / model / agent version combinations kept in memory
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("The semantic cache needs numpy, install it with: pip install lattice-engine[semantic]")
+    return numpy
+
+
+def partition_key(model: str, agent: Optional[str], agent_record: Optional[Dict[str, Any]],
+                  options: Optional[Dict[str, Any]] = None, format: Optional[str] = None) -> str:
+    # answers are only shared between identical setups, an edited agent starts an empty partition;
+    # options and format shape the answer as much as the question does, as in the exact-match key
+    payload = {"model": model, "agent": agent or "", "record": agent_record or {},
+               "options": options or {}, "format": format or ""}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class SemanticLookup:
+    """
+    The embedded question of one request and where it is looked up and stored.
+    """
+
+    def __init__(self, partition: str, question: str, vector, ttl: float, lookup: bool, store: bool):
+        self.partition = partition
+        self.question = question
+        self.vector = vector
+        self.ttl = ttl
+        self.lookup = lookup
+        self.store = store
+        self.similarity: Optional[float] = None
+
+
+class Partition:
+    """
+    Fixed capacity store of unit vectors with their answers, expiry and last use.
+    """
+
+    def __init__(self, dim: int, capacity: int):
+        np = _numpy()
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.expires = np.zeros(capacity, dtype=np.float64)
+        self.used = np.zeros(capacity, dtype=np.float64)
+        self.replies: List[Optional[CachedReply]] = [None] * capacity
+        self.questions: List[Optional[str]] = [None] * capacity
+        self.size = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + self.expires.nbytes + self.used.nbytes
+
+    def search(self, vector, now: float):
+        """
+        (row, similarity) of the closest live question, or (None, None) when there is none.
+        """
+        np = _numpy()
+        if not self.size:
+            return None, None
+        scores = self.vectors[:self.size] @ vector
+        scores[self.expires[:self.size] <= now] = -np.inf
+        row = int(np.argmax(scores))
+        if not np.isfinite(scores[row]):
+            return None, None
+        return row, float(scores[row])
+
+    def insert(self, vector, question: str, reply: CachedReply, expires_at: float, now: float) -> bool:
+        """
+        Store an answer, returns True when a live entry had to be evicted to make room.
+        """
+        np = _numpy()
+        if self.size < len(self.replies):
+            row, evicted = self.size, False
+            self.size += 1
+        else:
+            expired = np.flatnonzero(self.expires <= now)
+            if expired.size:
+                row, evicted = int(expired[0]), False
+            else:
+                row, evicted = int(np.argmin(self.used)), True
+        self.vectors[row] = vector
+        self.expires[row] = expires_at
+        self.used[row] = now
+        self.replies[row] = reply
+        self.questions[row] = question
+        return evicted
+
+
+class SemanticCache:
+    settings: SemanticCacheModel = SemanticCacheModel()
+    _partitions: "OrderedDict[str, Partition]" = OrderedDict()
+    _lock = threading.Lock()
+    _counters: Dict[str, int] = {"lookups": 0, "hits": 0, "misses": 0, "stores": 0, "evictions": 0,
+                                 "bypasses": 0, "embed_errors": 0}
+    _embeds = 0
+    _embed_ms_total = 0.0
+
+    @classmethod
+    def configure(cls, settings: SemanticCacheModel) -> None:
+        if settings.enabled:
+            if not settings.embedding_model:
+                raise ValueError("The semantic cache needs an embedding_model")
+            _numpy()
+        cls.settings = settings
+        cls.clear()
+
+    @classmethod
+    def ttl_for(cls, agent: Optional[str]) -> float:
+        ttls = cls.settings.agent_ttls
+        if agent:
+            for name in (agent, agent[len("AGENT_"):] if agent.startswith("AGENT_") else f"AGENT_{agent}"):
+                if name in ttls:
+                    return ttls[name]
+        return cls.settings.ttl
+
+    @classmethod
+    def _count(cls, name: str) -> None:
+        with cls._lock:
+            cls._counters[name] += 1
+
+    @classmethod
+    async def embed(cls, text: str):
+        """
+        Unit length embedding of text with the configured model.
+        """
+        # imported here, the client interfaces pull in the catalogs this module does not otherwise need
+        from latticepy.engine.interfaces.clientinterface import LLMmodels
+        from latticepy.engine.interfaces.llminterface import ClientPool
+        np = _numpy()
+        info = LLMmodels.MODELS.get(cls.settings.embedding_model)
+        if info is None:
+            raise ValueError(f"Embedding model {cls.settings.embedding_model} is not in the model catalog")
+        started = time.perf_counter()
+        client = ClientPool.get(info.source.model_dump())
+        vector = np.asarray((await client.aembed(info.model, [text]))[0], dtype=np.float32)
+        with cls._lock:
+            cls._embeds += 1
+            cls._embed_ms_total += (time.perf_counter() - started) * 1000
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    @classmethod
+    async def prepare(cls, model: str, agent: Optional[str], agent_record: Optional[Dict[str, Any]],
+                      messages: List[Dict[str, Any]], cache_control: Optional[str] = None,
+                      options: Optional[Dict[str, Any]] = None, format: Optional[str] = None) -> Optional[SemanticLookup]:
+        """
+        Embed the question of a request, None when the semantic cache does not apply to it.
+        Only single questions are matched: with earlier turns in the request the answer depends on more than the question.
+        """
+        if not cls.settings.enabled:
+            return None
+        ttl = cls.ttl_for(agent)
+        lookup, store = parse_cache_control(cache_control)
+        if ttl <= 0 or len(messages) != 1 or messages[0].get("role") != "user" or not (lookup or store):
+            cls._count("bypasses")
+            return None
+        question = messages[0].get("content") or ""
+        try:
+            vector = await cls.embed(question)
+        except Exception as e:
+            # the cache must never fail a chat
+            logger.warning(f"Semantic cache skipped, embedding failed: {e}")
+            cls._count("embed_errors")
+            return None
+        if not lookup:
+            cls._count("bypasses")
+        return SemanticLookup(partition_key(model, agent, agent_record, options, format), question, vector, ttl, lookup, store)
+
+    @classmethod
+    def get(cls, semantic: SemanticLookup) -> Optional[CachedReply]:
+        if not semantic.lookup:
+            return None
+        now = time.time()
+        with cls._lock:
+            cls._counters["lookups"] += 1
+            partition = cls._partitions.get(semantic.partition)
+            row, similarity = (None, None)
+            if partition is not None and partition.vectors.shape[1] == semantic.vector.shape[0]:
+                cls._partitions.move_to_end(semantic.partition)
+                row, similarity = partition.search(semantic.vector, now)
+            semantic.similarity = similarity
+            if row is not None and similarity >= cls.settings.threshold:
+                partition.used[row] = now
+                cls._counters["hits"] += 1
+                return partition.replies[row]
+            cls._counters["misses"] += 1
+        return None
+
+    @classmethod
+    def put(cls, semantic: SemanticLookup, reply: CachedReply) -> None:
+        if not semantic.store:
+            return
+        now = time.time()
+        dim = semantic.vector.shape[0]
+        with cls._lock:
+            partition = cls._partitions.get(semantic.partition)
+            if partition is None or partition.vectors.shape[1] != dim:
+                # a new partition, or the embedding model changed its dimension
+                partition = Partition(dim, cls.settings.max_entries)
+                cls._partitions[semantic.partition] = partition
+            cls._partitions.move_to_end(semantic.partition)
+            while len(cls._partitions) > cls.settings.max_partitions:
+                _, dropped = cls._partitions.popitem(last=False)
+                cls._counters["evictions"] += dropped.size
+            if partition.insert(semantic.vector, semantic.question, reply, now + semantic.ttl, now):
+                cls._counters["evictions"] += 1
+            cls._counters["stores"] += 1
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._partitions.clear()
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        with cls._lock:
+            counters = dict(cls._counters)
+            entries = sum(p.size for p in cls._partitions.values())
+            nbytes = sum(p.nbytes for p in cls._partitions.values())
+            partitions = len(cls._partitions)
+            embed_ms_total = cls._embed_ms_total
+            embeds = cls._embeds
+        return {
+            "enabled": cls.settings.enabled,
+            "embedding_model": cls.settings.embedding_model,
+            "threshold": cls.settings.threshold,
+            "partitions": partitions,
+            "entries": entries,
+            "bytes": nbytes,
+            **counters,
+            "hit_ratio": round(counters["hits"] / counters["lookups"], 4) if counters["lookups"] else None,
+            "embed_ms_avg": round(embed_ms_total / embeds, 2) if embeds else None,
+        }
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        with cls._lock:
+            cls._counters = dict.fromkeys(cls._counters, 0)
+            cls._embeds = 0
+            cls._embed_ms_total = 0.0
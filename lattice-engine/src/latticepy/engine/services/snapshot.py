@@ -0,0 +1,155 @@
+"""
+Online snapshots of the engine database.
+
+Snapshots are taken with SQLite's online backup API while the engine keeps serving
+requests. The copy is made in a single step inside one read transaction; under WAL
+writers carry on meanwhile. A backup in several steps would restart every time
+another connection writes, and never finish under steady writes. A finished snapshot
+is a self-contained database file that can seed a new engine replica through
+restore_snapshot().
+"""
+from typing import Optional, Dict, Any, List
+from datetime import datetime, timezone
+import os
+import time
+import sqlite3
+import threading
+import logging
+
+from latticepy.engine.services.localdatabase import LocalDatabase
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = "snapshots"
+SNAPSHOT_SUFFIX = ".db"
+
+# one snapshot at a time per process, concurrent backups only slow each other down
+_snapshot_lock = threading.Lock()
+
+
+def snapshot_dir() -> str:
+    """
+    Default folder for snapshots, next to the engine database.
+    """
+    if LocalDatabase.settings is not None:
+        base = LocalDatabase.settings.url_path
+    else:
+        base = os.path.dirname(LocalDatabase.pool().db_path)
+    return os.path.join(base, SNAPSHOT_DIR)
+
+
+def default_snapshot_path() -> str:
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return os.path.join(snapshot_dir(), f"localdb-{stamp}{SNAPSHOT_SUFFIX}")
+
+
+def inspect_snapshot(path: str) -> Dict[str, Any]:
+    """
+    Check that path is an intact engine database and describe it.
+    Raises ValueError when it is not usable as a snapshot.
+    """
+    if not os.path.isfile(path):
+        raise ValueError(f"Snapshot {path} does not exist")
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            check = conn.execute("PRAGMA quick_check").fetchone()[0]
+            if check != "ok":
+                raise ValueError(f"Snapshot {path} is corrupt: {check}")
+            has_versions = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+            ).fetchone()
+            if not has_versions:
+                raise ValueError(f"{path} is not an engine database, schema_version is missing")
+            schema_version = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+            pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        raise ValueError(f"Snapshot {path} is not a readable database: {e}")
+    return {
+        "path": path,
+        "bytes": os.path.getsize(path),
+        "pages": pages,
+        "schema_version": schema_version,
+        "modified": datetime.fromtimestamp(os.path.getmtime(path), timezone.utc).isoformat(),
+    }
+
+
+def create_snapshot(dest: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Copy the live database to dest and return a description of the snapshot.
+    The copy is written next to dest and moved into place only once it is complete and verified.
+    """
+    dest = os.path.abspath(os.path.expanduser(dest or default_snapshot_path()))
+    if not _snapshot_lock.acquire(blocking=False):
+        raise RuntimeError("A snapshot is already in progress")
+    partial = f"{dest}.partial"
+    started = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if os.path.exists(partial):
+            os.remove(partial)
+        source = LocalDatabase.open_reader()
+        target = sqlite3.connect(partial)
+        try:
+            source.backup(target)
+            # a snapshot is a single file, it must not depend on a -wal next to it
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+            source.close()
+        info = inspect_snapshot(partial)
+        os.replace(partial, dest)
+    except Exception:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    finally:
+        _snapshot_lock.release()
+    info.update(path=dest, seconds=round(time.perf_counter() - started, 3))
+    logger.info(f"Snapshot of {info['pages']} pages written to {dest} in {info['seconds']}s")
+    return info
+
+
+def list_snapshots(folder: Optional[str] = None) -> List[Dict[str, Any]]:
+    folder = folder or snapshot_dir()
+    if not os.path.isdir(folder):
+        return []
+    snapshots = []
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if name.endswith(SNAPSHOT_SUFFIX) and os.path.isfile(path):
+            snapshots.append({
+                "path": path,
+                "bytes": os.path.getsize(path),
+                "modified": datetime.fromtimestamp(os.path.getmtime(path), timezone.utc).isoformat(),
+            })
+    return snapshots
+
+
+def restore_snapshot(snapshot: str, db_path: str, force: bool = False) -> Dict[str, Any]:
+    """
+    Seed the database at db_path from a snapshot, used to warm-start a new engine.
+    The engine must not be running against db_path. Pending migrations are applied
+    afterwards by the normal engine start.
+    """
+    info = inspect_snapshot(snapshot)
+    if os.path.exists(db_path) and not force:
+        raise ValueError(f"Database {db_path} already exists, pass force to overwrite it")
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    partial = f"{db_path}.partial"
+    source = sqlite3.connect(f"file:{snapshot}?mode=ro", uri=True)
+    target = sqlite3.connect(partial)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    # stale WAL files would be replayed on top of the restored pages
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    os.replace(partial, db_path)
+    logger.info(f"Restored {db_path} from snapshot {snapshot} at schema version {info['schema_version']}")
+    return {**info, "restored_to": db_path}
@@ -1,7 +1,6 @@
 from pydantic import BaseModel, Field, model_validator
 from typing import List, Dict, Any, Optional, Literal, Tuple
 import json
-import jsonschema
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,9 +9,6 @@ from latticepy.engine.interfaces.serverinterface import servertooldata
 from latticepy.engine.services.localdatabase import LocalDatabase
 
 
-tooldata = servertooldata().tooldata
-
-
 """
 class ToolDetails(BaseModel):
     action: Literal['rephrase', 'recall', 'filter', 'flow', 'RAG'] = Field('rephrase', description="Action to be taken with the tool. Options are 'rephrase', 'recall', 'filter', or 'direct'.")
@@ -40,6 +36,7 @@ class ToolData(BaseModel):
     def validateschema(cls, values):
         paramschema = values.get('paramschema') if isinstance(values, dict) else None
         if paramschema:
+            import jsonschema  # heavy, only needed when a schema is validated
             try:
                 jsonschema.Draft7Validator.check_schema(paramschema)
             except jsonschema.SchemaError as e:
@@ -78,12 +75,19 @@ class ToolLoad:
         self.tooldetails=json.loads(row['details'])
         logger.debug(f"Tool details loaded: {self.tooldetails}")
 
+    @classmethod
+    def tooldata(cls) -> Dict[str, Any]:
+        """
+        The tool catalog shared by every agent, kept fresh in memory by servertooldata.
+        """
+        return servertooldata().tooldata
+
     @staticmethod
     def get_server(toolname) -> str | None :
         """
         Returns the server on which the tool exists.
         """
-        server = tooldata.get(toolname, None)
+        server = ToolLoad.tooldata().get(toolname, None)
         return server
 
     def getrecall(self, tool) -> Dict[str, Any]:
@@ -99,6 +103,6 @@ class ToolLoad:
         """
         Check if the tool exists in the tooldata.
         """
-        if toolname in tooldata.keys():
+        if toolname in ToolLoad.tooldata().keys():
             return True
         return False
@@ -0,0 +1,226 @@
+"""
+Write-behind ledger of token usage and latency.
+
+Chat endpoints call UsageLedger.record(), which only appends to an in-memory queue.
+A background task drains the queue in batches: every batch is one transaction that
+stores the raw events and folds them into the hourly and daily rollup tables, so
+reports read the small rollups instead of scanning events.
+"""
+from typing import Optional, Dict, Any, List, NamedTuple, Tuple
+from collections import deque
+from pydantic import BaseModel
+import asyncio
+import hashlib
+import threading
+import time
+import logging
+
+from latticepy.engine.services.localdatabase import LocalDatabase
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"hour": ("usage_hourly", 3600), "day": ("usage_daily", 86400)}
+GROUP_COLUMNS = ("bucket", "agent", "model", "api_key")
+
+
+class UsageModel(BaseModel):
+    flush_interval: float = 1.0        # seconds between flushes of the in-memory queue
+    batch_size: int = 500              # events written per transaction
+    max_queue: int = 100000            # events kept in memory while the database is busy, the oldest are dropped beyond
+    raw_retention_days: Optional[float] = 7  # raw events older than this are deleted, the rollups are kept
+
+
+class UsageRecord(NamedTuple):
+    ts: float
+    agent: str
+    model: str
+    api_key: str
+    prompt_tokens: int
+    completion_tokens: int
+    latency_ms: float
+    ok: bool
+
+
+def key_label(api_key: Optional[str], names: Optional[Dict[str, str]] = None) -> str:
+    """
+    The name stored for an API key: its owner when known, otherwise a short fingerprint.
+    Raw keys never reach the ledger.
+    """
+    if not api_key:
+        return ""
+    if names and api_key in names:
+        return names[api_key]
+    return "key-" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+
+
+class UsageLedger:
+    settings: UsageModel = UsageModel()
+    _queue: deque = deque()
+    _lock = threading.Lock()
+    _recorded = 0
+    _flushed = 0
+    _dropped = 0
+    _last_prune = 0.0
+
+    @classmethod
+    def configure(cls, settings: UsageModel) -> None:
+        cls.settings = settings
+
+    @classmethod
+    def record(cls, agent: Optional[str], model: str, api_key: str = "", prompt_tokens: int = 0,
+               completion_tokens: int = 0, latency_ms: float = 0.0, ok: bool = True) -> None:
+        """
+        Queue one request for the ledger. Never touches the database.
+        """
+        event = UsageRecord(time.time(), agent or "", model or "", api_key or "",
+                            int(prompt_tokens), int(completion_tokens), float(latency_ms), bool(ok))
+        with cls._lock:
+            if len(cls._queue) >= cls.settings.max_queue:
+                cls._queue.popleft()
+                cls._dropped += 1
+            cls._queue.append(event)
+            cls._recorded += 1
+
+    @classmethod
+    def pending(cls) -> int:
+        return len(cls._queue)
+
+    @classmethod
+    def _take(cls, limit: int) -> List[UsageRecord]:
+        with cls._lock:
+            return [cls._queue.popleft() for _ in range(min(limit, len(cls._queue)))]
+
+    @staticmethod
+    def _rollup(events: List[UsageRecord], width: int) -> List[Tuple]:
+        # fold the batch in memory first, one upsert per bucket and key instead of one per event
+        totals: Dict[Tuple, List] = {}
+        for e in events:
+            key = (int(e.ts // width * width), e.agent, e.model, e.api_key)
+            row = totals.setdefault(key, [0, 0, 0, 0, 0.0, 0.0])
+            row[0] += 1
+            row[1] += 0 if e.ok else 1
+            row[2] += e.prompt_tokens
+            row[3] += e.completion_tokens
+            row[4] += e.latency_ms
+            row[5] = max(row[5], e.latency_ms)
+        return [(*key, *row) for key, row in totals.items()]
+
+    @classmethod
+    def flush(cls) -> int:
+        """
+        Write queued events in batched transactions, returns how many were written.
+        Events of a failed batch go back to the front of the queue.
+        """
+        written = 0
+        while True:
+            batch = cls._take(cls.settings.batch_size)
+            if not batch:
+                break
+            cur = LocalDatabase.connect()
+            conn = cur.connection
+            try:
+                cur.execute("BEGIN IMMEDIATE")
+                cur.executemany(
+                    "INSERT INTO usage_events (ts, agent, model, api_key, prompt_tokens, completion_tokens, latency_ms, ok) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch
+                )
+                for table, width in PERIODS.values():
+                    cur.executemany(
+                        f"INSERT INTO {table} (bucket, agent, model, api_key, requests, errors, prompt_tokens,"
+                        " completion_tokens, latency_ms_total, latency_ms_max) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                        " ON CONFLICT (bucket, agent, model, api_key) DO UPDATE SET"
+                        " requests = requests + excluded.requests, errors = errors + excluded.errors,"
+                        " prompt_tokens = prompt_tokens + excluded.prompt_tokens,"
+                        " completion_tokens = completion_tokens + excluded.completion_tokens,"
+                        " latency_ms_total = latency_ms_total + excluded.latency_ms_total,"
+                        " latency_ms_max = MAX(latency_ms_max, excluded.latency_ms_max)",
+                        cls._rollup(batch, width)
+                    )
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                with cls._lock:
+                    cls._queue.extendleft(reversed(batch))
+                    # newer events came in meanwhile, keep the bound by dropping the oldest as record() does
+                    overflow = len(cls._queue) - cls.settings.max_queue
+                    for _ in range(max(0, overflow)):
+                        cls._queue.popleft()
+                    cls._dropped += max(0, overflow)
+                logger.error(f"Error flushing {len(batch)} usage events: {e}")
+                break
+            written += len(batch)
+        with cls._lock:
+            cls._flushed += written
+        cls._prune()
+        return written
+
+    @classmethod
+    def _prune(cls) -> None:
+        retention = cls.settings.raw_retention_days
+        now = time.time()
+        # hourly is often enough, the index on ts keeps it cheap
+        if retention is None or now - cls._last_prune < 3600:
+            return
+        cls._last_prune = now
+        cur = LocalDatabase.connect()
+        cur.execute("DELETE FROM usage_events WHERE ts < ?", (now - retention * 86400,))
+        cur.connection.commit()
+
+    @classmethod
+    async def run_flusher(cls) -> None:
+        """
+        Background task: drain the queue every flush_interval seconds, and once more when cancelled.
+        """
+        try:
+            while True:
+                await asyncio.sleep(cls.settings.flush_interval)
+                if cls._queue:
+                    await LocalDatabase.run(cls.flush)
+        except asyncio.CancelledError:
+            if cls._queue:
+                await LocalDatabase.run(cls.flush)
+            raise
+
+    @staticmethod
+    def query(period: str = "hour", start: Optional[float] = None, end: Optional[float] = None,
+              agent: Optional[str] = None, model: Optional[str] = None, api_key: Optional[str] = None,
+              group_by: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Aggregate the rollup table of the given period. start and end are epoch seconds,
+        group_by is any of bucket, agent, model and api_key.
+        """
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+        group_by = list(group_by) if group_by is not None else ["bucket", "agent", "model"]
+        unknown = [c for c in group_by if c not in GROUP_COLUMNS]
+        if unknown:
+            raise ValueError(f"Cannot group by {', '.join(unknown)}")
+        table, width = PERIODS[period]
+        where, params = [], []
+        if start is not None:
+            where.append("bucket >= ?")
+            params.append(int(start // width * width))
+        if end is not None:
+            where.append("bucket < ?")
+            params.append(end)
+        for column, value in (("agent", agent), ("model", model), ("api_key", api_key)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        select = ", ".join(group_by + [
+            "SUM(requests) AS requests", "SUM(errors) AS errors", "SUM(prompt_tokens) AS prompt_tokens",
+            "SUM(completion_tokens) AS completion_tokens", "SUM(latency_ms_total) / SUM(requests) AS latency_ms_avg",
+            "MAX(latency_ms_max) AS latency_ms_max",
+        ])
+        sql = f"SELECT {select} FROM {table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if group_by:
+            sql += f" GROUP BY {', '.join(group_by)} ORDER BY {', '.join(group_by)}"
+        rows = LocalDatabase.connect().execute(sql, params).fetchall()
+        return [dict(row) for row in rows if row["requests"]]
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        with cls._lock:
+            return {"pending": len(cls._queue), "recorded": cls._recorded, "flushed": cls._flushed, "dropped": cls._dropped}
@@ -8,22 +8,121 @@ import uuid
 import time
 import json
 import asyncio
+import os
 import logging
+from contextlib import asynccontextmanager
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 from latticepy.engine.interfaces.chatinterface import Chatinterface
 from latticepy.engine.interfaces.clientinterface import VectorDBlist, Promptlist, LLMmodels, LlmConnections 
-from latticepy.engine.interfaces.clientinterface import ConnectionModel, PromptModel
+from latticepy.engine.interfaces.clientinterface import ConnectionModel, PromptModel, ModelGroups, ModelGroupModel
 from latticepy.engine.interfaces.agentinterface import LatticeAgent
+from latticepy.engine.interfaces.memoryinterface import ConversationStore
+from latticepy.engine.interfaces.llminterface import ClientPool
 from latticepy.engine.interfaces.serverinterface import servertooldata, ToolServer
+from latticepy.engine.services.localdatabase import LocalDatabase, QueryStats
+from latticepy.engine.services.migrations import migrate
+from latticepy.engine.services.bulkdata import BulkImport, ConflictMode, export_ndjson, get_kind
+from latticepy.engine.services import snapshot
+from latticepy.engine.services.catalogsearch import search, search_all
+from latticepy.engine.services.usageledger import UsageLedger, key_label
+from latticepy.engine.services.responsecache import ResponseCache, CachePolicy, CachedReply
+from latticepy.engine.services.semanticcache import SemanticCache
+from latticepy.engine.services.coalescer import RequestCoalescer, request_key
+from latticepy.engine.services.modelrouter import ModelRouter, NoReplicaAvailable, Route
+from latticepy.engine.services.backendlimits import BackendLimits, BackendBusy
+from latticepy.engine.services.scheduler import RequestScheduler
+
+
+async def memory_maintenance():
+    """
+    Periodically drop idle conversation sessions and reclaim their space.
+    """
+    while True:
+        await asyncio.sleep(ConversationStore.settings.maintenance_interval)
+        try:
+            await LocalDatabase.run(ConversationStore.maintain)
+        except Exception as e:
+            logger.error(f"Conversation memory maintenance failed: {e}")
+
+
+def configure_engine():
+    """
+    Apply the config file the engine was started with, named by LATTICE_CONFIG_PATH.
+    Without one the defaults and LATTICE_DB_PATH are used.
+    """
+    config_path = os.environ.get("LATTICE_CONFIG_PATH")
+    if not config_path or not os.path.exists(config_path):
+        return
+    from latticepy.engine.latticeai import Config
+    config = Config().load(config_path)
+    LocalDatabase(config.DATABASE)
+    if config.MEMORY:
+        ConversationStore.configure(config.MEMORY)
+    if config.USAGE:
+        UsageLedger.configure(config.USAGE)
+    if config.CATALOG:
+        LLMmodels.configure(config.CATALOG)
+        servertooldata.ttl = config.CATALOG.tool_ttl
+    if config.RESPONSE_CACHE:
+        ResponseCache.configure(config.RESPONSE_CACHE)
+    if config.SEMANTIC_CACHE:
+        SemanticCache.configure(config.SEMANTIC_CACHE)
+    if config.ROUTING:
+        ModelRouter.configure(config.ROUTING)
+    if config.LIMITS:
+        BackendLimits.configure(config.LIMITS)
+    if config.SCHEDULING:
+        RequestScheduler.configure(config.SCHEDULING)
+
+
+async def initialize():
+    """
+    Everything the engine needs before it serves requests. Importing this module does no I/O;
+    it all happens here, with independent steps running concurrently.
+    """
+    started = time.perf_counter()
+    await asyncio.to_thread(configure_engine)
+    # a no-op when the engine already migrated, needed when the app is served on its own
+    await LocalDatabase.run(migrate)
+    # serve the last known catalogs straight away, the background refreshers revalidate them
+    models, tools = await asyncio.gather(
+        LocalDatabase.run(LLMmodels.load_snapshot),
+        LocalDatabase.run(servertooldata.load_snapshot),
+    )
+    logger.info(f"Engine initialized in {(time.perf_counter() - started) * 1000:.0f} ms with {models} models and {tools} tools")
+
+
+# long running tasks started with the app; models and tools appear as soon as their first refresh finishes
+BACKGROUND_TASKS = (
+    memory_maintenance,
+    UsageLedger.run_flusher,
+    LLMmodels.run_refresher,
+    servertooldata.run_refresher,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await initialize()
+    tasks = [asyncio.create_task(task()) for task in BACKGROUND_TASKS]
+    yield
+    for task in tasks:
+        task.cancel()
+    # the usage flusher writes what is still queued before it exits
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await ClientPool.aclose_all()
+    logger.info("Closing pooled database connections")
+    LocalDatabase.close_all()
 
 
 app = FastAPI(  
     title="Lattice server",
     description="server API for LatticeAI",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -57,6 +156,7 @@ class ChatRequest(BaseModel):
     agent: Optional[str] = None
     model: str
     messages: List[Message]
+    session_id: Optional[str] = None  # continue a stored conversation, only the new message needs to be sent
     stream: Optional[bool] = False
     options: Optional[dict] = None
     format: Optional[str] = None
@@ -78,29 +178,246 @@ def get_timestamp():
 def create_completion_id():
     return f"cmpl-{str(uuid.uuid4())}"
 
-async def generate_ai_response(messages, model, tag):
+async def route_model(model) -> Optional[Route]:
     """
-    Async function to generate AI response
+    None for a model of the catalog, which is served by its own connection. A model group
+    name is routed to one of its replicas. Raises NoReplicaAvailable for anything else.
+    """
+    if model in LLMmodels().list():
+        return None
+    group = await LocalDatabase.run(ModelGroups.get, model)
+    if group is None:
+        raise NoReplicaAvailable(f"Model {model} not found.")
+    return ModelRouter.route(group)
+
+async def generate_ai_response(messages, model, tag, session_id=None, cache: Optional[CachePolicy] = None):
+    """
+    Async function to generate AI response, returns the reply, its context, its headers
+    and whether the model answered. Failures are answered with a message for the user.
     """
     user_messages = [m for m in messages if m.role == "user"]
     if not user_messages:
-        return "I don't see any user messages to respond to."
+        return "I don't see any user messages to respond to.", '', {}, False
 
     last_message = user_messages[-1].content
 
-    modelo=LLMmodels()
-    models=(modelo.list()).keys()
-    logger.debug(f"Available models: {models}")
-    if model not in models:
-        return f"Model {model} not found.", '', {}
     try:
+        route = await route_model(model)
+    except NoReplicaAvailable as e:
+        return str(e), '', {}, False
+    ok = False
+    try:
+        history = await LocalDatabase.run(ConversationStore.window, session_id) if session_id else []
         logger.info("calling chat interface")
-        reply = Chatinterface(last_message, model, tag)
-        llmresponse, agent_response, agent_headers = reply.chat()
-        return llmresponse, agent_response, agent_headers
+        reply = Chatinterface(last_message, route.model if route else model, tag, history=history)
+        llmresponse, agent_response, agent_headers = await reply.achat()
+        ok = True
+        if cache:
+            await store_reply(cache, CachedReply(llmresponse, agent_response, agent_headers), tag)
+        if session_id:
+            await LocalDatabase.run(
+                ConversationStore.append, session_id,
+                [{'role': 'user', 'content': last_message}, {'role': 'assistant', 'content': llmresponse}], tag
+            )
+        return llmresponse, agent_response, agent_headers, True
+    except BackendBusy:
+        # a full queue means the replica is busy, not broken
+        ok = True
+        raise
     except Exception as e:
         logger.error(f"Error in generating AI response: {e}")
-        return "Thank you for your message. Unable to reply to your message.", '', {}
+        return "Thank you for your message. Unable to reply to your message.", '', {}, False
+    finally:
+        if route:
+            route.release(ok)
+
+class StreamFailed(Exception):
+    """
+    A streamed reply broke off; the message is meant for the user.
+    """
+
+async def stream_ai_response(messages, model, tag, session_id=None, cache: Optional[CachePolicy] = None):
+    """
+    Async generator of the AI response as text pieces, stored in the session once complete.
+    Raises StreamFailed when the generation fails, after the pieces sent so far,
+    and BackendBusy when the connection cannot take the request.
+    """
+    user_messages = [m for m in messages if m.role == "user"]
+    if not user_messages:
+        yield "I don't see any user messages to respond to."
+        return
+    last_message = user_messages[-1].content
+    try:
+        route = await route_model(model)
+    except NoReplicaAvailable as e:
+        yield str(e)
+        return
+    pieces = []
+    failed = False
+    try:
+        history = await LocalDatabase.run(ConversationStore.window, session_id) if session_id else []
+        reply = Chatinterface(last_message, route.model if route else model, tag, history=history)
+        async for piece in reply.astream():
+            pieces.append(piece)
+            yield piece
+    except BackendBusy:
+        raise
+    except Exception as e:
+        # a client that goes away is not a failure of the replica
+        failed = True
+        logger.error(f"Error in streaming AI response: {e}")
+        raise StreamFailed("Thank you for your message. Unable to reply to your message.") from e
+    finally:
+        if route:
+            route.release(not failed)
+    if cache:
+        await store_reply(cache, CachedReply("".join(pieces), "", {}), tag)
+    if session_id:
+        await LocalDatabase.run(
+            ConversationStore.append, session_id,
+            [{'role': 'user', 'content': last_message}, {'role': 'assistant', 'content': "".join(pieces)}], tag
+        )
+
+def completion_chunk(completion_id, created, model, delta, finish_reason=None):
+    # same shape as OpenAI's chat.completion.chunk, so OpenAI clients can read the stream
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+async def cache_run(fn, *args):
+    # the memory tier is a dict lookup, only the SQLite tier needs the database executor
+    if ResponseCache.settings.sqlite:
+        return await LocalDatabase.run(fn, *args)
+    return fn(*args)
+
+async def response_cache_policy(request: ChatRequest, raw: Request) -> Optional[CachePolicy]:
+    # a session continues from stored history the key does not cover, so it is never cached
+    if request.session_id or not (ResponseCache.settings.enabled or SemanticCache.settings.enabled):
+        return None
+    agent_record = await LocalDatabase.run(LatticeAgent.get, request.agent) if request.agent else None
+    messages = [m.model_dump() for m in request.messages]
+    cache_control = raw.headers.get("cache-control")
+    policy = ResponseCache.policy(request.model, request.agent, agent_record, messages,
+                                  request.options, request.format, cache_control)
+    if SemanticCache.settings.enabled:
+        policy.semantic_request = (request.model, request.agent, agent_record, messages, cache_control,
+                                   request.options, request.format)
+    return policy
+
+async def semantic_lookup(cache: CachePolicy):
+    # embedding is a round-trip to a backend, made once per request and only when it is needed
+    if cache.semantic_request is not None:
+        args, cache.semantic_request = cache.semantic_request, None
+        cache.semantic = await SemanticCache.prepare(*args)
+    return cache.semantic
+
+async def cached_reply(cache: CachePolicy) -> Optional[CachedReply]:
+    """
+    The exact match if there is one, otherwise the answer to a similar enough question.
+    """
+    reply = await cache_run(ResponseCache.get, cache)
+    if reply is None:
+        semantic = await semantic_lookup(cache)
+        if semantic and semantic.lookup:
+            reply = SemanticCache.get(semantic)
+            cache.status = "semantic-hit" if reply else "miss"
+    return reply
+
+async def store_reply(cache: CachePolicy, reply: CachedReply, tag):
+    await cache_run(ResponseCache.put, cache, reply, tag)
+    semantic = await semantic_lookup(cache)
+    if semantic:
+        SemanticCache.put(semantic, reply)
+
+async def cached_pieces(reply: CachedReply):
+    yield reply.content
+
+async def admitted_pieces(pieces):
+    """
+    pieces, once its first piece has come. A connection too busy to take the request raises
+    BackendBusy here, before the response has started and a 503 can still be sent.
+    """
+    try:
+        first = await pieces.__anext__()
+    except StopAsyncIteration:
+        return pieces
+    except StreamFailed as e:
+        error = e
+
+        async def failed():
+            raise error
+            yield
+        return failed()
+
+    async def resumed():
+        yield first
+        async for piece in pieces:
+            yield piece
+    return resumed()
+
+def backend_busy(request: ChatRequest, api_key: str, started: float, error: BackendBusy) -> HTTPException:
+    UsageLedger.record(request.agent, request.model, api_key, count_tokens(request.messages), 0,
+                       (time.perf_counter() - started) * 1000, ok=False)
+    return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(error), headers={"Retry-After": "1"})
+
+async def stream_chat(request: ChatRequest, api_key: str, completion_id: str, ndjson: bool,
+                      cache: Optional[CachePolicy] = None, cached: Optional[CachedReply] = None,
+                      pieces_source=None, started: Optional[float] = None):
+    """
+    Chat completion chunks as server-sent events, or one JSON object per line when ndjson is set.
+    A cached reply is sent as a single chunk. pieces_source replaces the generation, e.g. with a shared stream.
+    A generation that fails ends with finish_reason "error" and an error object in the last chunk.
+    started is when the request came in, if earlier than the response.
+    """
+    if pieces_source is None:
+        pieces_source = cached_pieces(cached) if cached else stream_ai_response(
+            request.messages, request.model, request.agent, request.session_id, cache)
+    def frame(payload):
+        return json.dumps(payload) + "\n" if ndjson else f"data: {json.dumps(payload)}\n\n"
+
+    created = int(time.time())
+    started = started or time.perf_counter()
+    first_token_ms = None
+    pieces = []
+    finished = False
+    error = None
+    try:
+        yield frame(completion_chunk(completion_id, created, request.model, {"role": "assistant"}))
+        try:
+            async for piece in pieces_source:
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - started) * 1000
+                pieces.append(piece)
+                yield frame(completion_chunk(completion_id, created, request.model, {"content": piece}))
+        except StreamFailed as e:
+            error = str(e)
+            if not pieces:
+                # clients that ignore the error still show something
+                yield frame(completion_chunk(completion_id, created, request.model, {"content": error}))
+        prompt_tokens = count_tokens(request.messages)
+        completion_tokens = count_tokens([Message(role="assistant", content="".join(pieces))])
+        last = completion_chunk(completion_id, created, request.model, {}, "error" if error else "stop")
+        last["usage"] = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+        if error:
+            last["error"] = {"message": error, "type": "generation_failed"}
+        yield frame(last)
+        if not ndjson:
+            yield "data: [DONE]\n\n"
+        finished = error is None
+    finally:
+        # also reached when the client goes away mid stream
+        latency_ms = (time.perf_counter() - started) * 1000
+        UsageLedger.record(request.agent, request.model, api_key, count_tokens(request.messages),
+                           count_tokens([Message(role="assistant", content="".join(pieces))]), latency_ms, ok=finished)
+        logger.debug(f"Streamed {completion_id}: first token after {first_token_ms} ms, done after {latency_ms:.1f} ms")
 
 # Helper function to count tokens (simplified)
 def count_tokens(messages):
@@ -109,6 +426,29 @@ def count_tokens(messages):
     text = " ".join([m.content for m in messages])
     return len(text.split())
 
+def request_api_key(raw: Request) -> str:
+    """
+    The bearer token of a request, if any, labelled for accounting.
+    """
+    scheme, _, token = raw.headers.get("authorization", "").partition(" ")
+    return key_label(token.strip() if scheme.lower() == "bearer" else "", API_KEYS)
+
+def request_tenant(api_key: str) -> str:
+    """
+    The tenant a request gets its fair share as: the owner of a known key, otherwise the one anonymous tenant.
+    """
+    # tokens not in API_KEYS cost nothing to make up, each must not buy another share
+    return api_key if api_key in API_KEYS.values() else ""
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    # query parameters may be epoch seconds or ISO 8601
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
 async def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)):
     api_key = credentials.credentials
     if api_key not in API_KEYS:
@@ -132,8 +472,9 @@ async def get_all_models():
         models=LLMmodels()
         latticemodels = models.list()
         tags.extend(latticemodels.keys())
-        agents=LatticeAgent.list()
-        tags.extend(agents.keys())
+        tags.extend(await LocalDatabase.run(ModelGroups.listdown))
+        agents=await LocalDatabase.run(LatticeAgent.listdown)
+        tags.extend(agents)
         return JSONResponse({
             'tags':tags
         })
@@ -146,12 +487,64 @@ async def get_openapi():
 
 @app.post("/chat/completions", response_model=Union[ChatCompletionResponse, None])
 @app.post("/api/lattice/chat", response_model=Union[ChatCompletionResponse, None])
-async def chatwithagent(request: ChatRequest):
+async def chatwithagent(request: ChatRequest, raw: Request, response: Response):
     completion_id = f"chatcmpl-{str(uuid.uuid4())}"
     logger.info(f"Received chat request: {request}")
-    ai_response, additonal_context, headers = await generate_ai_response(request.messages, request.model, request.agent)
+    api_key = request_api_key(raw)
+    try:
+        # queued model calls of this request are ordered by its class and key
+        RequestScheduler.enter(RequestScheduler.classify(request_tenant(api_key), raw.headers.get(RequestScheduler.settings.header)))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    started = time.perf_counter()
+    cache = await response_cache_policy(request, raw)
+    cached = await cached_reply(cache) if cache else None
+    cache_headers = {"X-Lattice-Cache": cache.status} if cache else {}
+    # identical requests running at the same time share one execution; sessions each have their own history
+    coalesce_key = None if cached or request.session_id else request_key(
+        request.model, request.agent, [m.model_dump() for m in request.messages], request.options, request.format, bool(request.stream),
+        RequestScheduler.current().priority)
+    if request.stream:
+        ndjson = "application/x-ndjson" in raw.headers.get("accept", "")
+        pieces_source = None
+        if coalesce_key:
+            pieces_source, shared = RequestCoalescer.stream(coalesce_key, lambda: stream_ai_response(
+                request.messages, request.model, request.agent, request.session_id, cache))
+            cache_headers["X-Lattice-Coalesced"] = "true" if shared else "false"
+        elif not cached:
+            pieces_source = stream_ai_response(request.messages, request.model, request.agent, request.session_id, cache)
+        if pieces_source is not None:
+            try:
+                pieces_source = await admitted_pieces(pieces_source)
+            except BackendBusy as e:
+                raise backend_busy(request, api_key, started, e)
+        return StreamingResponse(
+            stream_chat(request, api_key, completion_id, ndjson, cache, cached, pieces_source, started),
+            media_type="application/x-ndjson" if ndjson else "text/event-stream",
+            # proxies must pass chunks on as they come
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **cache_headers},
+        )
+    response.headers.update(cache_headers)
+    try:
+        if cached:
+            ai_response, additonal_context, headers = cached
+            answered = True
+        elif coalesce_key:
+            (ai_response, additonal_context, headers, answered), shared = await RequestCoalescer.run(coalesce_key, lambda: generate_ai_response(
+                request.messages, request.model, request.agent, request.session_id, cache))
+            response.headers["X-Lattice-Coalesced"] = "true" if shared else "false"
+        else:
+            ai_response, additonal_context, headers, answered = await generate_ai_response(request.messages, request.model, request.agent, request.session_id, cache)
+    except BackendBusy as e:
+        raise backend_busy(request, api_key, started, e)
+    except Exception:
+        UsageLedger.record(request.agent, request.model, api_key, count_tokens(request.messages), 0,
+                           (time.perf_counter() - started) * 1000, ok=False)
+        raise
+    latency_ms = (time.perf_counter() - started) * 1000
     completion_tokens = count_tokens([Message(role="assistant", content=ai_response)])
     prompt_tokens = count_tokens(request.messages)
+    UsageLedger.record(request.agent, request.model, api_key, prompt_tokens, completion_tokens, latency_ms, ok=answered)
     logger.debug(f"Additional context: {additonal_context}")
     response_data = {
         "id": completion_id,
@@ -184,13 +577,14 @@ async def chatwithagent(request: ChatRequest):
 @app.post("/api/lattice/connections")
 async def create_connection(request: ConnectionModel):
     try:
-        CONNECTIONS=LlmConnections.list()
+        CONNECTIONS=await LocalDatabase.run(LlmConnections.list)
         logger.info(f"Creating connection: {request}")
         if not request.id or not request.url:
             raise HTTPException(status_code=400, detail="ID and URL are required")
         if request.id in CONNECTIONS:
             raise HTTPException(status_code=400, detail="Connection already exists")
-        LlmConnections.add(request.id, request)
+        await LocalDatabase.run(LlmConnections.add, request.id, request)
+        LLMmodels.request_refresh()
         logger.info(f"Connection created: {request.id}")    
         return JSONResponse({
             "status": "success",
@@ -203,7 +597,7 @@ async def create_connection(request: ConnectionModel):
 @app.get("/api/lattice/connections")
 async def list_connections():
     try:
-        connections = LlmConnections.listdown()
+        connections = await LocalDatabase.run(LlmConnections.listdown)
         return JSONResponse({
             "connections": list(connections)
         })
@@ -213,7 +607,7 @@ async def list_connections():
 @app.get("/api/lattice/connections/{connection_id}")
 async def get_connection(connection_id: str):
     try:
-        connection = LlmConnections.get(connection_id)
+        connection = await LocalDatabase.run(LlmConnections.get, connection_id)
         if not connection:
             raise HTTPException(status_code=404, detail="Connection not found")
         
@@ -226,11 +620,13 @@ async def get_connection(connection_id: str):
 @app.delete("/api/lattice/connections/{connection_id}")
 async def delete_connection(connection_id: str):
     try:
-        if connection_id not in LlmConnections.list():
+        if connection_id not in await LocalDatabase.run(LlmConnections.list):
             raise HTTPException(status_code=404, detail="Connection not found")
         
         # Delete the connection
-        LlmConnections.delete(connection_id)
+        await LocalDatabase.run(LlmConnections.delete, connection_id)
+        ClientPool.discard(connection_id)
+        LLMmodels.request_refresh()
         return JSONResponse({
             "status": "success",
             "connection_id": connection_id,
@@ -239,11 +635,54 @@ async def delete_connection(connection_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+# -------  model group API endpoints ------------
+@app.post("/api/lattice/modelgroups")
+async def create_model_group(request: ModelGroupModel):
+    if request.id in LLMmodels().list():
+        raise HTTPException(status_code=400, detail=f"{request.id} is already the name of a model")
+    if not request.connections:
+        raise HTTPException(status_code=400, detail="A model group needs at least one connection")
+    try:
+        await LocalDatabase.run(ModelGroups.add, request.id, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse({
+        "status": "success",
+        "group_id": request.id,
+        "message": "Model group created successfully"
+    })
+
+@app.get("/api/lattice/modelgroups")
+async def list_model_groups():
+    groups = await LocalDatabase.run(ModelGroups.list)
+    for group in groups.values():
+        group["replicas"] = ModelRouter.replicas(ModelGroupModel(**group))
+    return JSONResponse({"modelgroups": groups})
+
+@app.delete("/api/lattice/modelgroups/{group_id}")
+async def delete_model_group(group_id: str):
+    if group_id not in await LocalDatabase.run(ModelGroups.listdown):
+        raise HTTPException(status_code=404, detail="Model group not found")
+    await LocalDatabase.run(ModelGroups.delete, group_id)
+    return JSONResponse({
+        "status": "success",
+        "group_id": group_id,
+        "message": "Model group deleted successfully"
+    })
+
+@app.get("/api/lattice/admin/routing")
+async def get_routing_stats():
+    return ModelRouter.stats()
+
+@app.get("/api/lattice/admin/backends")
+async def get_backend_stats():
+    return BackendLimits.stats()
+
 # -------  prompt API endpoints ------------
 @app.get("/api/lattice/prompts")
 async def list_prompts():
     try:
-        prompts = Promptlist.listdown()
+        prompts = await LocalDatabase.run(Promptlist.listdown)
         return JSONResponse({
             "prompts": list(prompts)
         })
@@ -256,11 +695,11 @@ async def create_prompt(request: PromptModel):
         if not request.id or not request.prompt:
             raise HTTPException(status_code=400, detail="ID and prompt are required")
         # Check if the prompt with the same ID already exists
-        existing_prompts = Promptlist.list()
+        existing_prompts = await LocalDatabase.run(Promptlist.list)
         if request.id in existing_prompts:
             raise HTTPException(status_code=400, detail="Prompt with this ID already exists")
         # Add the prompt to the list
-        Promptlist.add(request.id, request)
+        await LocalDatabase.run(Promptlist.add, request.id, request)
         return JSONResponse({
             "status": "success",
             "prompt_id": request.id,
@@ -272,7 +711,7 @@ async def create_prompt(request: PromptModel):
 @app.get("/api/lattice/prompts/{prompt_id}")
 async def get_prompt(prompt_id: str):
     try:
-        prompt = Promptlist.get(prompt_id)
+        prompt = await LocalDatabase.run(Promptlist.get, prompt_id)
         if not prompt:
             raise HTTPException(status_code=404, detail="Prompt not found")
         
@@ -285,11 +724,11 @@ async def get_prompt(prompt_id: str):
 @app.delete("/api/lattice/prompts/{prompt_id}")
 async def delete_prompt(prompt_id: str):
     try:
-        if prompt_id not in Promptlist.list():
+        if prompt_id not in await LocalDatabase.run(Promptlist.list):
             raise HTTPException(status_code=404, detail="Prompt not found")
         
         # Delete the prompt
-        Promptlist.delete(prompt_id)
+        await LocalDatabase.run(Promptlist.delete, prompt_id)
         return JSONResponse({
             "status": "success",
             "prompt_id": prompt_id,
@@ -310,6 +749,16 @@ async def list_models_details():
         "models": latticemodels
     }
 
+@app.post("/api/lattice/models/refresh")
+async def refresh_models():
+    # runs the discovery now and waits for it, chat requests keep using the current catalog meanwhile
+    result = await asyncio.to_thread(LLMmodels.refresh)
+    return JSONResponse({**result, "catalog": LLMmodels.status()})
+
+@app.get("/api/lattice/admin/catalog/models")
+async def get_model_catalog_status():
+    return LLMmodels.status()
+
 @app.get("/api/lattice/models/{model_id}")
 async def get_model_details(model_id: str):
     models=LLMmodels()
@@ -328,7 +777,7 @@ async def create_lattice_agents(request: LatticeAgent):
         # Here you would implement the logic to create a model
         # For now, we just return a dummy response
         logger.info(f"Creating agent: {request}")
-        request.create()
+        await LocalDatabase.run(request.create)
         return JSONResponse({
             "status": "success",
             "agent": f"Agent {request.id} created"
@@ -339,7 +788,7 @@ async def create_lattice_agents(request: LatticeAgent):
 @app.get("/api/lattice/agents")
 async def get_lattice_agents():
     try:
-        agents=LatticeAgent.listdown()
+        agents=await LocalDatabase.run(LatticeAgent.listdown)
         if not agents:
             raise HTTPException(status_code=404, detail="Agents not found")
         
@@ -353,10 +802,10 @@ async def get_lattice_agents():
 @app.get("/api/lattice/agents/{agent_id}")
 async def get_agents_info(agent_id: str):
     try:
-        agents=LatticeAgent.listdown()
+        agents=await LocalDatabase.run(LatticeAgent.listdown)
         if agent_id not in agents:
             raise HTTPException(status_code=404, detail="Agents not found")
-        agent_details = LatticeAgent.get(agent_id)
+        agent_details = await LocalDatabase.run(LatticeAgent.get, agent_id)
         return JSONResponse({
             "Lattice Agents": agent_details
         })
@@ -366,10 +815,10 @@ async def get_agents_info(agent_id: str):
 @app.delete("/api/lattice/agents/{agent_id}")
 async def del_agents_info(agent_id: str):
     try:
-        agents=LatticeAgent.listdown()
+        agents=await LocalDatabase.run(LatticeAgent.listdown)
         if agent_id not in agents:
             raise HTTPException(status_code=404, detail="Agents not found")
-        agent_details = LatticeAgent.delete(agent_id)
+        agent_details = await LocalDatabase.run(LatticeAgent.delete, agent_id)
         logger.info(f"Deleted agent info: {agent_details}")
         if agent_details:
             return JSONResponse({
@@ -383,11 +832,11 @@ async def del_agents_info(agent_id: str):
 @app.put("/api/lattice/agents/{agent_id}")
 async def update_agent_info(agent_id: str, request: LatticeAgent):
     try:
-        agents=LatticeAgent.listdown()
+        agents=await LocalDatabase.run(LatticeAgent.listdown)
         if agent_id not in agents:
             raise HTTPException(status_code=404, detail="Agents not found")
         logger.info(f"updating agent: {request}")
-        agent_details = LatticeAgent.update(agent_id, request.model_dump())
+        agent_details = await LocalDatabase.run(LatticeAgent.update, agent_id, request.model_dump())
         return JSONResponse({
             "status": "success",
             "agent": f"Agent {agent_id} updated"
@@ -400,9 +849,9 @@ async def update_agent_info(agent_id: str, request: LatticeAgent):
 @app.get("/api/lattice/toolserver")
 async def get_tool_servers():
     try:
-        s= servertooldata()
+        s= await asyncio.to_thread(servertooldata)
         return JSONResponse({
-            "Lattice Servers": s.list()
+            "Lattice Servers": await LocalDatabase.run(s.list)
         })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -410,7 +859,7 @@ async def get_tool_servers():
 @app.get("/api/lattice/tools/{server_id}")
 async def get_tool_server_details(server_id: str):
     try:
-        s= servertooldata()
+        s= await asyncio.to_thread(servertooldata)
         servers=s.server_tools
         #logger.debug(servers)
         if server_id not in servers.keys():
@@ -425,7 +874,7 @@ async def get_tool_server_details(server_id: str):
 @app.get("/api/lattice/tools")
 async def get_tool_server():
     try:
-        s= servertooldata()
+        s= await asyncio.to_thread(servertooldata)
         server_details=s.tooldata
         logger.info("got all tools from all servers")
         return JSONResponse({
@@ -438,12 +887,13 @@ async def get_tool_server():
 @app.delete("/api/lattice/toolserver/{server_id}")
 async def del_tool_server(server_id: str):
     try:
-        s= servertooldata()
+        s= await asyncio.to_thread(servertooldata)
         servers=s.tooldata
         logger.debug(servers)
         if server_id not in servers.keys():
             raise HTTPException(status_code=404, detail="Agents not found")
-        if s.delete(server_id):
+        if await LocalDatabase.run(s.delete, server_id):
+            await asyncio.to_thread(servertooldata.refresh)
             return JSONResponse({
                 "status": f"successfully deleted {server_id}"
             })
@@ -456,7 +906,9 @@ async def del_tool_server(server_id: str):
 async def create_lattice_server(request: ToolServer):
     try:
         logger.info(f"server being added: {request}")
-        servertooldata.add(request)
+        await LocalDatabase.run(servertooldata.add, request)
+        # the new server's tools are listed before the call returns
+        await asyncio.to_thread(servertooldata.refresh)
         return JSONResponse({
             "status": "successfully added",
         })
@@ -468,7 +920,160 @@ async def create_lattice_server(request: ToolServer):
 # -------  vector DB API endpoints ------------
 @app.get("/api/lattice/vectordbs")
 async def list_vectordbs():
-    return VectorDBlist.list()
+    return await LocalDatabase.run(VectorDBlist.list)
+
+# -------  search endpoints ------------
+@app.get("/api/lattice/search")
+async def search_catalogs(q: str, limit: int = 20):
+    try:
+        return JSONResponse({"query": q, "results": await LocalDatabase.run(search_all, q, limit)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/lattice/search/{kind}")
+async def search_catalog(kind: str, q: str, limit: int = 20):
+    try:
+        return JSONResponse({"query": q, "kind": kind, "results": await LocalDatabase.run(search, kind, q, limit)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# -------  usage endpoints ------------
+@app.get("/api/lattice/usage")
+async def get_usage(period: str = "hour", start: Optional[str] = None, end: Optional[str] = None,
+                    agent: Optional[str] = None, model: Optional[str] = None, api_key: Optional[str] = None,
+                    group_by: Optional[str] = "bucket,agent,model"):
+    try:
+        columns = [c.strip() for c in (group_by or "").split(",") if c.strip()]
+        rows = await LocalDatabase.run(
+            UsageLedger.query, period, parse_time(start), parse_time(end), agent, model, api_key, columns
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse({"period": period, "usage": rows})
+
+@app.get("/api/lattice/admin/usage/ledger")
+async def get_usage_ledger_stats():
+    return UsageLedger.stats()
+
+# -------  response cache endpoints ------------
+@app.get("/api/lattice/admin/cache/responses")
+async def get_response_cache_stats():
+    return ResponseCache.stats()
+
+@app.delete("/api/lattice/admin/cache/responses")
+async def clear_response_cache(agent: Optional[str] = None):
+    removed = await LocalDatabase.run(ResponseCache.clear, agent)
+    ResponseCache.reset_stats()
+    return {"message": "Response cache cleared", "rows_removed": removed}
+
+@app.get("/api/lattice/admin/coalescing")
+async def get_coalescing_stats():
+    return RequestCoalescer.stats()
+
+@app.get("/api/lattice/admin/cache/semantic")
+async def get_semantic_cache_stats():
+    return SemanticCache.stats()
+
+@app.delete("/api/lattice/admin/cache/semantic")
+async def clear_semantic_cache():
+    SemanticCache.clear()
+    SemanticCache.reset_stats()
+    return {"message": "Semantic cache cleared"}
+
+# -------  conversation memory endpoints ------------
+@app.get("/api/lattice/sessions/{session_id}")
+async def get_session(session_id: str, limit: int = 100):
+    session = await LocalDatabase.run(ConversationStore.get, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    messages = await LocalDatabase.run(ConversationStore.window, session_id, limit, None)
+    return JSONResponse({"session": session, "messages": messages})
+
+@app.delete("/api/lattice/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not await LocalDatabase.run(ConversationStore.get, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    if not await LocalDatabase.run(ConversationStore.delete, session_id):
+        raise HTTPException(status_code=500, detail="unable to delete")
+    return JSONResponse({"status": f"successfully deleted {session_id}"})
+
+# -------  bulk import / export endpoints ------------
+@app.get("/api/lattice/bulk/{kind}")
+async def bulk_export(kind: str):
+    try:
+        get_kind(kind)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    # the generator runs in the threadpool and reads from its own cursor batch by batch
+    return StreamingResponse(export_ndjson(kind), media_type="application/x-ndjson")
+
+@app.post("/api/lattice/bulk/{kind}")
+async def bulk_import(kind: str, request: Request, on_conflict: ConflictMode = 'error', atomic: bool = False):
+    try:
+        importer = BulkImport(kind, on_conflict=on_conflict, atomic=atomic)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    try:
+        pending = b""
+        async for chunk in request.stream():
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            if lines:
+                await LocalDatabase.run(importer.feed, lines)
+        if pending:
+            await LocalDatabase.run(importer.feed, [pending])
+        report = await LocalDatabase.run(importer.commit)
+        if report["written"] and importer.kind.refresh:
+            # like a single add, the imported tool servers are listed before the call returns
+            await asyncio.to_thread(importer.kind.refresh)
+    except Exception as e:
+        logger.error(f"Bulk import of {kind} failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    # 207 tells the caller to look at the per-row errors
+    return JSONResponse(report, status_code=207 if report["failed"] else 200)
+
+# -------  admin API endpoints ------------
+@app.get("/api/lattice/admin/db/pool")
+async def get_db_pool_stats():
+    return LocalDatabase.pool_stats()
+
+@app.get("/api/lattice/admin/db/queries")
+async def get_db_query_stats(order: str = "total", limit: Optional[int] = 50):
+    try:
+        return JSONResponse({"slow_query_ms": QueryStats.slow_query_ms, "queries": QueryStats.report(order, limit)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/api/lattice/admin/db/queries")
+async def reset_db_query_stats():
+    QueryStats.reset()
+    return JSONResponse({"status": "query statistics reset"})
+
+class SnapshotRequest(BaseModel):
+    name: Optional[str] = None   # file name inside the snapshot folder, a timestamped name by default
+
+@app.get("/api/lattice/admin/db/snapshots")
+async def list_db_snapshots():
+    return JSONResponse(await asyncio.to_thread(snapshot.list_snapshots))
+
+@app.post("/api/lattice/admin/db/snapshot")
+async def create_db_snapshot(request: Optional[SnapshotRequest] = None):
+    request = request or SnapshotRequest()
+    dest = None
+    if request.name:
+        # snapshots are only written into the snapshot folder, never to a caller chosen path
+        if os.path.basename(request.name) != request.name or request.name.startswith("."):
+            raise HTTPException(status_code=400, detail="name must be a plain file name")
+        name = request.name if request.name.endswith(snapshot.SNAPSHOT_SUFFIX) else request.name + snapshot.SNAPSHOT_SUFFIX
+        dest = os.path.join(snapshot.snapshot_dir(), name)
+    try:
+        # a long copy, run it on its own thread rather than a database worker
+        info = await asyncio.to_thread(snapshot.create_snapshot, dest)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(info, status_code=201)
 
 # -----  workflow API endpoints ------------
 @app.get("/api/lattice/workflows")
@@ -0,0 +1,33 @@
+import os
+import tempfile
+import pytest
+
+# modules under test read LATTICE_DB_PATH lazily, point it at a scratch database before anything imports them
+os.environ.setdefault("LATTICE_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="lattice-engine-tests-"), "localdb"))
+
+from latticepy.engine.services.localdatabase import LocalDatabase, LocalDBModel
+from latticepy.engine.services.migrations import migrate
+from latticepy.engine.services.backendlimits import BackendLimits, LimiterModel
+
+
+@pytest.fixture
+def local_db(tmp_path, monkeypatch):
+    """
+    A fresh engine database in tmp_path, configured as the process wide database.
+    """
+    monkeypatch.setenv("LATTICE_DB_PATH", str(tmp_path / "localdb"))
+    db = LocalDatabase(LocalDBModel(name="localdb", url_path=str(tmp_path)))
+    migrate()
+    yield db
+    LocalDatabase.close_all()
+    LocalDatabase.settings = None
+
+
+@pytest.fixture(autouse=True)
+def backend_limits():
+    """
+    Every test starts with default, empty per-connection limits.
+    """
+    BackendLimits.configure(LimiterModel())
+    yield BackendLimits
+    BackendLimits.configure(LimiterModel())
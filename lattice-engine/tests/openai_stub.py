@@ -0,0 +1,98 @@
+"""
+A local stand-in for an OpenAI compatible inference server (vLLM, llama.cpp server, TGI).
+
+It answers /v1/models and /v1/chat/completions over HTTP/1.1 keep-alive, echoes the last
+user message, streams it word by word when asked, and calls the first offered tool when
+the message mentions it.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/v1/models":
+            return self._json(404, {"error": {"message": "not found"}})
+        self._json(200, {"object": "list", "data": [{"id": m, "object": "model", "owned_by": "stub"} for m in self.server.models]})
+
+    def do_POST(self):
+        if self.path != "/v1/chat/completions":
+            return self._json(404, {"error": {"message": "not found"}})
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.requests.append({**body, "authorization": self.headers.get("Authorization")})
+        text = f"echo {body['messages'][-1]['content']}"
+        tools = body.get("tools") or []
+        if tools and tools[0]["function"]["name"] in body["messages"][-1]["content"]:
+            call = {"id": "call_1", "type": "function",
+                    "function": {"name": tools[0]["function"]["name"], "arguments": json.dumps({"city": "Paris"})}}
+            message = {"role": "assistant", "content": None, "tool_calls": [call]}
+        else:
+            message = {"role": "assistant", "content": text}
+        if body.get("stream"):
+            return self._stream(body["model"], text)
+        self._json(200, {"id": "chatcmpl-stub", "object": "chat.completion", "model": body["model"],
+                         "choices": [{"index": 0, "message": message, "finish_reason": "stop"}]})
+
+    def _stream(self, model, text):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            delta = {"content": word if i == 0 else " " + word}
+            self._chunk(f"data: {json.dumps({'object': 'chat.completion.chunk', 'model': model, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})}\n\n")
+            time.sleep(self.server.delay)
+        self._chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, text):
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class OpenAIStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, models=("stub-1",), delay=0.0):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.models = list(models)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,227 @@
+import asyncio
+import time
+
+import pytest
+
+from latticepy.engine.services.backendlimits import BackendLimits, BackendLimiter, BackendBusy, LimiterModel, Signal
+
+
+async def hold(limiter, seconds, ok=True, signal=None):
+    await limiter.acquire()
+    await asyncio.sleep(seconds)
+    limiter.release(ok, signal)
+
+
+def test_requests_beyond_the_limit_wait_their_turn():
+    limiter = BackendLimiter('a', LimiterModel(initial_limit=2))
+
+    async def scenario():
+        tasks = [asyncio.create_task(hold(limiter, 0.05)) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        busy = limiter.stats()
+        await asyncio.gather(*tasks)
+        return busy, limiter.stats()
+
+    busy, done = asyncio.run(scenario())
+    assert (busy['in_flight'], busy['queued']) == (2, 3)
+    assert (done['in_flight'], done['queued'], done['admitted']) == (0, 0, 5)
+    assert done['wait_ms_max'] >= 40
+
+
+def test_a_full_queue_rejects_at_once():
+    limiter = BackendLimiter('a', LimiterModel(initial_limit=1, max_queue=2))
+
+    async def scenario():
+        tasks = [asyncio.create_task(hold(limiter, 0.05)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        with pytest.raises(BackendBusy):
+            await limiter.acquire()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert limiter.stats()['rejected'] == 1
+
+
+def test_waiting_past_the_deadline_gives_up_and_frees_the_queue():
+    limiter = BackendLimiter('a', LimiterModel(initial_limit=1, queue_timeout=0.05))
+
+    async def scenario():
+        holder = asyncio.create_task(hold(limiter, 0.2))
+        await asyncio.sleep(0.01)
+        with pytest.raises(BackendBusy):
+            await limiter.acquire()
+        queued = limiter.stats()['queued']
+        await holder
+        return queued
+
+    assert asyncio.run(scenario()) == 0
+    assert limiter.stats()['timed_out'] == 1
+
+
+def test_errors_and_slow_first_pieces_shrink_the_limit():
+    limiter = BackendLimiter('a', LimiterModel(initial_limit=8, backoff=0.5))
+
+    async def scenario():
+        for _ in range(5):
+            await hold(limiter, 0, signal=Signal("first_piece", 0, 100))
+        await hold(limiter, 0, ok=False)
+        after_error = limiter.limit
+        await hold(limiter, 0, signal=Signal("first_piece", 0, 1000))
+        return after_error, limiter.limit
+
+    after_error, after_slow = asyncio.run(scenario())
+    assert after_error == 4
+    assert after_slow == 2
+    assert limiter.stats()['overloads'] == 2
+
+
+def test_the_limit_grows_only_while_saturated():
+    limiter = BackendLimiter('a', LimiterModel(initial_limit=2, max_limit=4))
+
+    async def scenario():
+        for _ in range(5):
+            await hold(limiter, 0)
+        idle = limiter.limit
+        for _ in range(20):
+            await asyncio.gather(*[hold(limiter, 0.001) for _ in range(6)])
+        return idle, limiter.limit
+
+    idle, saturated = asyncio.run(scenario())
+    assert idle == 2
+    assert saturated == 4
+
+
+def test_long_answers_from_an_idle_backend_are_not_overload(backend_limits):
+    backend_limits.configure(LimiterModel(initial_limit=4))
+
+    async def reply(tokens, stream):
+        # 10 ms before the first token, then 1 ms per token
+        async with BackendLimits.slot('a') as sample:
+            await asyncio.sleep(0.01)
+            if stream:
+                sample.first_piece()
+            await asyncio.sleep(tokens / 1000)
+            if not stream:
+                sample.done("reply", tokens)
+
+    async def scenario():
+        for tokens in (0, 100, 5, 200, 50, 150, 10, 80):
+            await asyncio.gather(*[reply(tokens, stream=i % 2 == 0) for i in range(4)])
+
+    asyncio.run(scenario())
+    stats = BackendLimits.stats()['a']
+    assert stats['overloads'] == 0
+    assert stats['limit'] >= 4 and stats['completed'] == 32
+    assert stats['baselines']['reply']['ms_per_token'] > 0.5
+
+
+def test_slow_complete_replies_shrink_the_limit(backend_limits):
+    backend_limits.configure(LimiterModel(initial_limit=8, backoff=0.5))
+
+    async def reply(tokens, ms_per_token):
+        async with BackendLimits.slot('a') as sample:
+            await asyncio.sleep(0.005 + tokens * ms_per_token / 1000)
+            sample.done("reply", tokens)
+
+    async def scenario():
+        for tokens in (10, 40, 20, 30, 10, 40):
+            await reply(tokens, 0.5)
+        fast = BackendLimits.get('a').limit
+        # the same lengths, now four times as slow
+        for tokens in (10, 40):
+            await reply(tokens, 2.0)
+        return fast, BackendLimits.get('a').limit
+
+    fast, slow = asyncio.run(scenario())
+    assert fast == 8
+    assert slow == 2
+    assert BackendLimits.stats()['a']['overloads'] == 2
+
+
+def test_slot_counts_exceptions_but_not_cancellation(backend_limits):
+    backend_limits.configure(LimiterModel(initial_limit=4))
+
+    async def failing():
+        async with BackendLimits.slot('a'):
+            raise ConnectionError("down")
+
+    async def cancelled():
+        async with BackendLimits.slot('a'):
+            await asyncio.sleep(1)
+
+    async def scenario():
+        with pytest.raises(ConnectionError):
+            await failing()
+        task = asyncio.create_task(cancelled())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    stats = BackendLimits.stats()['a']
+    assert (stats['errors'], stats['completed'], stats['in_flight']) == (1, 0, 0)
+
+
+class SlowProvider:
+    def __init__(self, connection, timeout):
+        pass
+
+    async def achat(self, model, messages, tools=None):
+        await asyncio.sleep(0.3)
+        return 'late', []
+
+    async def astream(self, model, messages):
+        await asyncio.sleep(0.3)
+        yield 'late'
+
+    async def aclose(self):
+        pass
+
+
+@pytest.fixture
+def slow_model(local_db, monkeypatch, backend_limits):
+    from latticepy.engine.interfaces import llminterface
+    from latticepy.engine.interfaces.clientinterface import LLMmodels, Model, ConnectionModel
+    monkeypatch.setitem(llminterface.PROVIDERS, 'slow', SlowProvider)
+    source = ConnectionModel(id='local', source='slow', url='http://slow', api_key=None)
+    monkeypatch.setattr(LLMmodels, 'MODELS', {'local_slow': Model(name='local_slow', model='slow', source=source, details={})})
+    monkeypatch.setattr(LLMmodels, 'refreshed_at', time.time())
+    backend_limits.configure(LimiterModel(initial_limit=1, max_queue=0))
+    yield 'local_slow'
+    llminterface.ClientPool.close_all()
+
+
+def _post_together(requests):
+    import httpx
+    from latticepy.engine.services.webserver import app
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*[client.post("/api/lattice/chat", json=body) for body in requests])
+
+    return asyncio.run(scenario())
+
+
+def test_busy_backend_answers_503_with_retry_after(slow_model):
+    from fastapi.testclient import TestClient
+    from latticepy.engine.services.webserver import app
+    replies = _post_together([{"model": slow_model, "messages": [{"role": "user", "content": f"hi {i}"}]} for i in range(2)])
+    assert sorted(r.status_code for r in replies) == [200, 503]
+    busy = next(r for r in replies if r.status_code == 503)
+    assert busy.headers['retry-after'] == '1'
+    assert TestClient(app).get("/api/lattice/admin/backends").json()['local']['rejected'] == 1
+
+
+def test_busy_backend_answers_streams_with_503_too(slow_model):
+    from latticepy.engine.services.usageledger import UsageLedger
+    UsageLedger._queue.clear()
+    replies = _post_together([{"model": slow_model, "stream": True, "messages": [{"role": "user", "content": f"hi {i}"}]}
+                              for i in range(2)])
+    assert sorted(r.status_code for r in replies) == [200, 503]
+    busy = next(r for r in replies if r.status_code == 503)
+    assert busy.headers['retry-after'] == '1' and 'late' not in busy.text
+    served = next(r for r in replies if r.status_code == 200)
+    assert 'late' in served.text and served.text.rstrip().endswith('[DONE]')
+    assert sorted(e.ok for e in UsageLedger._queue) == [False, True]
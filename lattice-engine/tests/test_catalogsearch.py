@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+
+def test_indexes_follow_inserts_updates_and_deletes(local_db):
+    from latticepy.engine.services.catalogsearch import search
+    cur = local_db.connect()
+    cur.executemany("INSERT INTO prompts (id, prompt) VALUES (?, ?)", [
+        ("translator", "Translate the user's text into French"),
+        ("summarizer", "Summarize long documents in three bullet points"),
+    ])
+    cur.connection.commit()
+
+    assert [r["id"] for r in search("prompts", "french")] == ["translator"]
+    assert [r["id"] for r in search("prompts", "summ")] == ["summarizer"]   # prefix of the last word
+    assert "[French]" in search("prompts", "french")[0]["snippet"]
+
+    cur.execute("UPDATE prompts SET prompt = 'Translate into German' WHERE id = 'translator'")
+    # REPLACE deletes the old row, its index entry must go with it
+    cur.execute("INSERT OR REPLACE INTO prompts (id, prompt) VALUES ('summarizer', 'Write haiku')")
+    cur.connection.commit()
+    assert search("prompts", "french") == []
+    assert [r["id"] for r in search("prompts", "german")] == ["translator"]
+    assert search("prompts", "bullet") == []
+    assert [r["id"] for r in search("prompts", "haiku")] == ["summarizer"]
+
+    cur.execute("DELETE FROM prompts")
+    cur.connection.commit()
+    assert search("prompts", "german") == []
+
+
+def test_tools_and_agents_are_ranked(local_db):
+    from latticepy.engine.services.catalogsearch import search
+    cur = local_db.connect()
+    cur.execute("INSERT INTO toolservers (id, url, details) VALUES ('web', 'http://tools', '{}')")
+    cur.executemany("INSERT INTO tools (id, server_id, name, description) VALUES (?, 'web', ?, ?)", [
+        ("web.fetch_weather", "fetch_weather", "Current weather for a city"),
+        ("web.search", "search", "Search the web, also finds weather reports"),
+    ])
+    cur.execute("INSERT INTO latticeagents (id, prompt, tools, details) VALUES ('AGENT_forecaster', 'You report the weather', '[]', '{}')")
+    cur.connection.commit()
+
+    assert [r["id"] for r in search("tools", "weather")] == ["web.fetch_weather", "web.search"]
+    assert [r["id"] for r in search("agents", "weather")] == ["forecaster"]
+
+    # tools disappear with their server
+    cur.execute("DELETE FROM toolservers WHERE id = 'web'")
+    cur.connection.commit()
+    assert search("tools", "weather") == []
+
+
+def test_query_text_is_not_parsed_as_fts_syntax(local_db):
+    from latticepy.engine.services.catalogsearch import search, fts_query
+    assert fts_query('id:"x" OR NEAR(a') == '"id" "x" "OR" "NEAR" "a"*'
+    assert search("prompts", 'NOT) AND (') == []
+    with pytest.raises(ValueError):
+        search("prompts", "  ** ")
+    with pytest.raises(ValueError):
+        search("vectordb", "x")
+
+
+def test_search_stays_fast_on_a_large_catalog(local_db):
+    from latticepy.engine.services.catalogsearch import search
+    cur = local_db.connect()
+    cur.executemany("INSERT INTO prompts (id, prompt) VALUES (?, ?)",
+                    [(f"p{i}", f"prompt number {i} about topic{i % 500} and more filler words") for i in range(10000)])
+    cur.connection.commit()
+    search("prompts", "topic7")
+    start = time.perf_counter()
+    for _ in range(100):
+        results = search("prompts", "topic42", limit=10)
+    per_query = (time.perf_counter() - start) / 100
+    assert len(results) == 10
+    assert per_query < 0.005
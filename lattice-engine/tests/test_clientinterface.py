@@ -0,0 +1,204 @@
+import sqlite3
+import time
+
+import pytest
+
+
+@pytest.fixture
+def prompts(local_db):
+    from latticepy.engine.interfaces.clientinterface import Promptlist
+    Promptlist.invalidate()
+    yield Promptlist
+    Promptlist.invalidate()
+
+
+def test_reads_are_served_from_the_snapshot(prompts, monkeypatch):
+    from latticepy.engine.interfaces.clientinterface import PromptModel
+    prompts.add('greet', PromptModel(id='greet', prompt='say hello'))
+    assert prompts.get('greet').prompt == 'say hello'
+
+    calls = []
+    monkeypatch.setattr(prompts, 'refresh', classmethod(lambda cls: calls.append(cls)))
+    for _ in range(10):
+        assert prompts.get('greet').prompt == 'say hello'
+        assert 'greet' in prompts.list()
+    assert calls == []
+
+
+def test_local_writes_invalidate_the_snapshot(prompts):
+    from latticepy.engine.interfaces.clientinterface import PromptModel
+    assert prompts.get('greet') is None
+    prompts.add('greet', PromptModel(id='greet', prompt='say hello'))
+    assert 'greet' in prompts.listdown()
+    prompts.delete('greet')
+    assert 'greet' not in prompts.listdown()
+
+
+def test_writes_from_other_connections_are_detected(prompts, local_db):
+    assert prompts.list() == {}
+    other = sqlite3.connect(local_db.db_path)
+    other.execute("INSERT INTO prompts (id, prompt) VALUES ('remote', 'written elsewhere')")
+    other.commit()
+    other.close()
+    assert prompts.get('remote').prompt == 'written elsewhere'
+
+
+class FakeClient:
+    """
+    Stands in for the ollama provider: lists models per connection id, or fails for ids in `down`.
+    """
+    calls = []
+    down = set()
+    offered = {}
+
+    slow = {}
+
+    def __init__(self, connection, timeout):
+        self.connection = connection
+
+    def list_models(self, timeout=None):
+        FakeClient.calls.append(self.connection['id'])
+        if self.connection['id'] in FakeClient.down:
+            raise ConnectionError(f"{self.connection['id']} is down")
+        time.sleep(FakeClient.slow.get(self.connection['id'], 0))
+        return [{'model': m} for m in FakeClient.offered.get(self.connection['id'], [])]
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def catalog(local_db, monkeypatch):
+    from latticepy.engine.interfaces import llminterface
+    from latticepy.engine.interfaces.clientinterface import LLMmodels, LlmConnections, ConnectionModel
+    monkeypatch.setitem(llminterface.PROVIDERS, 'ollama', FakeClient)
+    llminterface.ClientPool.close_all()
+    monkeypatch.setattr(LLMmodels, 'MODELS', {})
+    monkeypatch.setattr(LLMmodels, 'refreshed_at', None)
+    FakeClient.calls, FakeClient.down, FakeClient.slow = [], set(), {}
+    FakeClient.offered = {'a': ['llama'], 'b': ['mistral']}
+    LlmConnections.invalidate()
+    for cid in ('a', 'b'):
+        LlmConnections.add(cid, ConnectionModel(id=cid, source='ollama', url=f'http://{cid}', api_key=None))
+    yield LLMmodels
+    llminterface.ClientPool.close_all()
+    LlmConnections.invalidate()
+
+
+def test_reads_do_not_discover_models(catalog):
+    catalog.refresh()
+    assert sorted(catalog().list()) == ['a_llama', 'b_mistral']
+    FakeClient.calls.clear()
+    for _ in range(5):
+        assert catalog().get('a_llama').model == 'llama'
+    assert FakeClient.calls == []
+
+
+def test_failed_connection_keeps_its_models(catalog):
+    catalog.refresh()
+    FakeClient.down = {'b'}
+    FakeClient.offered['a'] = ['llama', 'phi']
+    result = catalog.refresh()
+    assert list(result['errors']) == ['b']
+    assert sorted(catalog().list()) == ['a_llama', 'a_phi', 'b_mistral']
+    assert not catalog.is_stale()
+
+
+def test_background_refresher_wakes_on_request(catalog):
+    import asyncio
+
+    async def scenario():
+        task = asyncio.create_task(catalog.run_refresher())
+        while catalog.refreshed_at is None:
+            await asyncio.sleep(0.01)
+        first = catalog.refreshed_at
+        FakeClient.offered['a'] = ['qwen']
+        catalog.request_refresh()
+        while catalog.refreshed_at == first:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        return sorted(catalog().list())
+
+    assert asyncio.run(asyncio.wait_for(scenario(), 5)) == ['a_qwen', 'b_mistral']
+
+
+def test_discovery_is_concurrent_and_bounded_per_connection(catalog, monkeypatch):
+    from latticepy.engine.interfaces.clientinterface import CatalogModel, LlmConnections, ConnectionModel
+    monkeypatch.setattr(catalog, 'settings', CatalogModel(discovery_timeout=0.5))
+    for cid in ('c', 'd', 'e'):
+        LlmConnections.add(cid, ConnectionModel(id=cid, source='ollama', url=f'http://{cid}', api_key=None))
+        FakeClient.offered[cid] = ['tiny']
+    catalog.refresh()
+    FakeClient.slow = {'a': 0.3, 'c': 0.3, 'd': 0.3, 'e': 1.5}   # e does not answer in time
+    FakeClient.down = {'b'}
+
+    start = time.perf_counter()
+    result = catalog.refresh()
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.9   # serial discovery would take 0.9s before even reaching e
+    assert sorted(result['errors']) == ['b', 'e']
+    # partial results: the healthy connections are fresh, the others keep their last known models
+    assert sorted(catalog().list()) == ['a_llama', 'b_mistral', 'c_tiny', 'd_tiny', 'e_tiny']
+    health = catalog.status()['connections']
+    assert health['a']['healthy'] and not health['a']['stale'] and health['a']['discovery_ms'] >= 300
+    assert not health['e']['healthy'] and health['e']['stale'] and 'no answer' in health['e']['error']
+    assert health['b']['error'] == 'b is down' and health['b']['last_success'] is not None
+
+
+def test_hung_connections_do_not_use_up_the_time_of_queued_ones(catalog, monkeypatch):
+    from latticepy.engine.interfaces.clientinterface import CatalogModel, LlmConnections, ConnectionModel
+    monkeypatch.setattr(catalog, 'settings', CatalogModel(discovery_timeout=0.3, discovery_workers=4))
+    hung, healthy = [f'h{i}' for i in range(4)], [f'ok{i}' for i in range(4)]
+    for cid in hung + healthy:
+        LlmConnections.add(cid, ConnectionModel(id=cid, source='ollama', url=f'http://{cid}', api_key=None))
+        FakeClient.offered[cid] = ['tiny']
+    FakeClient.slow = {cid: 0.4 for cid in hung}   # they hold every worker past their deadline
+
+    result = catalog.refresh()
+    assert sorted(result['errors']) == hung
+    health = catalog.status()['connections']
+    assert 'no answer' in health['h0']['error']
+    assert all(health[cid]['healthy'] for cid in healthy + ['a', 'b'])
+    assert {f'{cid}_tiny' for cid in healthy} <= set(catalog().list())
+
+    # hosts that outlast the whole round: connections nobody got to are not blamed
+    FakeClient.slow = {cid: 3 for cid in hung}
+    result = catalog.refresh()
+    assert set(result['errors']) <= set(hung)
+    health = catalog.status()['connections']
+    assert all(health[cid]['healthy'] for cid in healthy)
+    assert {f'{cid}_tiny' for cid in healthy} <= set(catalog().list())
+
+
+def test_saved_catalog_is_served_after_restart(catalog, monkeypatch):
+    catalog.refresh()
+    # a restarted engine: nothing in memory yet
+    monkeypatch.setattr(catalog, 'MODELS', {})
+    monkeypatch.setattr(catalog, 'HEALTH', {})
+    monkeypatch.setattr(catalog, 'refreshed_at', None)
+    FakeClient.calls.clear()
+
+    assert catalog.load_snapshot() == 2
+    assert catalog().get('b_mistral').source.id == 'b'
+    assert FakeClient.calls == []
+    assert catalog.status()['connections']['a']['stale']
+
+
+def test_clients_are_pooled_per_connection(catalog):
+    from latticepy.engine.interfaces.llminterface import ClientPool
+    from latticepy.engine.interfaces.clientinterface import LlmConnections, ConnectionModel
+    catalog.refresh()
+    first = ClientPool.get(catalog().get('a_llama').source.model_dump())
+    catalog.refresh()
+    assert ClientPool.get(catalog().get('a_llama').source.model_dump()) is first
+
+    LlmConnections.delete('a')
+    LlmConnections.add('a', ConnectionModel(id='a', source='ollama', url='http://a2', api_key=None))
+    catalog.refresh()
+    rebuilt = ClientPool.get(catalog().get('a_llama').source.model_dump())
+    assert rebuilt is not first and rebuilt.url == 'http://a2'
+
+    LlmConnections.delete('b')
+    catalog.refresh()
+    assert ClientPool.stats()['clients'] == ['a']
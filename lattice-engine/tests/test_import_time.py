@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+
+# engine modules only; third party packages the engine builds on are imported first and not counted
+BUDGET_MS = 300
+
+PROBE = r"""
+import json, socket, sqlite3, sys, time
+import fastapi, fastapi.security, pydantic, requests, starlette
+
+attempts = []
+def refuse(kind):
+    def blocked(*args, **kwargs):
+        attempts.append(kind)
+        raise OSError(f"{kind} during import")
+    return blocked
+socket.socket.connect = refuse("socket.connect")
+socket.create_connection = refuse("socket.create_connection")
+socket.getaddrinfo = refuse("socket.getaddrinfo")
+sqlite3.connect = refuse("sqlite3.connect")
+
+started = time.perf_counter()
+import latticepy.engine.services.webserver
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({"attempts": attempts, "elapsed_ms": elapsed}))
+"""
+
+
+def _self_time_ms(stderr: str) -> float:
+    # -X importtime lines: "import time: <self us> | <cumulative us> | <module>"
+    total = 0
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip().startswith("latticepy"):
+            total += int(parts[0].split(":")[1])
+    return total / 1000
+
+
+def test_webserver_import_does_no_io_and_is_fast(tmp_path):
+    env = dict(os.environ, LATTICE_DB_PATH=str(tmp_path / "missing" / "localdb"))
+    env.pop("LATTICE_CONFIG_PATH", None)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE], env=env, capture_output=True, text=True, timeout=60)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    assert result["attempts"] == []
+    assert not (tmp_path / "missing").exists()
+    assert _self_time_ms(proc.stderr) < BUDGET_MS
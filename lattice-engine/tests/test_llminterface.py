@@ -0,0 +1,61 @@
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def registry():
+    from latticepy.engine.interfaces import llminterface
+    saved = dict(llminterface.PROVIDERS)
+    yield llminterface
+    llminterface.PROVIDERS.clear()
+    llminterface.PROVIDERS.update(saved)
+
+
+class EchoProvider:
+    def __init__(self, connection, timeout):
+        self.timeout = timeout
+
+    def list_models(self, timeout=None):
+        return [{'model': 'echo'}]
+
+    def chat(self, model, messages, tools=None):
+        return messages[-1]['content'], []
+
+
+def test_registered_provider_serves_llmclient(registry):
+    registry.register_provider('echo', EchoProvider)
+    client = registry.llmClient(timeout=3, id='local', source='echo', url='http://echo')
+    assert client.provider.timeout == 3
+    assert [m['name'] for m in client.models()] == ['local_echo']
+    assert client.chat('echo', 'be brief', 'hi') == ('hi', [{}])
+
+
+def test_providers_registered_by_path_are_imported_on_first_use(registry):
+    registry.register_provider('echo', f'{__name__}:EchoProvider')
+    assert registry.PROVIDERS['echo'] == f'{__name__}:EchoProvider'
+    assert registry.get_provider('echo') is EchoProvider
+    assert registry.PROVIDERS['echo'] is EchoProvider
+
+
+def test_unknown_source_is_rejected(registry):
+    from latticepy.engine.interfaces.clientinterface import ConnectionModel
+    assert not registry.provider_registered('nope')
+    with pytest.raises(ValueError):
+        registry.get_provider('nope')
+    with pytest.raises(ValueError):
+        ConnectionModel(id='x', source='nope', url='http://x', api_key=None)
+    registry.register_provider('nope', EchoProvider)
+    assert ConnectionModel(id='x', source='nope', url='http://x', api_key=None).source == 'nope'
+
+
+def test_backend_libraries_are_not_imported_with_the_interface():
+    code = (
+        "import sys\n"
+        "import latticepy.engine.interfaces.llminterface\n"
+        "import latticepy.engine.interfaces.clientinterface\n"
+        "print('ollama' in sys.modules)\n"
+    )
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == 'False'
@@ -0,0 +1,184 @@
+import threading
+
+import pytest
+
+from latticepy.engine.services.localdatabase import LocalDatabase, LocalDBModel
+
+
+def test_connection_is_reused_within_a_thread(local_db):
+    first = LocalDatabase.connect().connection
+    second = LocalDatabase.connect().connection
+    assert first is second
+    stats = LocalDatabase.pool_stats()
+    assert stats["opened"] == 1
+    assert stats["reused"] >= 1
+
+
+def test_each_thread_gets_its_own_connection(local_db):
+    main_conn = LocalDatabase.connect().connection
+    seen = []
+    worker = threading.Thread(target=lambda: seen.append(LocalDatabase.connect().connection))
+    worker.start()
+    worker.join()
+    assert seen and seen[0] is not main_conn
+    # the worker has exited, its connection is reclaimed on the next stats call
+    stats = LocalDatabase.pool_stats()
+    assert stats["open_connections"] == 1
+    assert stats["closed"] == 1
+
+
+def test_pragmas_follow_settings(tmp_path, monkeypatch):
+    monkeypatch.setenv("LATTICE_DB_PATH", str(tmp_path / "tuned"))
+    LocalDatabase(LocalDBModel(name="tuned", url_path=str(tmp_path), synchronous="FULL", cache_size=-2048, busy_timeout=1234))
+    try:
+        cur = LocalDatabase.connect()
+        assert cur.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert cur.execute("PRAGMA synchronous").fetchone()[0] == 2
+        assert cur.execute("PRAGMA cache_size").fetchone()[0] == -2048
+        assert cur.execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+    finally:
+        LocalDatabase.close_all()
+        LocalDatabase.settings = None
+
+
+def test_close_all_resets_the_pool(local_db):
+    LocalDatabase.connect()
+    LocalDatabase.close_all()
+    assert LocalDatabase.pool_stats()["open_connections"] == 0
+    # the next call transparently opens a new connection
+    assert LocalDatabase.connect().execute("SELECT 1").fetchone()[0] == 1
+
+
+@pytest.fixture
+def impatient_db(tmp_path, monkeypatch):
+    from latticepy.engine.services.migrations import migrate
+    monkeypatch.setenv("LATTICE_DB_PATH", str(tmp_path / "localdb"))
+    LocalDatabase(LocalDBModel(name="localdb", url_path=str(tmp_path), busy_timeout=300))
+    migrate()
+    yield
+    LocalDatabase.close_all()
+    LocalDatabase.settings = None
+
+
+def test_a_failed_write_does_not_keep_the_write_lock(impatient_db):
+    from latticepy.engine.interfaces.agentinterface import LatticeAgent
+    LatticeAgent(id="a", prompt="p", tools=[]).create()
+    failed, done = threading.Event(), threading.Event()
+
+    def duplicate():
+        with pytest.raises(ValueError):
+            LatticeAgent(id="a", prompt="p", tools=[]).create()
+        failed.set()
+        # the thread, and its pooled connection, stay around like an idle executor worker
+        done.wait(5)
+
+    worker = threading.Thread(target=duplicate)
+    worker.start()
+    try:
+        assert failed.wait(5)
+        LatticeAgent(id="b", prompt="p", tools=[]).create()
+    finally:
+        done.set()
+        worker.join()
+    assert sorted(LatticeAgent.listdown()) == ["AGENT_a", "AGENT_b"]
+
+
+def test_database_calls_never_hand_on_an_open_transaction(impatient_db):
+    import asyncio
+
+    def careless():
+        LocalDatabase.connect().execute("INSERT INTO catalog_versions (name, version) VALUES ('x', 1)")
+        raise RuntimeError("no commit")
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await LocalDatabase.run(careless)
+
+    asyncio.run(scenario())
+    cur = LocalDatabase.connect()
+    cur.execute("INSERT INTO catalog_versions (name, version) VALUES ('y', 1)")
+    cur.connection.commit()
+    assert [r[0] for r in cur.execute("SELECT name FROM catalog_versions WHERE name IN ('x', 'y')")] == ["y"]
+    assert LocalDatabase.pool_stats()["rolled_back"] == 1
+
+
+def test_migrations_apply_once_and_are_recorded(local_db):
+    from latticepy.engine.services.migrations import MIGRATIONS, migrate
+    latest = MIGRATIONS[-1].version
+    assert migrate() == latest
+    cur = LocalDatabase.connect()
+    recorded = [row[0] for row in cur.execute("SELECT version FROM schema_version ORDER BY version")]
+    assert recorded == [m.version for m in MIGRATIONS]
+    # running again is a no-op
+    assert migrate() == latest
+    assert cur.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == len(MIGRATIONS)
+
+
+def test_migrations_adopt_a_pre_migration_database(tmp_path, monkeypatch):
+    import sqlite3
+    from latticepy.engine.services.migrations import migrate
+    legacy = sqlite3.connect(tmp_path / "legacy")
+    legacy.execute("CREATE TABLE prompts (id TEXT PRIMARY KEY, prompt TEXT)")
+    legacy.execute("INSERT INTO prompts VALUES ('kept', 'existing rows survive')")
+    legacy.commit()
+    legacy.close()
+    monkeypatch.setenv("LATTICE_DB_PATH", str(tmp_path / "legacy"))
+    LocalDatabase(LocalDBModel(name="legacy", url_path=str(tmp_path)))
+    try:
+        migrate()
+        cur = LocalDatabase.connect()
+        assert cur.execute("SELECT prompt FROM prompts WHERE id = 'kept'").fetchone()[0] == "existing rows survive"
+        assert cur.execute("SELECT version FROM catalog_versions WHERE name = 'prompts'").fetchone()[0] == 0
+    finally:
+        LocalDatabase.close_all()
+        LocalDatabase.settings = None
+
+
+def test_scans_add_to_query_stats_once_per_statement(local_db, monkeypatch):
+    from latticepy.engine.services.localdatabase import QueryStats
+    cur = local_db.connect()
+    cur.executemany("INSERT INTO prompts (id, prompt) VALUES (?, ?)", [(f"p{i}", "x") for i in range(1000)])
+    cur.connection.commit()
+    QueryStats.reset()
+    adds = []
+    add = QueryStats.add
+    monkeypatch.setattr(QueryStats, "add", lambda *args: (adds.append(args[0]), add(*args)))
+
+    assert len(list(cur.execute("SELECT id FROM prompts"))) == 1000
+    assert adds == ["SELECT id FROM prompts"]
+    # a lookup that is never read to the end is added when the cursor moves on
+    cur.execute("SELECT id FROM prompts WHERE id = ?", ("p1",)).fetchone()
+    cur.close()
+    stats = {q["sql"]: q for q in QueryStats.report()}
+    assert stats["SELECT id FROM prompts"]["rows"] == 1000
+    assert stats["SELECT id FROM prompts WHERE id = ?"]["calls"] == 1
+
+
+def test_statements_are_timed_by_normalized_sql(local_db, caplog):
+    from latticepy.engine.services.localdatabase import QueryStats, normalize_sql
+    QueryStats.reset()
+    cur = local_db.connect()
+    cur.executemany("INSERT INTO prompts (id, prompt) VALUES (?, ?)", [("a", "x"), ("b", "y"), ("c", "z")])
+    cur.connection.commit()
+    for pid in ("a", "b", "missing"):
+        cur.execute("SELECT * FROM prompts WHERE id = ?", (pid,)).fetchall()
+    list(cur.execute("SELECT id FROM prompts   WHERE id IN ('a', 'b')"))
+
+    stats = {q["sql"]: q for q in QueryStats.report()}
+    by_id = stats["SELECT * FROM prompts WHERE id = ?"]
+    assert by_id["calls"] == 3 and by_id["rows"] == 2
+    assert by_id["max_ms"] <= by_id["total_ms"]
+    # literals and IN lists of any length share one entry
+    assert stats["SELECT id FROM prompts WHERE id IN (...)"]["rows"] == 2
+    assert normalize_sql("SELECT id FROM prompts WHERE id IN (?, ?, ?)") == "SELECT id FROM prompts WHERE id IN (...)"
+    assert stats["INSERT INTO prompts (id, prompt) VALUES (?, ?)"]["calls"] == 1
+    assert stats["COMMIT"]["calls"] == 1
+
+    QueryStats.slow_query_ms = 0
+    try:
+        with caplog.at_level("WARNING"):
+            cur.execute("SELECT * FROM prompts WHERE prompt = ?", ("secret value",)).fetchall()
+    finally:
+        QueryStats.slow_query_ms = 100
+    assert "Slow query" in caplog.text and "(str[12])" in caplog.text
+    assert "secret value" not in caplog.text
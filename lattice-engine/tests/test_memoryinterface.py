@@ -0,0 +1,43 @@
+import time
+
+
+def test_window_keeps_the_most_recent_messages_within_budget(local_db):
+    from latticepy.engine.interfaces.memoryinterface import ConversationStore
+    ConversationStore.append('s1', [{'role': 'user', 'content': 'one two three'}, {'role': 'assistant', 'content': 'four five'}], 'agent')
+    last = ConversationStore.append('s1', [{'role': 'user', 'content': 'six'}, {'role': 'assistant', 'content': 'seven eight'}])
+    assert last == 4
+    assert ConversationStore.get('s1')['agent'] == 'agent'
+
+    assert [m['content'] for m in ConversationStore.window('s1', 10, None)] == ['one two three', 'four five', 'six', 'seven eight']
+    assert ConversationStore.window('s1', 2, None) == [{'role': 'user', 'content': 'six'}, {'role': 'assistant', 'content': 'seven eight'}]
+    # 2 + 1 + 2 tokens fit, the oldest message would exceed the budget
+    assert [m['content'] for m in ConversationStore.window('s1', 10, 5)] == ['four five', 'six', 'seven eight']
+    assert ConversationStore.window('missing') == []
+
+
+def test_session_endpoint_returns_history_beyond_the_token_budget(local_db):
+    from fastapi.testclient import TestClient
+    from latticepy.engine.interfaces.memoryinterface import ConversationStore
+    from latticepy.engine.services.webserver import app
+    long_turn = " ".join(["word"] * 1000)
+    for _ in range(3):
+        ConversationStore.append('long', [{'role': 'user', 'content': long_turn}, {'role': 'assistant', 'content': 'ok'}])
+    # the model only gets what fits in the default 2048 tokens
+    assert len(ConversationStore.window('long')) == 5
+    messages = TestClient(app).get("/api/lattice/sessions/long").json()["messages"]
+    assert len(messages) == 6
+
+
+def test_prune_drops_idle_sessions(local_db):
+    from latticepy.engine.interfaces.memoryinterface import ConversationStore
+    ConversationStore.append('old', [{'role': 'user', 'content': 'hello'}])
+    ConversationStore.append('new', [{'role': 'user', 'content': 'hello'}])
+    cur = local_db.connect()
+    cur.execute("UPDATE conversation_sessions SET updated_at = ? WHERE session_id = 'old'", (int(time.time()) - 10 * 86400,))
+    cur.connection.commit()
+
+    assert ConversationStore.prune(retention_days=1) == 1
+    assert ConversationStore.get('old') == {}
+    assert ConversationStore.window('old') == []
+    assert ConversationStore.window('new') == [{'role': 'user', 'content': 'hello'}]
+    ConversationStore.vacuum()
@@ -0,0 +1,104 @@
+import asyncio
+import time
+from collections import Counter
+
+import pytest
+
+
+class ReplicaProvider:
+    """
+    Answers with the id of its connection after a short delay, fails for ids in `down`.
+    """
+    down = set()
+    served = Counter()
+
+    def __init__(self, connection, timeout):
+        self.id = connection['id']
+
+    async def achat(self, model, messages, tools=None):
+        await asyncio.sleep(0.05)
+        if self.id in ReplicaProvider.down:
+            raise ConnectionError(f"{self.id} is down")
+        ReplicaProvider.served[self.id] += 1
+        return self.id, []
+
+    async def aclose(self):
+        pass
+
+
+@pytest.fixture
+def group(local_db, monkeypatch):
+    from latticepy.engine.interfaces import llminterface
+    from latticepy.engine.interfaces.clientinterface import LLMmodels, Model, ConnectionModel, ModelGroups, ModelGroupModel
+    from latticepy.engine.services.modelrouter import ModelRouter, RoutingModel
+    monkeypatch.setitem(llminterface.PROVIDERS, 'replica', ReplicaProvider)
+    models = {}
+    for cid in ('a', 'b', 'c'):
+        source = ConnectionModel(id=cid, source='replica', url=f'http://{cid}', api_key=None)
+        models[f'{cid}_llama'] = Model(name=f'{cid}_llama', model='llama', source=source, details={})
+    monkeypatch.setattr(LLMmodels, 'MODELS', models)
+    monkeypatch.setattr(LLMmodels, 'HEALTH', {})
+    monkeypatch.setattr(LLMmodels, 'refreshed_at', time.time())
+    ModelGroups.invalidate()
+    ModelGroups.add('llama', ModelGroupModel(id='llama', model='llama', connections=['a', 'b', 'c']))
+    ModelRouter.reset()
+    ModelRouter.configure(RoutingModel(eject_after=2, eject_seconds=0.2))
+    ReplicaProvider.down, ReplicaProvider.served = set(), Counter()
+    yield ModelGroups.get('llama')
+    ModelRouter.configure(RoutingModel())
+    ModelRouter.reset()
+    ModelGroups.invalidate()
+    llminterface.ClientPool.close_all()
+
+
+def _chat(n):
+    from latticepy.engine.services.webserver import Message, generate_ai_response
+
+    async def scenario():
+        replies = await asyncio.gather(*[
+            generate_ai_response([Message(role='user', content=f'q{i}')], 'llama', None) for i in range(n)
+        ])
+        return [reply[0] for reply in replies]
+
+    return asyncio.run(scenario())
+
+
+def test_requests_spread_over_the_least_busy_replicas(group):
+    from latticepy.engine.services.modelrouter import ModelRouter
+    assert sorted(_chat(6)) == ['a', 'a', 'b', 'b', 'c', 'c']
+    assert all(s['in_flight'] == 0 and s['requests'] == 2 for s in ModelRouter.stats().values())
+
+
+def test_power_of_two_picks_the_less_busy_of_two(group):
+    from latticepy.engine.services.modelrouter import ModelRouter
+    group = group.model_copy(update={'strategy': 'power_of_two'})
+    busy = ModelRouter.route(group)
+    for _ in range(20):
+        route = ModelRouter.route(group)
+        # either sample holds an idle replica, the busy one never wins
+        assert route.connection != busy.connection
+        route.release(True)
+    busy.release(True)
+
+
+def test_failing_replica_is_ejected_and_readmitted(group):
+    from latticepy.engine.services.modelrouter import ModelRouter
+    ReplicaProvider.down = {'b'}
+    for _ in range(4):
+        _chat(3)
+    assert ModelRouter.stats()['b']['ejected']
+    ReplicaProvider.served.clear()
+    _chat(6)
+    assert ReplicaProvider.served['b'] == 0 and sum(ReplicaProvider.served.values()) == 6
+
+    ReplicaProvider.down = set()
+    time.sleep(0.25)
+    _chat(6)
+    assert ReplicaProvider.served['b'] > 0
+    assert ModelRouter.stats()['b']['consecutive_failures'] == 0
+
+
+def test_replica_with_failed_discovery_is_skipped(group, monkeypatch):
+    from latticepy.engine.interfaces.clientinterface import LLMmodels, ConnectionHealth
+    monkeypatch.setattr(LLMmodels, 'HEALTH', {'c': ConnectionHealth(healthy=False, last_attempt=time.time(), error='down')})
+    assert set(_chat(6)) == {'a', 'b'}
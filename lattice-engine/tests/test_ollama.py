@@ -0,0 +1,84 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class TagsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        body = json.dumps({"models": [{"model": "llama3:8b", "name": "llama3:8b"}]}).encode()
+        self.send_response(200 if self.path == "/api/tags" else 404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"model": "llama3:8b", "created_at": "2024-01-01T00:00:00Z",
+                           "message": {"role": "assistant", "content": "hello"}, "done": True}).encode()
+        self.send_response(200 if self.path == "/api/chat" else 404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), TagsHandler)
+    httpd.delay = 0
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_models_are_listed_within_the_discovery_deadline(server):
+    from latticepy.engine.providers.ollama import OllamaProvider
+    provider = OllamaProvider({'url': f'http://127.0.0.1:{server.server_port}'}, timeout=30)
+    try:
+        assert [m['model'] for m in provider.list_models(timeout=2)] == ['llama3:8b']
+        assert [m['model'] for m in provider.list_models()] == ['llama3:8b']
+
+        server.delay = 1.0
+        start = time.perf_counter()
+        with pytest.raises(Exception):
+            provider.list_models(timeout=0.2)
+        # the short deadline applies, not the 30s of chat requests
+        assert time.perf_counter() - start < 0.9
+    finally:
+        provider.close()
+
+
+def test_async_clients_of_a_previous_loop_are_closed(server):
+    import asyncio
+    from latticepy.engine.providers.ollama import OllamaProvider
+    provider = OllamaProvider({'url': f'http://127.0.0.1:{server.server_port}'}, timeout=5)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    messages = [{'role': 'user', 'content': 'hi'}]
+    try:
+        assert asyncio.run_coroutine_threadsafe(provider.achat('llama3:8b', messages), loop).result(5) == ('hello', [])
+        old = provider._async_client._client
+        asyncio.run(provider.achat('llama3:8b', messages))
+        deadline = time.time() + 5
+        while not old.is_closed and time.time() < deadline:
+            time.sleep(0.01)
+        assert old.is_closed
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        provider.close()
@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import pytest
+
+from openai_stub import OpenAIStub
+
+
+@pytest.fixture
+def stub():
+    with OpenAIStub(models=("stub-1", "stub-2")) as server:
+        yield server
+
+
+@pytest.fixture
+def client(stub):
+    from latticepy.engine.interfaces.llminterface import llmClient
+    llm = llmClient(id='local', source='openai', url=stub.url, api_key='sk-local')
+    yield llm
+    llm.close()
+
+
+def test_models_are_listed_from_the_server(client):
+    assert [m['name'] for m in client.models(timeout=2)] == ['local_stub-1', 'local_stub-2']
+
+
+def test_chat_and_tool_calls_keep_the_llmclient_shape(client, stub):
+    assert client.chat('stub-1', '', 'hello') == ('echo hello', [{}])
+    tools = [{'type': 'function', 'function': {'name': 'weather', 'parameters': {'type': 'object'}}}]
+    content, calls = client.chat('stub-1', 'be brief', 'weather today?', tools=tools)
+    assert content == ''
+    assert calls == [{'id': 'call_1', 'function': {'name': 'weather', 'arguments': {'city': 'Paris'}}}]
+    assert stub.requests[-1]['messages'][0] == {'role': 'system', 'content': 'be brief'}
+    assert stub.requests[-1]['authorization'] == 'Bearer sk-local'
+
+
+def test_async_chats_share_pooled_connections(client, stub, backend_limits):
+    from latticepy.engine.services.backendlimits import LimiterModel
+    # all ten at once, the adaptive limit would spread them over rounds
+    backend_limits.configure(LimiterModel(enabled=False))
+
+    async def scenario():
+        rounds = []
+        for _ in range(3):
+            replies = await asyncio.gather(*[client.achat('stub-1', '', f'hi {i}') for i in range(10)])
+            rounds.append((stub.connections, [r[0] for r in replies]))
+        await client.aclose()
+        return rounds
+
+    rounds = asyncio.run(scenario())
+    assert all(replies == [f'echo hi {i}' for i in range(10)] for _, replies in rounds)
+    # later rounds run on the connections kept alive by the first one
+    assert rounds[-1][0] == rounds[0][0] <= 10
+
+
+def test_stream_yields_pieces_as_they_arrive(client, stub):
+    stub.delay = 0.05
+
+    async def scenario():
+        pieces = [piece async for piece in client.astream('stub-1', 'one two three')]
+        await client.aclose()
+        return pieces
+
+    assert asyncio.run(scenario()) == ['echo', ' one', ' two', ' three']
+
+
+def test_clients_retired_off_the_loop_close_their_async_connections(stub):
+    import threading
+    from latticepy.engine.interfaces.llminterface import ClientPool
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        client = ClientPool.get({'id': 'served', 'source': 'openai', 'url': stub.url, 'api_key': None})
+        asyncio.run_coroutine_threadsafe(client.achat('stub-1', '', 'hi'), loop).result(5)
+        aclient = client.provider._async_client
+        assert not aclient.is_closed
+        # discovery drops deleted connections from its own thread, where no loop runs
+        ClientPool.retain([])
+        deadline = time.time() + 5
+        while not aclient.is_closed and time.time() < deadline:
+            time.sleep(0.01)
+        assert aclient.is_closed
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def test_async_clients_of_a_previous_loop_are_closed(client):
+    import threading
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        asyncio.run_coroutine_threadsafe(client.achat('stub-1', '', 'hi'), loop).result(5)
+        old = client.provider._async_client
+        # the same provider used from another event loop gets a client of its own
+        asyncio.run(client.achat('stub-1', '', 'hi'))
+        assert client.provider._async_client is not old
+        deadline = time.time() + 5
+        while not old.is_closed and time.time() < deadline:
+            time.sleep(0.01)
+        assert old.is_closed
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def cache(local_db):
+    from latticepy.engine.services.responsecache import ResponseCache, ResponseCacheModel
+    ResponseCache.configure(ResponseCacheModel(enabled=True, max_entries=2, sqlite=True, agent_ttls={'nocache': 0, 'quick': 0.1}))
+    ResponseCache.reset_stats()
+    yield ResponseCache
+    ResponseCache.configure(ResponseCacheModel())
+
+
+def _policy(cache, text, agent=None, record=None, cache_control=None):
+    return cache.policy('local_llama', agent, record, [{'role': 'user', 'content': text}], cache_control=cache_control)
+
+
+def test_key_covers_agent_version_and_options():
+    from latticepy.engine.services.responsecache import cache_key
+    messages = [{'role': 'user', 'content': 'hi'}]
+    agent = {'id': 'AGENT_a', 'prompt': 'be brief', 'tools': '[]'}
+    base = cache_key('m', 'AGENT_a', agent, messages)
+    assert base == cache_key('m', 'AGENT_a', dict(agent), [dict(messages[0])])
+    assert base != cache_key('m', 'AGENT_a', {**agent, 'prompt': 'be verbose'}, messages)
+    assert base != cache_key('m', 'AGENT_a', agent, messages, options={'temperature': 0})
+    assert base != cache_key('other', 'AGENT_a', agent, messages)
+
+
+def test_replies_are_reused_until_they_expire(cache):
+    from latticepy.engine.services.responsecache import CachedReply
+    first = _policy(cache, 'hi', agent='quick')
+    assert cache.get(first) is None and first.status == 'miss'
+    cache.put(first, CachedReply('hello', '', {}), 'quick')
+    again = _policy(cache, 'hi', agent='quick')
+    assert cache.get(again).content == 'hello' and again.status == 'hit'
+    time.sleep(0.15)
+    assert cache.get(_policy(cache, 'hi', agent='quick')) is None
+    assert not _policy(cache, 'hi', agent='nocache').lookup
+
+
+def test_lru_evicts_and_sqlite_tier_serves_evicted_replies(cache):
+    from latticepy.engine.services.responsecache import CachedReply
+    for text in ('a', 'b', 'c'):
+        cache.put(_policy(cache, text), CachedReply(text.upper(), '', {}))
+    stats = cache.stats()
+    assert stats['entries'] == 2 and stats['evictions'] == 1
+    assert cache.get(_policy(cache, 'a')).content == 'A'
+    assert cache.stats()['sqlite_hits'] == 1
+    assert cache.get(_policy(cache, 'a')).content == 'A'
+    assert cache.stats()['memory_hits'] == 1
+
+
+def test_cache_control_bypasses(cache):
+    from latticepy.engine.services.responsecache import CachedReply
+    cache.put(_policy(cache, 'hi'), CachedReply('old', '', {}))
+    fresh = _policy(cache, 'hi', cache_control='no-cache')
+    assert cache.get(fresh) is None and fresh.status == 'bypass'
+    cache.put(fresh, CachedReply('new', '', {}))
+    assert cache.get(_policy(cache, 'hi')).content == 'new'
+    private = _policy(cache, 'hi', cache_control='no-store')
+    cache.put(private, CachedReply('secret', '', {}))
+    assert cache.get(_policy(cache, 'hi')).content == 'new'
+    assert cache.stats()['bypasses'] == 2
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from latticepy.engine.services.backendlimits import BackendLimits, BackendLimiter, LimiterModel
+from latticepy.engine.services.scheduler import RequestScheduler, SchedulingModel, FairLimiter
+
+
+@pytest.fixture
+def scheduler():
+    def configure(**settings):
+        RequestScheduler.configure(SchedulingModel(**settings))
+        return RequestScheduler
+
+    yield configure
+    RequestScheduler.configure(SchedulingModel())
+
+
+def run_queue(limiter, requests):
+    """
+    Hold the only slot, queue requests as (tenant, priority) in order, and return the order they got the slot.
+    """
+    order = []
+
+    async def request(tenant, priority):
+        RequestScheduler.enter(RequestScheduler.classify(tenant, priority))
+        await limiter.acquire()
+        order.append(tenant)
+        await asyncio.sleep(0)
+        limiter.release(True)
+
+    async def scenario():
+        await limiter.acquire()
+        tasks = []
+        for tenant, priority in requests:
+            tasks.append(asyncio.create_task(request(tenant, priority)))
+            await asyncio.sleep(0)
+        limiter.release(True)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    return order
+
+
+def test_header_can_lower_a_keys_class_but_not_raise_it(scheduler):
+    scheduler(key_classes={"etl": "batch"})
+    assert RequestScheduler.classify("cli").priority == "interactive"
+    assert RequestScheduler.classify("cli", "batch").priority == "batch"
+    assert RequestScheduler.classify("etl").priority == "batch"
+    assert RequestScheduler.classify("etl", "interactive").priority == "batch"
+    with pytest.raises(ValueError):
+        RequestScheduler.classify("cli", "urgent")
+
+
+def test_interactive_requests_overtake_queued_batch_work(scheduler):
+    scheduler()
+    limiter = FairLimiter("a", LimiterModel(initial_limit=1))
+    order = run_queue(limiter, [("etl", "batch")] * 3 + [("cli", None)] * 2)
+    assert order == ["cli", "cli", "etl", "etl", "etl"]
+    assert limiter.stats()["classes"]["batch"]["admitted_from_queue"] == 3
+
+
+def test_a_heavy_key_does_not_starve_the_others(scheduler):
+    scheduler()
+    limiter = FairLimiter("a", LimiterModel(initial_limit=1))
+    order = run_queue(limiter, [("heavy", None)] * 6 + [("light", None)] * 2)
+    # first come, first served would put both light requests last
+    assert order.index("light") <= 1
+    assert order[:4].count("light") == 2
+
+
+def test_made_up_keys_share_one_anonymous_share(scheduler, local_db):
+    from latticepy.engine.services.usageledger import key_label
+    from latticepy.engine.services.webserver import API_KEYS, request_tenant
+    scheduler()
+    limiter = FairLimiter("a", LimiterModel(initial_limit=1))
+    made_up = [request_tenant(key_label(f"sk-made-up-{i}", API_KEYS)) for i in range(6)] + [request_tenant("")]
+    known = request_tenant(key_label("sk-test123456789", API_KEYS))
+    order = run_queue(limiter, [(tenant, None) for tenant in made_up] + [(known, None)] * 2)
+    # one share per made-up key would put the known key last
+    assert order.index("test-user") <= 1
+    assert order[:4].count("test-user") == 2
+
+
+def test_slots_are_shared_by_key_weight(scheduler):
+    scheduler(key_weights={"gold": 3})
+    limiter = FairLimiter("a", LimiterModel(initial_limit=1))
+    order = run_queue(limiter, [("basic", None)] * 6 + [("gold", None)] * 6)
+    assert order[:8].count("gold") == 6
+
+
+def test_priority_queues_are_on_without_configuration():
+    import subprocess
+    import sys
+    probe = ("import latticepy.engine.services.webserver\n"
+             "from latticepy.engine.services.backendlimits import BackendLimits\n"
+             "print(type(BackendLimits.get('a')).__name__)")
+    out = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "FairLimiter"
+
+
+def test_configure_switches_the_queue_discipline(scheduler):
+    scheduler(enabled=False)
+    assert type(BackendLimits.get("a")) is BackendLimiter
+    scheduler()
+    assert type(BackendLimits.get("a")) is FairLimiter
+    with pytest.raises(ValueError):
+        scheduler(key_classes={"etl": "bulk"})
+
+
+def test_unknown_priority_header_is_rejected(local_db):
+    from fastapi.testclient import TestClient
+    from latticepy.engine.services.webserver import app
+    res = TestClient(app).post("/api/lattice/chat", headers={"X-Lattice-Priority": "urgent"},
+                               json={"model": "none", "messages": [{"role": "user", "content": "hi"}]})
+    assert res.status_code == 400
+    assert "urgent" in res.json()["detail"]
@@ -0,0 +1,150 @@
+import asyncio
+import time
+import zlib
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+STOPWORDS = {"how", "do", "can", "i", "my", "the", "a", "is", "what", "please"}
+
+
+class WordsProvider:
+    """
+    Embeds text as a bag of its words, so rewordings with the same key words are close.
+    """
+
+    embeds = 0
+
+    def __init__(self, connection, timeout):
+        pass
+
+    async def achat(self, model, messages, tools=None):
+        return f"answer to {messages[-1]['content']}", []
+
+    async def aembed(self, model, texts):
+        WordsProvider.embeds += 1
+        vectors = []
+        for text in texts:
+            vector = [0.0] * 64
+            for word in text.lower().replace("?", "").split():
+                if word not in STOPWORDS:
+                    vector[zlib.crc32(word.encode()) % 64] += 1.0
+            vectors.append(vector)
+        return vectors
+
+    async def aclose(self):
+        pass
+
+
+@pytest.fixture
+def semantic(local_db, monkeypatch):
+    from latticepy.engine.interfaces import llminterface
+    from latticepy.engine.interfaces.clientinterface import LLMmodels, Model, ConnectionModel
+    from latticepy.engine.services.semanticcache import SemanticCache, SemanticCacheModel
+    monkeypatch.setitem(llminterface.PROVIDERS, 'words', WordsProvider)
+    source = ConnectionModel(id='emb', source='words', url='http://words', api_key=None)
+    monkeypatch.setattr(LLMmodels, 'MODELS', {'emb_words': Model(name='emb_words', model='words', source=source, details={})})
+    monkeypatch.setattr(WordsProvider, 'embeds', 0)
+    SemanticCache.configure(SemanticCacheModel(enabled=True, embedding_model='emb_words', threshold=0.9, max_entries=2,
+                                               agent_ttls={'quick': 0.1}))
+    SemanticCache.reset_stats()
+    yield SemanticCache
+    SemanticCache.configure(SemanticCacheModel())
+    llminterface.ClientPool.close_all()
+
+
+def _ask(cache, text, agent='support', record=None, cache_control=None, options=None, format=None):
+    from latticepy.engine.services.responsecache import CachedReply
+
+    async def scenario():
+        lookup = await cache.prepare('local_llama', agent, record, [{'role': 'user', 'content': text}], cache_control,
+                                     options, format)
+        reply = cache.get(lookup)
+        if reply is None:
+            cache.put(lookup, CachedReply(f"answer to {text}", "", {}))
+        return reply
+
+    return asyncio.run(scenario())
+
+
+def test_reworded_questions_share_an_answer(semantic):
+    assert _ask(semantic, "How do I reset my password?") is None
+    hit = _ask(semantic, "how can I reset the password please")
+    assert hit.content == "answer to How do I reset my password?"
+    assert _ask(semantic, "What is the refund policy?") is None
+    # another agent, or an edited one, never sees these answers
+    assert _ask(semantic, "how can I reset my password", agent='billing') is None
+    assert _ask(semantic, "how can I reset my password", record={'prompt': 'new'}) is None
+    stats = semantic.stats()
+    assert (stats["hits"], stats["misses"], stats["lookups"]) == (1, 4, 5)
+    assert stats["hit_ratio"] == 0.2 and stats["partitions"] == 3
+
+
+def test_answers_are_not_shared_across_options_or_format(semantic):
+    assert _ask(semantic, "How do I reset my password?") is None
+    assert _ask(semantic, "how can I reset the password please", format="json") is None
+    assert _ask(semantic, "how can I reset the password please", options={"temperature": 0}) is None
+    assert _ask(semantic, "reset the password", format="json").content == "answer to how can I reset the password please"
+
+
+def test_exact_hits_are_answered_without_embedding(semantic, monkeypatch):
+    from fastapi.testclient import TestClient
+    from latticepy.engine.interfaces.clientinterface import LLMmodels
+    from latticepy.engine.services.responsecache import ResponseCache, ResponseCacheModel
+    from latticepy.engine.services.webserver import app
+    monkeypatch.setattr(LLMmodels, 'refreshed_at', time.time())
+    ResponseCache.configure(ResponseCacheModel(enabled=True))
+    try:
+        client = TestClient(app)
+        ask = lambda text: client.post("/api/lattice/chat", json={"model": "emb_words", "messages": [{"role": "user", "content": text}]})
+        first = ask("How do I reset my password?")
+        assert first.json()["choices"][0]["message"]["content"] == "answer to How do I reset my password?"
+        assert WordsProvider.embeds == 1
+        assert ask("How do I reset my password?").headers["x-lattice-cache"] == "hit"
+        assert WordsProvider.embeds == 1
+        assert ask("how can I reset the password please").headers["x-lattice-cache"] == "semantic-hit"
+        assert WordsProvider.embeds == 2
+    finally:
+        ResponseCache.clear()
+        ResponseCache.configure(ResponseCacheModel())
+
+
+def test_entries_expire_and_are_evicted_least_recently_used(semantic):
+    _ask(semantic, "reset password", agent='quick')
+    time.sleep(0.15)
+    assert _ask(semantic, "reset password", agent='quick') is None
+
+    for question in ("reset password", "refund policy", "delete account"):
+        _ask(semantic, question)
+    stats = semantic.stats()
+    assert stats["entries"] == 4 and stats["evictions"] == 1
+    assert _ask(semantic, "reset password") is None
+    assert _ask(semantic, "delete account").content == "answer to delete account"
+
+
+def test_only_single_questions_are_matched(semantic):
+    async def scenario():
+        return await semantic.prepare('local_llama', 'support', None, [
+            {'role': 'user', 'content': 'reset password'}, {'role': 'assistant', 'content': 'done'},
+            {'role': 'user', 'content': 'again'}])
+
+    assert asyncio.run(scenario()) is None
+    assert semantic.stats()["bypasses"] == 1
+
+
+def test_similarity_search_is_vectorized():
+    from latticepy.engine.services.responsecache import CachedReply
+    from latticepy.engine.services.semanticcache import Partition
+    rng = np.random.default_rng(7)
+    vectors = rng.standard_normal((4096, 384)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    partition = Partition(384, 4096)
+    now = time.time()
+    for i, vector in enumerate(vectors):
+        partition.insert(vector, str(i), CachedReply(str(i), "", {}), now + 60, now)
+    start = time.perf_counter()
+    for i in range(100):
+        row, similarity = partition.search(vectors[i], now)
+        assert row == i and similarity == pytest.approx(1.0, abs=1e-5)
+    assert (time.perf_counter() - start) / 100 < 0.01
@@ -0,0 +1,47 @@
+import pytest
+
+
+@pytest.fixture
+def tools(local_db, monkeypatch):
+    from latticepy.engine.interfaces.serverinterface import servertooldata, ToolDetails
+    offered = {"http://calc": [ToolDetails(name="add", description="Add two numbers", toolschema={}, details={})]}
+    monkeypatch.setattr(servertooldata, "_get_tools", classmethod(lambda cls, url: offered.get(url)))
+    monkeypatch.setattr(servertooldata, "TOOLDATA", {})
+    monkeypatch.setattr(servertooldata, "SERVER_TOOLS", {})
+    monkeypatch.setattr(servertooldata, "refreshed_at", None)
+    cur = local_db.connect()
+    cur.execute("INSERT INTO toolservers (id, url, details) VALUES ('calc', 'http://calc', '{}')")
+    cur.connection.commit()
+    yield servertooldata, offered
+
+
+def test_tool_lists_are_cached_and_survive_a_restart(tools, monkeypatch):
+    servertooldata, offered = tools
+    assert list(servertooldata().tooldata) == ["calc.add"]
+
+    # later constructions do not contact the servers
+    offered.clear()
+    assert list(servertooldata().tooldata) == ["calc.add"]
+
+    # a server that is down keeps its last known tools
+    servertooldata.refresh()
+    assert list(servertooldata().tooldata) == ["calc.add"]
+
+    monkeypatch.setattr(servertooldata, "TOOLDATA", {})
+    monkeypatch.setattr(servertooldata, "SERVER_TOOLS", {})
+    monkeypatch.setattr(servertooldata, "refreshed_at", None)
+    assert servertooldata.load_snapshot() == 1
+    assert servertooldata().server_tools["calc"][0]["name"] == "add"
+
+
+def test_bulk_imported_servers_are_served_at_once(tools):
+    import json
+    from fastapi.testclient import TestClient
+    from latticepy.engine.interfaces.serverinterface import ToolDetails
+    from latticepy.engine.services.webserver import app
+    servertooldata, offered = tools
+    assert list(servertooldata().tooldata) == ["calc.add"]
+    offered["http://web"] = [ToolDetails(name="fetch", description="Fetch a page", toolschema={}, details={})]
+    body = json.dumps({"id": "web", "url": "http://web", "details": {}}) + "\n"
+    assert TestClient(app).post("/api/lattice/bulk/toolservers", content=body).status_code == 200
+    assert sorted(servertooldata().tooldata) == ["calc.add", "web.fetch"]
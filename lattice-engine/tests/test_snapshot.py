@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+
+def test_snapshot_while_writing_and_restore(local_db, tmp_path):
+    from latticepy.engine.services.snapshot import create_snapshot, restore_snapshot
+
+    cur = local_db.connect()
+    cur.executemany("INSERT INTO prompts (id, prompt) VALUES (?, ?)", [(f"p{i}", "x" * 500) for i in range(500)])
+    cur.connection.commit()
+
+    stop = threading.Event()
+    written = []
+
+    def writer():
+        wcur = local_db.connect()
+        i = 0
+        while not stop.is_set():
+            wcur.execute("INSERT INTO prompts (id, prompt) VALUES (?, ?)", (f"w{i}", "y"))
+            wcur.connection.commit()
+            written.append(i)
+            i += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        info = create_snapshot(str(tmp_path / "snap.db"))
+    finally:
+        stop.set()
+        thread.join()
+
+    assert written, "writer was blocked for the whole snapshot"
+    assert info["schema_version"] >= 1
+    assert not (tmp_path / "snap.db.partial").exists()
+
+    replica = tmp_path / "replica" / "localdb"
+    restore_snapshot(info["path"], str(replica))
+    conn = sqlite3.connect(replica)
+    assert conn.execute("SELECT COUNT(*) FROM prompts WHERE id LIKE 'p%'").fetchone()[0] == 500
+    conn.close()
+
+    with pytest.raises(ValueError):
+        restore_snapshot(info["path"], str(replica))
+
+
+def test_snapshot_of_a_large_database_finishes_under_sustained_writes(local_db, tmp_path):
+    from latticepy.engine.services.snapshot import create_snapshot
+
+    cur = local_db.connect()
+    cur.executemany("INSERT INTO prompts (id, prompt) VALUES (?, ?)", [(f"p{i}", "x" * 2000) for i in range(20000)])
+    cur.connection.commit()
+
+    stop = threading.Event()
+    written = []
+
+    def writer():
+        wcur = local_db.connect()
+        i = 0
+        while not stop.is_set():
+            wcur.execute("INSERT INTO prompts (id, prompt) VALUES (?, ?)", (f"w{i}", "y"))
+            wcur.connection.commit()
+            written.append(i)
+            i += 1
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    time.sleep(0.05)
+    result = {}
+    snapshotter = threading.Thread(target=lambda: result.update(create_snapshot(str(tmp_path / "big.db"))))
+    snapshotter.start()
+    # a copy in steps restarts on every write and would only finish once the writer stops
+    snapshotter.join(20)
+    finished_while_writing = not snapshotter.is_alive()
+    stop.set()
+    thread.join()
+    snapshotter.join()
+    info = result
+
+    assert finished_while_writing
+    assert info["bytes"] > 40_000_000
+    assert written, "writer was blocked for the whole snapshot"
+    conn = sqlite3.connect(info["path"])
+    assert conn.execute("SELECT COUNT(*) FROM prompts WHERE id LIKE 'p%'").fetchone()[0] == 20000
+    conn.close()
+
+
+def test_restore_rejects_files_that_are_not_engine_databases(tmp_path):
+    from latticepy.engine.services.snapshot import restore_snapshot
+    other = tmp_path / "other.db"
+    sqlite3.connect(other).execute("CREATE TABLE t (x)").connection.commit()
+    with pytest.raises(ValueError):
+        restore_snapshot(str(other), str(tmp_path / "localdb"))
+    (tmp_path / "junk.db").write_bytes(b"not a database" * 100)
+    with pytest.raises(ValueError):
+        restore_snapshot(str(tmp_path / "junk.db"), str(tmp_path / "localdb"))
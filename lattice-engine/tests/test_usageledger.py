@@ -0,0 +1,75 @@
+import pytest
+
+
+@pytest.fixture
+def ledger(local_db):
+    from latticepy.engine.services.usageledger import UsageLedger, UsageModel
+    UsageLedger.configure(UsageModel(batch_size=3))
+    UsageLedger._queue.clear()
+    yield UsageLedger
+    UsageLedger._queue.clear()
+    UsageLedger.configure(UsageModel())
+
+
+def test_flush_writes_events_and_rollups(ledger, local_db):
+    for i in range(5):
+        ledger.record("helper", "llama", "alice", prompt_tokens=10, completion_tokens=5, latency_ms=100 + i)
+    ledger.record("helper", "mistral", "bob", prompt_tokens=1, completion_tokens=1, latency_ms=50, ok=False)
+    assert ledger.pending() == 6
+    assert local_db.connect().execute("SELECT COUNT(*) FROM usage_events").fetchone()[0] == 0
+
+    assert ledger.flush() == 6
+    assert ledger.pending() == 0
+    assert local_db.connect().execute("SELECT COUNT(*) FROM usage_events").fetchone()[0] == 6
+
+    rows = ledger.query("day", group_by=["model"])
+    assert [r["model"] for r in rows] == ["llama", "mistral"]
+    llama, mistral = rows
+    assert llama["requests"] == 5 and llama["prompt_tokens"] == 50 and llama["completion_tokens"] == 25
+    assert llama["latency_ms_avg"] == pytest.approx(102) and llama["latency_ms_max"] == 104
+    assert mistral["errors"] == 1
+
+    # rollups accumulate across flushes
+    ledger.record("helper", "llama", "alice", prompt_tokens=10)
+    ledger.flush()
+    assert ledger.query("hour", model="llama", group_by=[])[0]["requests"] == 6
+    assert ledger.query("hour", api_key="bob", group_by=["api_key"]) == [
+        {"api_key": "bob", "requests": 1, "errors": 1, "prompt_tokens": 1, "completion_tokens": 1,
+         "latency_ms_avg": 50.0, "latency_ms_max": 50.0}
+    ]
+
+
+def test_failed_flush_keeps_events_queued(ledger, local_db):
+    ledger.record("helper", "llama", "alice")
+    local_db.connect().execute("DROP TABLE usage_daily")
+    assert ledger.flush() == 0
+    assert ledger.pending() == 1
+
+
+def test_failed_flush_keeps_the_queue_bound(ledger, local_db, monkeypatch):
+    from latticepy.engine.services.usageledger import UsageModel
+    ledger.configure(UsageModel(batch_size=3, max_queue=3))
+    for i in range(3):
+        ledger.record("helper", "llama", f"old{i}")
+    take = ledger._take
+
+    def take_while_recording(limit):
+        batch = take(limit)
+        # requests keep arriving while the batch is being written
+        for i in range(3):
+            ledger.record("helper", "llama", f"new{i}")
+        return batch
+
+    monkeypatch.setattr(ledger, "_take", take_while_recording)
+    local_db.connect().execute("DROP TABLE usage_daily")
+    dropped = ledger.stats()["dropped"]
+    assert ledger.flush() == 0
+    assert [e.api_key for e in ledger._queue] == ["new0", "new1", "new2"]
+    assert ledger.stats()["dropped"] == dropped + 3
+
+
+def test_query_rejects_unknown_columns(ledger):
+    with pytest.raises(ValueError):
+        ledger.query("hour", group_by=["prompt; DROP TABLE usage_hourly"])
+    with pytest.raises(ValueError):
+        ledger.query("week")
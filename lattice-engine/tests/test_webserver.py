@@ -0,0 +1,325 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+
+@pytest.fixture
+def api(local_db):
+    from latticepy.engine.services.webserver import app
+    return app
+
+
+def test_slow_database_calls_do_not_block_the_event_loop(api, monkeypatch):
+    from latticepy.engine.interfaces.clientinterface import Promptlist
+
+    def slow_listdown():
+        time.sleep(0.5)
+        return []
+
+    monkeypatch.setattr(Promptlist, "listdown", slow_listdown)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=api)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            slow = asyncio.create_task(client.get("/api/lattice/prompts"))
+            await asyncio.sleep(0.05)
+            start = time.perf_counter()
+            res = await client.get("/api/lattice/version")
+            version_latency = time.perf_counter() - start
+            assert res.status_code == 200
+            assert (await slow).status_code == 200
+            return version_latency
+
+    assert asyncio.run(scenario()) < 0.2
+
+
+def _ndjson(*records):
+    import json
+    return "".join(json.dumps(r) + "\n" for r in records)
+
+
+def test_bulk_import_reports_rows_and_exports_round_trip(api):
+    from fastapi.testclient import TestClient
+    client = TestClient(api)
+    body = _ndjson(
+        {"id": "p1", "prompt": "first"},
+        {"id": "p2", "prompt": "second"},
+        {"id": "p1", "prompt": "duplicate in the file"},
+        {"id": "p3"},
+    )
+    res = client.post("/api/lattice/bulk/prompts", content=body)
+    assert res.status_code == 207
+    report = res.json()
+    assert report["received"] == 4 and report["written"] == 2 and report["failed"] == 2
+    assert [e["line"] for e in report["errors"]] == [3, 4]
+
+    # rows that already exist are reported unless skipped or replaced
+    again = client.post("/api/lattice/bulk/prompts", content=_ndjson({"id": "p2", "prompt": "new"}))
+    assert again.json()["errors"][0]["error"] == "already exists"
+    skipped = client.post("/api/lattice/bulk/prompts?on_conflict=skip", content=_ndjson({"id": "p2", "prompt": "new"}))
+    assert skipped.status_code == 200 and skipped.json()["skipped"] == 1
+
+    agents = _ndjson({"id": "helper", "prompt": "p1", "tools": [
+        {"type": "function", "function": {"name": "srv.lookup"}, "details": {"action": "pass"}}]})
+    assert client.post("/api/lattice/bulk/agents", content=agents).json()["written"] == 1
+    exported = client.get("/api/lattice/bulk/agents")
+    assert exported.headers["content-type"].startswith("application/x-ndjson")
+    import json
+    (agent,) = [json.loads(line) for line in exported.text.splitlines()]
+    assert agent["id"] == "helper" and agent["prompt"] == "first"
+    assert agent["tools"][0]["details"] == {"action": "pass"}
+
+
+def test_atomic_bulk_import_writes_nothing_on_error(api):
+    from fastapi.testclient import TestClient
+    client = TestClient(api)
+    res = client.post("/api/lattice/bulk/connections?atomic=true", content=_ndjson(
+        {"id": "c1", "source": "ollama", "url": "http://a", "api_key": None},
+        {"id": "c2", "source": "unknown", "url": "http://b", "api_key": None},
+    ))
+    assert res.json()["rolled_back"] is True
+    assert client.get("/api/lattice/bulk/connections").text == ""
+
+
+def test_usage_endpoint_reads_the_rollups(api):
+    from fastapi.testclient import TestClient
+    from latticepy.engine.services.usageledger import UsageLedger
+    UsageLedger._queue.clear()
+    UsageLedger.record("helper", "llama", "alice", prompt_tokens=3, completion_tokens=4, latency_ms=20)
+    UsageLedger.flush()
+    client = TestClient(api)
+    res = client.get("/api/lattice/usage", params={"period": "day", "group_by": "agent,api_key", "start": "2000-01-01T00:00:00Z"})
+    assert res.status_code == 200
+    assert res.json()["usage"] == [{"agent": "helper", "api_key": "alice", "requests": 1, "errors": 0, "prompt_tokens": 3,
+                                    "completion_tokens": 4, "latency_ms_avg": 20.0, "latency_ms_max": 20.0}]
+    assert client.get("/api/lattice/usage", params={"group_by": "secret"}).status_code == 400
+
+
+def test_lifespan_initializes_and_stops_background_tasks(api, monkeypatch):
+    from fastapi.testclient import TestClient
+    from latticepy.engine.interfaces.clientinterface import LLMmodels
+    from latticepy.engine.services.usageledger import UsageLedger
+    monkeypatch.setattr(LLMmodels, "refreshed_at", None)
+    UsageLedger._queue.clear()
+    with TestClient(api) as client:
+        assert client.get("/api/lattice/version").status_code == 200
+        UsageLedger.record("helper", "llama", "alice")
+    # the queued event was written on shutdown
+    assert UsageLedger.pending() == 0
+
+
+class SleepyProvider:
+    """
+    Answers every chat after a fixed delay, without blocking the event loop.
+    """
+    delay = 0.3
+    chats = 0
+    streams = 0
+    broken = False   # fail chats, and streams after their first piece
+
+    def __init__(self, connection, timeout):
+        pass
+
+    def list_models(self, timeout=None):
+        return [{'model': 'sleepy'}]
+
+    async def achat(self, model, messages, tools=None):
+        SleepyProvider.chats += 1
+        await asyncio.sleep(self.delay)
+        if self.broken:
+            raise ConnectionError("backend went away")
+        return f"echo {messages[-1]['content']}", []
+
+    async def astream(self, model, messages):
+        SleepyProvider.streams += 1
+        for word in ["echo", " ", messages[-1]['content']]:
+            await asyncio.sleep(self.delay / 3)
+            yield word
+            if self.broken:
+                raise ConnectionError("backend went away")
+
+    async def aclose(self):
+        pass
+
+
+@pytest.fixture
+def sleepy_model(api, monkeypatch):
+    from latticepy.engine.interfaces import llminterface
+    from latticepy.engine.interfaces.clientinterface import LLMmodels, Model, ConnectionModel
+    monkeypatch.setitem(llminterface.PROVIDERS, 'sleepy', SleepyProvider)
+    source = ConnectionModel(id='local', source='sleepy', url='http://sleepy', api_key=None)
+    monkeypatch.setattr(LLMmodels, 'MODELS', {'local_sleepy': Model(name='local_sleepy', model='sleepy', source=source, details={})})
+    monkeypatch.setattr(LLMmodels, 'refreshed_at', time.time())
+    yield 'local_sleepy'
+    llminterface.ClientPool.close_all()
+
+
+def test_concurrent_chats_are_not_serialized(api, sleepy_model, backend_limits):
+    from latticepy.engine.services.backendlimits import LimiterModel
+    backend_limits.configure(LimiterModel(initial_limit=8))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=api)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            start = time.perf_counter()
+            replies = await asyncio.gather(*[
+                client.post("/api/lattice/chat", json={"model": sleepy_model, "messages": [{"role": "user", "content": f"hi {i}"}]})
+                for i in range(8)
+            ])
+            return time.perf_counter() - start, replies
+
+    elapsed, replies = asyncio.run(scenario())
+    assert [r.json()["choices"][0]["message"]["content"] for r in replies] == [f"echo hi {i}" for i in range(8)]
+    # eight 0.3s generations in parallel, not one after another
+    assert elapsed < 1.2
+
+
+def test_chat_streams_openai_chunks_as_server_sent_events(api, sleepy_model):
+    import json
+    from fastapi.testclient import TestClient
+    res = TestClient(api).post("/api/lattice/chat", json={"model": sleepy_model, "stream": True, "messages": [{"role": "user", "content": "hi"}]})
+    assert res.headers["content-type"].startswith("text/event-stream")
+    events = [line[len("data: "):] for line in res.text.split("\n\n") if line]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(e) for e in events[:-1]]
+    assert {c["object"] for c in chunks} == {"chat.completion.chunk"}
+    assert chunks[0]["choices"][0]["delta"] == {"role": "assistant"}
+    assert "".join(c["choices"][0]["delta"].get("content", "") for c in chunks) == "echo hi"
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop" and chunks[-1]["usage"]["completion_tokens"] == 2
+
+    ndjson = TestClient(api).post("/api/lattice/chat", headers={"Accept": "application/x-ndjson"},
+                                  json={"model": sleepy_model, "stream": True, "messages": [{"role": "user", "content": "hi"}]})
+    lines = [json.loads(line) for line in ndjson.text.splitlines()]
+    assert lines[-1]["choices"][0]["finish_reason"] == "stop"
+
+
+def test_first_token_arrives_before_the_generation_ends(api, sleepy_model):
+    from latticepy.engine.services.webserver import ChatRequest, stream_chat
+
+    async def scenario():
+        request = ChatRequest(model=sleepy_model, stream=True, messages=[{"role": "user", "content": "hi"}])
+        start = time.perf_counter()
+        arrivals = []
+        async for frame in stream_chat(request, "", "chatcmpl-test", ndjson=True):
+            if '"content"' in frame:
+                arrivals.append(time.perf_counter() - start)
+        return arrivals
+
+    arrivals = asyncio.run(scenario())
+    assert len(arrivals) == 3
+    assert arrivals[0] < arrivals[-1] - 0.1
+
+
+def test_repeated_chats_are_answered_from_the_response_cache(api, sleepy_model):
+    from fastapi.testclient import TestClient
+    from latticepy.engine.services.responsecache import ResponseCache, ResponseCacheModel
+    ResponseCache.configure(ResponseCacheModel(enabled=True))
+    ResponseCache.reset_stats()
+    try:
+        client = TestClient(api)
+        body = {"model": sleepy_model, "messages": [{"role": "user", "content": "status?"}]}
+        SleepyProvider.chats = 0
+        first = client.post("/api/lattice/chat", json=body)
+        second = client.post("/api/lattice/chat", json=body)
+        assert (first.headers["X-Lattice-Cache"], second.headers["X-Lattice-Cache"]) == ("miss", "hit")
+        assert second.json()["choices"][0]["message"]["content"] == "echo status?"
+        assert SleepyProvider.chats == 1
+        fresh = client.post("/api/lattice/chat", json=body, headers={"Cache-Control": "no-cache"})
+        assert fresh.headers["X-Lattice-Cache"] == "bypass" and SleepyProvider.chats == 2
+        stats = client.get("/api/lattice/admin/cache/responses").json()
+        assert (stats["hits"], stats["misses"], stats["bypasses"]) == (1, 1, 1)
+    finally:
+        ResponseCache.configure(ResponseCacheModel())
+
+
+def test_identical_concurrent_chats_share_one_generation(api, sleepy_model):
+    import json
+    from latticepy.engine.services.coalescer import RequestCoalescer
+    RequestCoalescer.reset_stats()
+    SleepyProvider.chats = SleepyProvider.streams = 0
+    body = {"model": sleepy_model, "messages": [{"role": "user", "content": "dashboard"}]}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=api)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            replies = await asyncio.gather(*[client.post("/api/lattice/chat", json=body) for _ in range(6)])
+            streams = await asyncio.gather(*[client.post("/api/lattice/chat", json={**body, "stream": True}) for _ in range(4)])
+            return replies, streams
+
+    replies, streams = asyncio.run(scenario())
+    assert {r.json()["choices"][0]["message"]["content"] for r in replies} == {"echo dashboard"}
+    assert sorted(r.headers["X-Lattice-Coalesced"] for r in replies) == ["false"] + ["true"] * 5
+    for res in streams:
+        chunks = [json.loads(e[len("data: "):]) for e in res.text.split("\n\n") if e and e != "data: [DONE]"]
+        assert "".join(c["choices"][0]["delta"].get("content", "") for c in chunks) == "echo dashboard"
+    assert (SleepyProvider.chats, SleepyProvider.streams) == (1, 1)
+    stats = RequestCoalescer.stats()
+    assert (stats["executions"], stats["coalesced"], stats["stream_executions"], stats["stream_coalesced"]) == (1, 5, 1, 3)
+
+
+def test_requests_of_different_classes_do_not_share_a_generation(api, sleepy_model):
+    from latticepy.engine.services.coalescer import RequestCoalescer
+    RequestCoalescer.reset_stats()
+    SleepyProvider.chats = 0
+    body = {"model": sleepy_model, "messages": [{"role": "user", "content": "dashboard"}]}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=api)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*[
+                client.post("/api/lattice/chat", json=body, headers={"X-Lattice-Priority": priority})
+                for priority in ("batch", "interactive", "batch", "interactive")
+            ])
+
+    replies = asyncio.run(scenario())
+    assert {r.json()["choices"][0]["message"]["content"] for r in replies} == {"echo dashboard"}
+    assert SleepyProvider.chats == 2
+    stats = RequestCoalescer.stats()
+    assert (stats["executions"], stats["coalesced"]) == (2, 2)
+
+
+def test_late_stream_subscribers_replay_from_the_start():
+    from latticepy.engine.services.coalescer import RequestCoalescer
+
+    async def words():
+        for word in ["a", "b", "c"]:
+            await asyncio.sleep(0.02)
+            yield word
+
+    async def scenario():
+        first, shared_first = RequestCoalescer.stream("k", words)
+        early = [await first.__anext__()]
+        late, shared_late = RequestCoalescer.stream("k", words)
+        early += [piece async for piece in first]
+        return shared_first, shared_late, early, [piece async for piece in late]
+
+    assert asyncio.run(scenario()) == (False, True, ["a", "b", "c"], ["a", "b", "c"])
+
+
+def test_failed_chats_are_answered_but_recorded_as_errors(api, sleepy_model, monkeypatch):
+    from fastapi.testclient import TestClient
+    from latticepy.engine.services.usageledger import UsageLedger
+    monkeypatch.setattr(SleepyProvider, "broken", True)
+    UsageLedger._queue.clear()
+    res = TestClient(api).post("/api/lattice/chat", json={"model": sleepy_model, "messages": [{"role": "user", "content": "hi"}]})
+    assert res.status_code == 200
+    assert "Unable to reply" in res.json()["choices"][0]["message"]["content"]
+    assert [e.ok for e in UsageLedger._queue] == [False]
+
+
+def test_streams_that_break_off_end_with_an_error(api, sleepy_model, monkeypatch):
+    import json
+    from fastapi.testclient import TestClient
+    from latticepy.engine.services.usageledger import UsageLedger
+    monkeypatch.setattr(SleepyProvider, "broken", True)
+    UsageLedger._queue.clear()
+    res = TestClient(api).post("/api/lattice/chat", json={"model": sleepy_model, "stream": True, "messages": [{"role": "user", "content": "hi"}]})
+    events = [line[len("data: "):] for line in res.text.split("\n\n") if line]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(e) for e in events[:-1]]
+    assert "".join(c["choices"][0]["delta"].get("content", "") for c in chunks) == "echo"
+    assert chunks[-1]["choices"][0]["finish_reason"] == "error"
+    assert "Unable to reply" in chunks[-1]["error"]["message"]
+    assert [e.ok for e in UsageLedger._queue] == [False]